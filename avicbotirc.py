@@ -9,7 +9,8 @@ tool links, and fun interactive responses.
 Architecture:
     - Uses Python's asyncio for non-blocking network I/O
     - IRCBot class encapsulates all bot functionality
-    - Commands are handled via a dispatcher pattern
+    - Commands are registered with the @command decorator and dispatched
+      through a CommandRegistry
     - Configuration is loaded from environment variables with sensible defaults
 
 Author: Léon "Avic" Simmons (Avicennasis)
@@ -20,27 +21,234 @@ Original Version: 2015
 Updated: January 2026
 """
 
+import argparse
 import asyncio
+import base64
+import bisect
+import contextvars
+import fnmatch
+import importlib.util
+import itertools
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.connection
 import os
+import queue
+import random
 import re
+import signal
+import socket
+import sqlite3
+import ssl
+import struct
+import subprocess
 import sys
-from dataclasses import dataclass, field
-from typing import Optional
+import tempfile
+import threading
+import time
+import types
+import urllib.parse
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Awaitable, Callable, Container, Coroutine, Iterable, Iterator, Optional
+
+# resource is Unix-only; it is only used for worker memory statistics
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# uvloop is optional; when installed it replaces the asyncio event loop
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # =============================================================================
 # LOGGING CONFIGURATION
 # =============================================================================
 # Set up logging to provide visibility into bot operations.
-# Log level can be adjusted via the LOG_LEVEL environment variable.
+#
+# Records are handed to a QueueHandler and written by a QueueListener on a
+# background thread, so a slow terminal or disk never stalls the event
+# loop. Nothing is configured at import time; main() calls setup_logging(),
+# which reads:
+#     - LOG_LEVEL: Level name for the bot's own messages (default: INFO)
+#     - AVICBOT_LOG_FORMAT: "text" (default) or "json", one object per line
+#     - AVICBOT_LOG_FILE: Also write the log to this size-rotated file
+#     - AVICBOT_TRAFFIC_LOG: Write every raw line sent and received to this
+#       size-rotated file
+#     - AVICBOT_LOG_MAX_BYTES: Rotation size for both files (default: 10 MiB)
+#     - AVICBOT_LOG_BACKUPS: Rotated files to keep (default: 5)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
 logger = logging.getLogger("AvicBot")
 
+# Raw protocol lines (">>> " sent, "<<< " received) are logged at DEBUG on
+# this logger, one child per network, so they can go to their own file
+traffic_logger = logging.getLogger("AvicBot.traffic")
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as single-line JSON objects for log shippers.
+    
+    Example output:
+        {"time": "2026-01-15T12:00:00", "level": "INFO", "logger": "AvicBot", "message": "Connected"}
+    """
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _ThreadQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+    
+    The stock prepare() formats every record in the logging thread so it
+    can be pickled; our queue never leaves the process, so the record is
+    passed through untouched and %-style arguments are only merged on the
+    listener thread, if a handler wants the record at all.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None) -> logging.handlers.QueueListener:
+    """
+    Install the queue-based logging pipeline, replacing any earlier one.
+    
+    Safe to call again; the previous listener is stopped first.
+    
+    Args:
+        level: Level name for the bot's loggers (default: $LOG_LEVEL or INFO)
+    
+    Returns:
+        The running QueueListener; stop() it to flush on exit
+    """
+    global _log_listener
+    if _log_listener is not None:
+        try:
+            _log_listener.stop()
+        except (AttributeError, RuntimeError):
+            pass  # Inherited from a parent process, thread already gone
+    
+    formatter: logging.Formatter
+    if os.getenv("AVICBOT_LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
+    max_bytes = int(os.getenv("AVICBOT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    backups = int(os.getenv("AVICBOT_LOG_BACKUPS", "5"))
+    
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    log_file = os.getenv("AVICBOT_LOG_FILE")
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Raw traffic goes to its own file, never to the console
+    traffic_file = os.getenv("AVICBOT_TRAFFIC_LOG")
+    if traffic_file:
+        traffic_handler = logging.handlers.RotatingFileHandler(
+            traffic_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8",
+        )
+        traffic_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s", LOG_DATE_FORMAT))
+        traffic_handler.addFilter(lambda record: record.name.startswith(traffic_logger.name))
+        handlers.append(traffic_handler)
+        for handler in handlers[:-1]:
+            handler.addFilter(lambda record: not record.name.startswith(traffic_logger.name))
+        traffic_logger.setLevel(logging.DEBUG)
+    else:
+        traffic_logger.setLevel(logging.NOTSET)
+    
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _ThreadQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(_ThreadQueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    set_log_level(level or os.getenv("LOG_LEVEL", "INFO"))
+    
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    return _log_listener
+
+
+def setup_worker_logging(log_queue: Any) -> None:
+    """
+    Send this process's log records to a parent process.
+    
+    Used by supervisor workers: records go over a multiprocessing queue
+    and the supervisor writes them with its own handlers, so there is one
+    writer per log file however many workers run.
+    
+    Args:
+        log_queue: A multiprocessing.Queue read by the supervisor
+    """
+    global _log_listener
+    # A listener inherited over fork has no thread in this process
+    _log_listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    set_log_level(os.getenv("LOG_LEVEL", "INFO"))
+    if os.getenv("AVICBOT_TRAFFIC_LOG"):
+        traffic_logger.setLevel(logging.DEBUG)
+
+
+class _LogForwarder(logging.Handler):
+    """Re-log records received from worker processes in this process."""
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+def set_log_level(level: str) -> None:
+    """
+    Change the bot's log level at runtime.
+    
+    Args:
+        level: A level name such as "DEBUG" or "WARNING"
+    
+    Raises:
+        ValueError: If level is not a known level name
+    """
+    numeric = logging.getLevelName(level.upper())
+    if not isinstance(numeric, int):
+        raise ValueError(f"Unknown log level: {level}")
+    logger.setLevel(numeric)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
 
 # =============================================================================
 # BOT CONFIGURATION
@@ -48,42 +256,303 @@ logger = logging.getLogger("AvicBot")
 # Configuration is loaded from environment variables with fallback defaults.
 # This allows deployment flexibility without code changes.
 
+# IRCv3 capabilities requested during registration, if the server offers them
+DEFAULT_CAPS = (
+    "multi-prefix", "message-tags", "server-time", "away-notify",
+    # Services accounts, which is how the owner is recognized
+    "account-tag", "extended-join", "account-notify",
+)
+
+
 @dataclass
 class BotConfig:
     """
     Bot configuration data class.
     
-    All settings can be overridden via environment variables:
+    All settings can be overridden via environment variables, or per
+    network in a JSON config file (see load_network_configs):
         - AVICBOT_NICK: Bot's IRC nickname
         - AVICBOT_SERVER: IRC server hostname
         - AVICBOT_PORT: IRC server port (default: 6667)
-        - AVICBOT_CHANNELS: Comma-separated list of channels to join
+        - AVICBOT_CHANNELS: Comma-separated list of channels to join; a
+          keyed channel is given as "#channel key"
         - AVICBOT_MASTER: Bot owner's nickname (receives notifications)
+        - AVICBOT_MASTER_ACCOUNT: Owner's services account, which owner-only
+          commands require (default: the owner's nickname)
+        - AVICBOT_MASTER_MASKS: Comma-separated nick!user@host masks whose
+          users are also treated as the owner, e.g. on networks without
+          services
         - AVICBOT_USERNAME: IRC username
         - AVICBOT_REALNAME: IRC "real name" field
-        - AVICBOT_PASSWORD: NickServ password (optional)
+        - AVICBOT_PASSWORD: NickServ password (optional), also used for
+          SASL PLAIN
+        - AVICBOT_ACCOUNT: Services account to log in to (default: the nick)
+        - AVICBOT_SASL: "auto" (default), "plain", "external" or "off"
+        - AVICBOT_CAPS: Comma-separated IRCv3 capabilities to request
+        - AVICBOT_TLS: Connect with TLS ("1" to enable)
+        - AVICBOT_TLS_VERIFY: Verify the server's certificate ("0" to skip)
+        - AVICBOT_TLS_CERT: PEM client certificate and key, for CertFP and
+          SASL EXTERNAL
         - AVICBOT_BUFFER_SIZE: Socket buffer size in bytes
+        - AVICBOT_MAX_LINE_LENGTH: Longest inbound line accepted, in bytes
+        - AVICBOT_MAX_HANDLERS: Command handlers allowed to run at once
+        - AVICBOT_HANDLER_TIMEOUT: Seconds before a command handler is cancelled
+        - AVICBOT_SEND_RATE: Sustained outbound lines per second
+        - AVICBOT_SEND_BURST: Outbound lines that may be sent back to back
+        - AVICBOT_FALLBACK_SERVERS: Comma-separated host[:port] list tried
+          when the main server is unreachable
+        - AVICBOT_CONNECT_TIMEOUT: Seconds allowed for each connection attempt
+        - AVICBOT_RECONNECT_DELAY: Initial reconnect backoff in seconds
+        - AVICBOT_RECONNECT_MAX_DELAY: Longest reconnect backoff in seconds
+        - AVICBOT_PING_INTERVAL: Seconds of server silence before we PING it
+        - AVICBOT_JOIN_RATE: Channels joined per second, sustained (0: no pacing)
+        - AVICBOT_JOIN_BURST: Channels that may be joined at once
+        - AVICBOT_JOIN_RETRY_DELAY: Seconds before a refused channel is
+          tried again (doubling with each refusal)
+        - AVICBOT_JOIN_RETRY_MAX_DELAY: Longest wait between join retries
+        - AVICBOT_METRICS_PORT: Serve Prometheus metrics on this port (0: off)
+        - AVICBOT_METRICS_HOST: Interface for the metrics listener
+        - AVICBOT_TRANSPORT: "protocol" (default) or "streams"
+        - AVICBOT_NICK_RATE_LIMIT: Commands per window for one nick (0: off)
+        - AVICBOT_HOST_RATE_LIMIT: Commands per window for one host (0: off)
+        - AVICBOT_CHANNEL_RATE_LIMIT: Commands per window for one channel (0: off)
+        - AVICBOT_RATE_LIMIT_WINDOW: Rate-limit window in seconds
+        - AVICBOT_RATE_LIMIT_KEYS: Nicks/hosts/channels tracked per limit
+        - AVICBOT_COALESCE_WINDOW: Seconds during which a repeated command
+          is dropped (0: off)
+        - AVICBOT_SEEN_DB: SQLite file for the !seen index (empty: off)
+        - AVICBOT_NOTIFY_INTERVAL: Seconds between owner digests (0: send at once)
+        - AVICBOT_NOTIFY_MAX_ENTRIES: Distinct notifications per digest
+        - AVICBOT_TRIGGERS: JSON file of conversational trigger rules
+          (empty: the built-in replies)
+        - AVICBOT_WIKI_API: MediaWiki api.php URL used to add account
+          summaries to !guc and !cauth (empty: off)
+        - AVICBOT_WIKI_CACHE_TTL: Seconds account summaries are cached
     
     Attributes:
+        name: Network name used in logs (empty for a single network)
         nick: The bot's IRC nickname displayed to other users
         server: IRC server hostname to connect to
         port: IRC server port number
-        channels: List of channels to auto-join on connect
+        channels: List of channels to auto-join on connect, each "#channel"
+            or "#channel key"
         master: Owner's nickname who receives admin notifications
+        master_account: Services account the owner must be logged in to
+            for owner-only commands; empty uses master. The nick alone is
+            never trusted, since anyone can take it while the owner is away
+        master_masks: nick!user@host glob patterns (case-insensitive) that
+            are also accepted as the owner
         username: IRC username (ident)
         realname: "Real name" shown in WHOIS queries
-        password: Optional NickServ password for authentication
+        password: Optional NickServ password for authentication; sent
+            with SASL PLAIN when the server supports it
+        account: Services account name; empty logs in as the nick
+        sasl: SASL mechanism choice: "plain", "external", "off", or "auto"
+            for EXTERNAL with a client certificate, else PLAIN with a password
+        caps: IRCv3 capabilities requested when the server offers them
+        tls: Connect with TLS (the port is usually 6697)
+        tls_verify: Check the server's certificate and hostname
+        tls_cert: PEM file with a client certificate and its key; empty
+            connects without one
         buffer_size: Size of the network receive buffer in bytes
+        max_line_length: Longest inbound line accepted before it is discarded
+        max_handlers: Maximum number of message handlers running concurrently
+        handler_timeout: Seconds a single handler may run before it is cancelled
+        send_rate: Token-bucket refill rate for outbound lines, per second;
+            0 sends every line as soon as it is queued
+        send_burst: Token-bucket size, i.e. lines that may be sent in a burst
+        fallback_servers: Extra "host[:port]" servers to try in order
+        connect_timeout: Seconds allowed for each connection attempt
+        reconnect_delay: Backoff before the first reconnect attempt
+        reconnect_max_delay: Upper bound for the exponential backoff
+        ping_interval: Idle seconds before a keepalive PING; twice this
+            without any data and the connection is considered dead
+        join_rate: Channels joined per second once join_burst is spent;
+            0 joins everything at once
+        join_burst: Channels that may be joined back to back
+        join_retry_delay: Backoff before retrying a channel the server
+            refused (full, invite-only, banned, wrong key, ...)
+        join_retry_max_delay: Upper bound for the join retry backoff
+        shards: With --workers, split this network's channels over this
+            many connections (config file only)
+        metrics_port: Port for the Prometheus metrics endpoint; 0 disables
+            metrics collection entirely
+        metrics_host: Interface the metrics endpoint listens on
+        transport: "protocol" to read through IRCProtocol, or "streams"
+            for asyncio.open_connection with a StreamLineReader
+        nick_rate_limit: Commands one nick may run per rate_limit_window;
+            0 disables the limit
+        host_rate_limit: Commands one host may run per rate_limit_window,
+            across all of its nicks; 0 disables the limit
+        channel_rate_limit: Commands one channel may run per
+            rate_limit_window; 0 disables the limit
+        rate_limit_window: Length of the sliding rate-limit window in seconds
+        rate_limit_keys: Most nicks, hosts or channels each limit remembers;
+            the least recently seen are forgotten first
+        coalesce_window: Seconds after a command during which the same
+            command with the same arguments, in the same place, is
+            dropped; 0 answers every repeat
+        seen_db: SQLite database for the !seen index, shared by all
+            networks; empty disables it
+        notify_interval: Seconds between digests of owner notifications;
+            0 sends each notification immediately
+        notify_max_entries: Distinct notifications that make a digest go
+            out before its interval is up
+        triggers_file: JSON file of trigger rules (see load_trigger_rules);
+            empty uses CONVERSATIONAL_REPLIES
+        wiki_api: MediaWiki api.php URL for !guc and !cauth account
+            summaries, e.g. https://meta.wikimedia.org/w/api.php; empty
+            replies with the link alone
+        wiki_cache_ttl: Seconds an account summary is reused before it is
+            fetched again
     """
+    name: str = ""
     nick: str = field(default_factory=lambda: os.getenv("AVICBOT_NICK", "AvicBot"))
     server: str = field(default_factory=lambda: os.getenv("AVICBOT_SERVER", "irc.libera.chat"))
     port: int = field(default_factory=lambda: int(os.getenv("AVICBOT_PORT", "6667")))
     channels: list[str] = field(default_factory=lambda: os.getenv("AVICBOT_CHANNELS", "#avicbot").split(","))
     master: str = field(default_factory=lambda: os.getenv("AVICBOT_MASTER", "Avicennasis"))
+    master_account: str = field(default_factory=lambda: os.getenv("AVICBOT_MASTER_ACCOUNT", ""))
+    master_masks: list[str] = field(default_factory=lambda: [
+        mask.strip() for mask in os.getenv("AVICBOT_MASTER_MASKS", "").split(",") if mask.strip()
+    ])
     username: str = field(default_factory=lambda: os.getenv("AVICBOT_USERNAME", "AvicBot"))
     realname: str = field(default_factory=lambda: os.getenv("AVICBOT_REALNAME", "Avicennasis"))
     password: Optional[str] = field(default_factory=lambda: os.getenv("AVICBOT_PASSWORD"))
+    account: str = field(default_factory=lambda: os.getenv("AVICBOT_ACCOUNT", ""))
+    sasl: str = field(default_factory=lambda: os.getenv("AVICBOT_SASL", "auto"))
+    caps: list[str] = field(default_factory=lambda: [
+        cap.strip() for cap in os.getenv("AVICBOT_CAPS", ",".join(DEFAULT_CAPS)).split(",") if cap.strip()
+    ])
+    tls: bool = field(default_factory=lambda: os.getenv("AVICBOT_TLS", "0") not in ("", "0"))
+    tls_verify: bool = field(default_factory=lambda: os.getenv("AVICBOT_TLS_VERIFY", "1") not in ("", "0"))
+    tls_cert: str = field(default_factory=lambda: os.getenv("AVICBOT_TLS_CERT", ""))
     buffer_size: int = field(default_factory=lambda: int(os.getenv("AVICBOT_BUFFER_SIZE", "10240")))
+    max_line_length: int = field(default_factory=lambda: int(os.getenv("AVICBOT_MAX_LINE_LENGTH", "8703")))
+    max_handlers: int = field(default_factory=lambda: int(os.getenv("AVICBOT_MAX_HANDLERS", "16")))
+    handler_timeout: float = field(default_factory=lambda: float(os.getenv("AVICBOT_HANDLER_TIMEOUT", "30")))
+    send_rate: float = field(default_factory=lambda: float(os.getenv("AVICBOT_SEND_RATE", "2")))
+    send_burst: int = field(default_factory=lambda: int(os.getenv("AVICBOT_SEND_BURST", "10")))
+    fallback_servers: list[str] = field(default_factory=lambda: [
+        s.strip() for s in os.getenv("AVICBOT_FALLBACK_SERVERS", "").split(",") if s.strip()
+    ])
+    connect_timeout: float = field(default_factory=lambda: float(os.getenv("AVICBOT_CONNECT_TIMEOUT", "15")))
+    reconnect_delay: float = field(default_factory=lambda: float(os.getenv("AVICBOT_RECONNECT_DELAY", "2")))
+    reconnect_max_delay: float = field(default_factory=lambda: float(os.getenv("AVICBOT_RECONNECT_MAX_DELAY", "300")))
+    ping_interval: float = field(default_factory=lambda: float(os.getenv("AVICBOT_PING_INTERVAL", "120")))
+    join_rate: float = field(default_factory=lambda: float(os.getenv("AVICBOT_JOIN_RATE", "2")))
+    join_burst: int = field(default_factory=lambda: int(os.getenv("AVICBOT_JOIN_BURST", "20")))
+    join_retry_delay: float = field(default_factory=lambda: float(os.getenv("AVICBOT_JOIN_RETRY_DELAY", "60")))
+    join_retry_max_delay: float = field(
+        default_factory=lambda: float(os.getenv("AVICBOT_JOIN_RETRY_MAX_DELAY", "3600"))
+    )
+    shards: int = 1
+    metrics_port: int = field(default_factory=lambda: int(os.getenv("AVICBOT_METRICS_PORT", "0")))
+    metrics_host: str = field(default_factory=lambda: os.getenv("AVICBOT_METRICS_HOST", "127.0.0.1"))
+    transport: str = field(default_factory=lambda: os.getenv("AVICBOT_TRANSPORT", "protocol"))
+    nick_rate_limit: int = field(default_factory=lambda: int(os.getenv("AVICBOT_NICK_RATE_LIMIT", "5")))
+    host_rate_limit: int = field(default_factory=lambda: int(os.getenv("AVICBOT_HOST_RATE_LIMIT", "8")))
+    channel_rate_limit: int = field(default_factory=lambda: int(os.getenv("AVICBOT_CHANNEL_RATE_LIMIT", "20")))
+    rate_limit_window: float = field(default_factory=lambda: float(os.getenv("AVICBOT_RATE_LIMIT_WINDOW", "30")))
+    rate_limit_keys: int = field(default_factory=lambda: int(os.getenv("AVICBOT_RATE_LIMIT_KEYS", "4096")))
+    coalesce_window: float = field(default_factory=lambda: float(os.getenv("AVICBOT_COALESCE_WINDOW", "2")))
+    seen_db: str = field(default_factory=lambda: os.getenv("AVICBOT_SEEN_DB", "avicbot_seen.db"))
+    notify_interval: float = field(default_factory=lambda: float(os.getenv("AVICBOT_NOTIFY_INTERVAL", "300")))
+    notify_max_entries: int = field(default_factory=lambda: int(os.getenv("AVICBOT_NOTIFY_MAX_ENTRIES", "20")))
+    triggers_file: str = field(default_factory=lambda: os.getenv("AVICBOT_TRIGGERS", ""))
+    wiki_api: str = field(default_factory=lambda: os.getenv("AVICBOT_WIKI_API", ""))
+    wiki_cache_ttl: float = field(default_factory=lambda: float(os.getenv("AVICBOT_WIKI_CACHE_TTL", "300")))
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "BotConfig":
+        """
+        Build a config from a dictionary, e.g. one network in a config file.
+        
+        Options missing from the dictionary keep their environment or
+        built-in defaults. "channels", "fallback_servers", "caps" and
+        "master_masks" may be given either as a list or as a
+        comma-separated string.
+        
+        Args:
+            data: Mapping of BotConfig field names to values
+        
+        Returns:
+            A new BotConfig
+        
+        Raises:
+            ValueError: If the dictionary contains an unknown option
+        """
+        known = {f.name for f in fields(cls)}
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise ValueError(f"Unknown config option(s): {', '.join(unknown)}")
+        
+        config = cls()
+        for key, value in data.items():
+            if key in ("channels", "fallback_servers", "caps", "master_masks") and isinstance(value, str):
+                value = [item.strip() for item in value.split(",") if item.strip()]
+            setattr(config, key, value)
+        return config
+    
+    def server_addresses(self) -> list[tuple[str, int]]:
+        """
+        List the servers to try, main server first.
+        
+        Returns:
+            (host, port) pairs; fallback entries without a port use self.port
+        """
+        addresses = [(self.server, self.port)]
+        for entry in self.fallback_servers:
+            host, _, port = entry.rpartition(":") if entry.count(":") == 1 else (entry, "", "")
+            addresses.append((host, int(port)) if port else (entry, self.port))
+        return addresses
+
+
+def load_network_configs(path: str) -> list[BotConfig]:
+    """
+    Load one BotConfig per network from a JSON config file.
+    
+    The file holds optional shared "defaults" and a list of "networks";
+    each network's options override the defaults, which in turn override
+    the environment:
+        
+        {
+            "defaults": {"nick": "AvicBot", "master": "Avicennasis"},
+            "networks": [
+                {"name": "libera", "server": "irc.libera.chat",
+                 "channels": ["#avicbot", "#wikipedia-en"]},
+                {"name": "oftc", "server": "irc.oftc.net", "channels": "#avicbot"}
+            ]
+        }
+    
+    Args:
+        path: Path to the JSON file
+    
+    Returns:
+        One BotConfig per network, in file order
+    
+    Raises:
+        ValueError: If the file is malformed or network names repeat
+        OSError: If the file cannot be read
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a JSON object")
+    
+    defaults = data.get("defaults", {})
+    networks = data.get("networks") or [{}]
+    configs = []
+    for network in networks:
+        config = BotConfig.from_dict({**defaults, **network})
+        config.name = config.name or config.server
+        configs.append(config)
+    
+    names = [config.name for config in configs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"{path}: duplicate network name(s): {', '.join(duplicates)}")
+    return configs
 
 
 # =============================================================================
@@ -399,6 +868,8 @@ LANGUAGE_CODES: dict[str, str] = {
 # =============================================================================
 # Dictionary mapping trigger words to bot responses.
 # When a user addresses the bot with one of these words, it responds accordingly.
+# These are the built-in trigger rules (see TRIGGER RULES), used unless a
+# rules file is configured.
 
 CONVERSATIONAL_REPLIES: dict[str, str] = {
     "die": "No, you",
@@ -410,468 +881,6160 @@ CONVERSATIONAL_REPLIES: dict[str, str] = {
     "hello": "Hi",
     "howdy": "Hi",
     "time": "It is TIME for a RHYME",
-    "master": "",  # Will be set dynamically with bot master's name
+    "master": "{master} is my master",
 }
 
 
 # =============================================================================
-# IRC BOT CLASS
+# LANGUAGE INDEX
 # =============================================================================
+# Search structures built once over LANGUAGE_CODES: a sorted code list for
+# prefix queries, a reverse name-to-code map, and deletion-neighbourhood
+# indexes over codes and names for bounded edit-distance ("did you mean")
+# suggestions.
 
-class IRCBot:
+def _deletions(word: str, depth: int) -> set[str]:
+    """Every string obtainable from word by deleting up to depth characters."""
+    variants = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
     """
-    Asynchronous IRC Bot implementation.
-    
-    This class encapsulates all IRC bot functionality including connection management,
-    message parsing, and command handling. It uses Python's asyncio for non-blocking
-    network operations, allowing the bot to handle multiple messages efficiently.
-    
-    Features:
-        - Automatic reconnection on connection loss
-        - NickServ authentication support
-        - Command-based message handling
-        - Conversational reply triggers
-        - Language code lookups
-        - Wikimedia tool integration
+    Levenshtein distance between a and b, giving up past a limit.
     
-    Example:
-        >>> config = BotConfig()
-        >>> bot = IRCBot(config)
-        >>> asyncio.run(bot.run())
+    Returns:
+        The distance, or limit + 1 if it is larger than limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    above = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i]
+        for j, cb in enumerate(b, 1):
+            row.append(min(row[j - 1] + 1, above[j] + 1, above[j - 1] + (ca != cb)))
+        if min(row) > limit:
+            return limit + 1
+        above = row
+    return above[-1]
+
+
+class _FuzzyIndex:
+    """
+    Bounded edit-distance search using a deletion neighbourhood index.
     
-    Attributes:
-        config: BotConfig instance containing bot settings
-        reader: asyncio StreamReader for receiving data
-        writer: asyncio StreamWriter for sending data
-        running: Boolean flag indicating if bot is running
-        replies: Dictionary of conversational trigger words and responses
+    Every key is stored under each string reachable from it by deleting up
+    to max_distance characters. Any key within max_distance edits of a query
+    shares at least one such variant with it, so a search only generates the
+    query's own deletions, collects the keys stored under them, and verifies
+    that small candidate set with an exact distance check.
     """
     
-    def __init__(self, config: BotConfig) -> None:
+    def __init__(self, items: Iterable[tuple[str, str]], max_distance: int = 2) -> None:
         """
-        Initialize the IRC bot with the given configuration.
+        Build the index.
         
         Args:
-            config: BotConfig instance containing all bot settings
+            items: (key, value) pairs; keys are matched, values returned
+            max_distance: Largest edit distance searches may ask for
         """
-        self.config = config
-        self.reader: Optional[asyncio.StreamReader] = None
-        self.writer: Optional[asyncio.StreamWriter] = None
-        self.running: bool = False
-        
-        # Set up the conversational replies with dynamic master name
-        self.replies = CONVERSATIONAL_REPLIES.copy()
-        self.replies["master"] = f"{self.config.master} is my master"
+        self.max_distance = max_distance
+        self._values: dict[str, str] = {}
+        self._variants: dict[str, list[str]] = {}
+        for key, value in items:
+            self._values[key] = value
+            for variant in _deletions(key, max_distance):
+                self._variants.setdefault(variant, []).append(key)
     
-    async def connect(self) -> None:
+    def search(self, word: str, max_distance: int) -> list[tuple[int, str]]:
         """
-        Establish a connection to the IRC server.
+        Find every key within max_distance edits of word.
         
-        This method opens an async TCP connection to the configured IRC server
-        and port. Upon successful connection, it sends the required IRC
-        registration commands (USER and NICK) to identify the bot.
+        Args:
+            word: The (misspelled) key to search for
+            max_distance: Largest edit distance to accept (at most the
+                distance the index was built for)
         
-        Raises:
-            ConnectionError: If unable to connect to the server
-            asyncio.TimeoutError: If connection times out
+        Returns:
+            (distance, value) pairs sorted by distance, then value
         """
-        logger.info(f"Connecting to {self.config.server}:{self.config.port}...")
-        
-        # Open async TCP connection to the IRC server
-        self.reader, self.writer = await asyncio.open_connection(
-            self.config.server,
-            self.config.port
-        )
-        
-        logger.info("Connection established, sending registration...")
+        max_distance = min(max_distance, self.max_distance)
+        candidates: set[str] = set()
+        for variant in _deletions(word, max_distance):
+            candidates.update(self._variants.get(variant, ()))
         
-        # Send USER command: USER <username> <mode> <unused> :<realname>
-        # Mode 2 indicates we want to receive wallops and be invisible
-        await self.send_raw(f"USER {self.config.username} 2 3 {self.config.realname}")
-        
-        # Send NICK command to set our nickname
-        await self.send_raw(f"NICK {self.config.nick}")
-        
-        # Authenticate with NickServ if password is configured
-        if self.config.password:
-            logger.info("Authenticating with NickServ...")
-            await self.send_raw(f"PRIVMSG NickServ :identify {self.config.password}")
+        results = []
+        for key in candidates:
+            distance = _edit_distance(word, key, max_distance)
+            if distance <= max_distance:
+                results.append((distance, self._values[key]))
+        results.sort()
+        return results
+
+
+class LanguageIndex:
+    """
+    Read-only search index over a language code table.
+    
+    Example:
+        >>> index = LanguageIndex(LANGUAGE_CODES)
+        >>> index.lookup("de")
+        'German'
+        >>> index.code_for("yiddish")
+        'yi'
+        >>> index.suggest("zh-yeu")
+        ['zh-yue']
+    
+    Attributes:
+        codes: Mapping of language code to language name
+    """
     
-    async def send_raw(self, message: str) -> None:
+    def __init__(self, codes: dict[str, str]) -> None:
         """
-        Send a raw IRC protocol message to the server.
-        
-        IRC protocol requires messages to end with CRLF (\\r\\n).
-        This method handles the encoding and line termination automatically.
+        Build all search structures for the given table.
         
         Args:
-            message: The raw IRC protocol message to send (without CRLF)
-        
-        Note:
-            This is a low-level method. For sending channel messages,
-            use send_message() instead.
+            codes: Mapping of lower-case language code to language name
         """
-        if self.writer is None:
-            logger.error("Cannot send message: not connected")
-            return
-        
-        # Encode the message and append IRC protocol line terminator
-        self.writer.write(f"{message}\r\n".encode("utf-8"))
-        await self.writer.drain()  # Ensure data is sent
-        logger.debug(f">>> {message}")
+        self.codes = dict(codes)
+        self._sorted_codes = sorted(self.codes)
+        self._names = {name.lower(): code for code, name in self.codes.items()}
+        self._fuzzy_codes = _FuzzyIndex((code, code) for code in self.codes)
+        self._fuzzy_names = _FuzzyIndex(self._names.items())
     
-    async def send_message(self, target: str, message: str) -> None:
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def lookup(self, code: str) -> Optional[str]:
+        """Return the language name for an exact code, or None."""
+        return self.codes.get(code.lower())
+    
+    def with_prefix(self, prefix: str, limit: int = 10) -> list[str]:
         """
-        Send a PRIVMSG to a channel or user.
-        
-        PRIVMSG is the IRC command used for both channel messages and
-        private messages. The target determines the recipient.
+        List codes starting with prefix, in sorted order.
         
         Args:
-            target: Channel name (e.g., "#channel") or nickname for PM
-            message: The message text to send
+            prefix: Lower-case code prefix (e.g. "zh-")
+            limit: Maximum number of codes to return
         """
-        await self.send_raw(f"PRIVMSG {target} :{message}")
+        start = bisect.bisect_left(self._sorted_codes, prefix)
+        matches = []
+        for code in itertools.islice(self._sorted_codes, start, start + limit):
+            if not code.startswith(prefix):
+                break
+            matches.append(code)
+        return matches
+    
+    def code_for(self, name: str) -> Optional[str]:
+        """Return the code for an exact language name (case-insensitive), or None."""
+        return self._names.get(name.strip().lower())
     
-    async def join_channel(self, channel: str) -> None:
+    def suggest(self, code: str, limit: int = 3) -> list[str]:
         """
-        Join an IRC channel.
+        Suggest known codes for an unknown one.
         
-        Sends the JOIN command to enter the specified channel.
-        The channel name should include the # prefix.
+        Codes that extend the query come first, then codes within a small
+        edit distance (one edit for codes of up to three characters, two
+        for longer ones), then the code of a language whose name was typed
+        instead of a code.
         
         Args:
-            channel: Channel name to join (e.g., "#mychannel")
+            code: The unknown code, lower-cased
+            limit: Maximum number of suggestions
+        
+        Returns:
+            Suggested codes, best first
         """
-        await self.send_raw(f"JOIN {channel}")
-        logger.info(f"Joined channel: {channel}")
+        suggestions = self.with_prefix(code, limit)
+        if len(suggestions) < limit:
+            max_distance = 1 if len(code) <= 3 else 2
+            for _, match in self._fuzzy_codes.search(code, max_distance):
+                if match not in suggestions:
+                    suggestions.append(match)
+        by_name = self.code_for(code)
+        if by_name and by_name not in suggestions:
+            suggestions.insert(0, by_name)
+        return suggestions[:limit]
     
-    async def handle_ping(self, payload: str) -> None:
+    def suggest_names(self, name: str, limit: int = 3) -> list[str]:
         """
-        Respond to server PING with PONG to maintain connection.
-        
-        IRC servers periodically send PING messages to verify the client
-        is still connected. Failing to respond with PONG results in
-        disconnection (ping timeout).
+        Suggest codes for a misspelled or partial language name.
         
         Args:
-            payload: The payload from the PING message to echo back
+            name: The language name as typed
+            limit: Maximum number of suggestions
+        
+        Returns:
+            Codes of the closest matching language names, best first
         """
-        await self.send_raw(f"PONG :{payload}")
-        logger.debug("Responded to PING")
+        name = name.strip().lower()
+        max_distance = 1 if len(name) <= 4 else 2
+        matches = self._fuzzy_names.search(name, max_distance)
+        # Only the closest tier: a one-letter typo should not also suggest
+        # every name two edits away
+        codes = [code for distance, code in matches if distance == matches[0][0]]
+        if len(codes) < limit:
+            # Fall back to names that start with what was typed
+            for known, code in self._names.items():
+                if known.startswith(name) and code not in codes:
+                    codes.append(code)
+        return codes[:limit]
+
+
+# Built once at import and shared by every bot instance
+LANGUAGE_INDEX = LanguageIndex(LANGUAGE_CODES)
+
+
+# =============================================================================
+# TRIGGER RULES
+# =============================================================================
+# Conversational triggers are data: word, phrase and regex rules, each
+# optionally limited to some channels, loaded from a JSON file (or built
+# from CONVERSATIONAL_REPLIES). For each set of channels the rules are
+# compiled once into a TriggerMatcher: words and phrases go into a
+# word-level Aho-Corasick automaton and regexes into a single alternation.
+# A line that shares no word with any literal rule is rejected with one set
+# operation, so chatter costs about the same with thousands of rules as
+# with ten. Matchers depend on the bot's nick and are rebuilt, lazily, when
+# it changes or the rules are reloaded.
+
+# What the bot treats as a word when matching triggers
+TRIGGER_WORD = re.compile(r"\w+")
+
+# Placeholders allowed in replies; {nick} may also appear in patterns
+_TRIGGER_PLACEHOLDER = re.compile(r"\{(nick|master|sender|channel)\}")
+
+TRIGGER_KINDS = ("word", "phrase", "regex")
+
+
+@dataclass
+class TriggerRule:
+    """
+    One conversational trigger.
     
-    async def handle_message(self, sender: str, target: str, message: str) -> None:
+    Attributes:
+        kind: "word", "phrase" or "regex"
+        pattern: The word, phrase or regular expression; "{nick}" stands
+            for the bot's current nick
+        reply: Text to send; may use {nick}, {master}, {sender}, {channel}
+        channels: Lowercased channels the rule applies in; empty for
+            everywhere, including private messages
+        end: For words and phrases, only match at the end of the line
+    """
+    kind: str
+    pattern: str
+    reply: str
+    channels: frozenset[str] = frozenset()
+    end: bool = False
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TriggerRule":
         """
-        Process an incoming PRIVMSG and dispatch to appropriate handler.
+        Build a rule from its JSON form.
         
-        This is the main message routing method. It examines incoming messages
-        for commands (prefixed with !) and conversational triggers (when the
-        bot's nick is mentioned).
+        Example:
+            >>> TriggerRule.from_dict({"phrase": "{nick} dance", "reply": "*dances*"})
         
-        Args:
-            sender: Nickname of the message sender
-            target: Channel or nickname where message was sent
-            message: The message content
+        Raises:
+            ValueError: If the rule is malformed
         """
-        # Determine where to send replies
-        # If message was sent to a channel, reply there; otherwise reply to sender
-        reply_target = target if target.startswith("#") else sender
-        
-        # Check for commands (messages starting with !)
-        if message.startswith("!"):
-            await self.handle_command(sender, reply_target, message)
-            return
+        kinds = [kind for kind in TRIGGER_KINDS if kind in data]
+        if len(kinds) != 1:
+            raise ValueError(f"needs exactly one of {', '.join(TRIGGER_KINDS)}")
+        kind = kinds[0]
+        pattern = data[kind]
+        reply = data.get("reply")
+        if not isinstance(pattern, str) or not pattern.strip():
+            raise ValueError(f"{kind} must be a non-empty string")
+        if not isinstance(reply, str) or not reply:
+            raise ValueError("reply must be a non-empty string")
+        unknown = set(data) - {kind, "reply", "channels", "end"}
+        if unknown:
+            raise ValueError(f"unknown key(s): {', '.join(sorted(unknown))}")
         
-        # Check for conversational triggers when bot nick is mentioned
-        # Patterns: "word AvicBot" or "AvicBot word"
-        pattern1 = re.compile(rf"(\w+)\W*{self.config.nick}\W*$", re.IGNORECASE)
-        pattern2 = re.compile(rf"{self.config.nick}\W*(\w+)\W*$", re.IGNORECASE)
+        if kind == "regex":
+            if "end" in data:
+                raise ValueError('"end" does not apply to regex rules; use $')
+            try:
+                re.compile(pattern.replace("{nick}", "nick"))
+            except re.error as e:
+                raise ValueError(f"bad regex: {e}") from None
+        elif kind == "word" and len(TRIGGER_WORD.findall(pattern.replace("{nick}", "nick"))) != 1:
+            raise ValueError(f"not a single word: {pattern!r}; use a phrase")
         
-        match = pattern1.search(message) or pattern2.search(message)
-        if match:
-            word = match.group(1).lower()
-            if word in self.replies:
-                await self.send_message(reply_target, self.replies[word])
+        channels = data.get("channels", [])
+        if isinstance(channels, str):
+            channels = channels.split(",")
+        return cls(
+            kind=kind,
+            pattern=pattern,
+            reply=reply,
+            channels=frozenset(channel.strip().lower() for channel in channels if channel.strip()),
+            end=bool(data.get("end", False)),
+        )
     
-    async def handle_command(self, sender: str, reply_target: str, message: str) -> None:
-        """
-        Parse and execute bot commands.
-        
-        Commands are messages starting with ! and may include arguments.
-        This method routes each command to its appropriate handler.
+    def applies_in(self, channel: str) -> bool:
+        """Whether the rule is active in a channel ("" for private messages)."""
+        return not self.channels or channel in self.channels
+    
+    def render(self, values: dict[str, str]) -> str:
+        """The reply with its placeholders filled in."""
+        if "{" not in self.reply:
+            return self.reply
+        return _TRIGGER_PLACEHOLDER.sub(lambda match: values[match.group(1)], self.reply)
+
+
+def default_trigger_rules(replies: dict[str, str] = CONVERSATIONAL_REPLIES) -> list[TriggerRule]:
+    """
+    The built-in triggers: a reply word right before or after the bot's nick.
+    
+    "hello AvicBot" and "AvicBot: hello!" both match, but only at the end of
+    the line, as the bot has always behaved.
+    """
+    before = [TriggerRule("phrase", f"{word} {{nick}}", reply, end=True) for word, reply in replies.items()]
+    after = [TriggerRule("phrase", f"{{nick}} {word}", reply, end=True) for word, reply in replies.items()]
+    return before + after
+
+
+def load_trigger_rules(path: str) -> list[TriggerRule]:
+    """
+    Load trigger rules from a JSON file, or the built-in ones.
+    
+    The file holds a list of rules, tried in order; each has one of
+    "word", "phrase" or "regex", a "reply", and optionally "channels" and
+    (for words and phrases) "end":
         
-        Supported commands:
-            !commands - List available commands
-            !die <botname> - Gracefully disconnect (owner only)
-            !say <text> - Echo text to channel
-            !guc <username> - Global User Contributions link
-            !cauth <username> - CentralAuth page link
-            !link <path> - Custom link builder
-            !lang <code>? - Language code lookup
-            !sing - Bot sings a song
-            !random - Random number (fair dice roll)
+        [
+            {"phrase": "{nick} dance", "end": true, "reply": "*dances*"},
+            {"word": "coffee", "channels": ["#kitchen"], "reply": "Coffee for {sender}!"},
+            {"regex": "^good (morning|night),? {nick}", "reply": "You too, {sender}"}
+        ]
+    
+    Args:
+        path: Path to the JSON file, or "" for default_trigger_rules()
+    
+    Returns:
+        The rules, in file order
+    
+    Raises:
+        ValueError: If the file or a rule is malformed
+        OSError: If the file cannot be read
+    """
+    if not path:
+        return default_trigger_rules()
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a JSON list of rules")
+    rules = []
+    for number, entry in enumerate(data, 1):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("expected a JSON object")
+            rules.append(TriggerRule.from_dict(entry))
+        except ValueError as e:
+            raise ValueError(f"{path}: rule {number}: {e}") from None
+    return rules
+
+
+class TriggerMatcher:
+    """
+    Every rule active in one channel, compiled for one nick.
+    
+    Words and phrases are lowercased word sequences in a word-level
+    Aho-Corasick automaton, so a line is scanned once whatever the number
+    of rules; regex rules are joined into one case-insensitive pattern.
+    When several rules match, word and phrase rules win over regexes, and
+    the rule listed first wins among words and phrases.
+    
+    Example:
+        >>> matcher = TriggerMatcher(default_trigger_rules(), "AvicBot")
+        >>> matcher.match("hello AvicBot!").reply
+        'Hi'
+    """
+    
+    def __init__(self, rules: list[TriggerRule], nick: str) -> None:
+        self.rules = rules
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[int, bool]]] = [[]]
+        self._vocabulary: set[str] = set()
         
-        Args:
-            sender: Nickname of the command sender
-            reply_target: Where to send command output
-            message: The full command message including !
-        """
-        # Parse command and arguments
-        parts = message.split(maxsplit=1)
-        command = parts[0].lower()
-        args = parts[1] if len(parts) > 1 else ""
-        
-        # ====== !commands - List available commands ======
-        if command == "!commands":
-            await self.send_message(reply_target, "Commands:")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "!say: Say stuff | !lang <code>?: Language lookup")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "!cauth: CentralAuth page for a user")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "!guc: Global User Contributions page")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "!die: Makes me leave :(")
-        
-        # ====== !die - Disconnect from IRC ======
-        elif command == "!die" and args.lower() == self.config.nick.lower():
-            await self.send_message(reply_target, "Do you wanna build a snowman?")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "It doesn't have to be a snowman.")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "Ok, Bye :(")
-            await self.send_message(self.config.master, "I have to leave now :(")
-            self.running = False  # Signal main loop to stop
-        
-        # ====== !say - Echo message to channel ======
-        elif command == "!say" and args:
-            await self.send_message(reply_target, args)
-            await self.send_message(self.config.master, f"Message sent: {args}")
-        
-        # ====== !guc - Global User Contributions lookup ======
-        # Links to Wikimedia's Global User Contributions tool
-        elif command == "!guc" and args:
-            url = f"https://guc.toolforge.org/?user={args}&blocks=true"
-            await self.send_message(reply_target, url)
-            await self.send_message(self.config.master, url)
-        
-        # ====== !cauth - CentralAuth page lookup ======
-        # Links to Wikimedia's CentralAuth page for the user
-        elif command == "!cauth" and args:
-            url = f"https://meta.wikimedia.org/wiki/Special:CentralAuth/{args}"
-            await self.send_message(reply_target, url)
-            await self.send_message(self.config.master, url)
-        
-        # ====== !link - Custom link builder ======
-        elif command == "!link" and args:
-            url = f"http://avicbot.org/{args}"
-            await self.send_message(reply_target, url)
-            await self.send_message(self.config.master, url)
-        
-        # ====== !sing - Sing a song ======
-        elif command == "!sing":
-            await self.send_message(reply_target, "Daisy, Daisy, Give me your answer, do.")
-            await asyncio.sleep(0.1)
-            await self.send_message(reply_target, "I'm half crazy all for the love of you.")
-        
-        # ====== !random - Random number ======
-        # This was chosen by a fair roll of a d20. Guaranteed to be random.
-        elif command == "!random":
-            await self.send_message(reply_target, "7.")
-        
-        # ====== !lang - Language code lookup ======
-        # Format: !lang <code>? (e.g., "!lang en?")
-        elif command == "!lang" and args:
-            await self.handle_language_lookup(reply_target, args)
+        expressions = []
+        for index, rule in enumerate(rules):
+            if rule.kind == "regex":
+                expressions.append(f"(?P<_t{index}>{rule.pattern.replace('{nick}', re.escape(nick))})")
+            else:
+                words = TRIGGER_WORD.findall(rule.pattern.replace("{nick}", nick).lower())
+                if words:
+                    self._insert(words, index, rule.end)
+        self._link()
+        self._regex = re.compile("|".join(expressions), re.IGNORECASE) if expressions else None
     
-    async def handle_language_lookup(self, reply_target: str, args: str) -> None:
+    def _insert(self, words: list[str], index: int, end: bool) -> None:
+        """Add one word sequence to the trie."""
+        state = 0
+        for word in words:
+            following = self._goto[state].get(word)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][word] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = following
+        self._out[state].append((index, end))
+        self._vocabulary.update(words)
+    
+    def _link(self) -> None:
+        """Compute failure links breadth first, merging suffix outputs."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(word, 0)
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+    
+    def match(self, text: str) -> Optional[TriggerRule]:
         """
-        Look up a language code and respond with the full language name.
-        
-        This replaces the original 280+ if-statements with a single
-        dictionary lookup, making the code more maintainable and efficient.
+        The rule a line triggers, if any.
         
         Args:
-            reply_target: Channel or user to send the response to
-            args: The language code query (e.g., "en?" or "zh-yue?")
-        """
-        # Strip trailing ? and whitespace, normalize to lowercase
-        code = args.rstrip("? ").lower()
+            text: The message text
         
-        if code in LANGUAGE_CODES:
-            language_name = LANGUAGE_CODES[code]
-            await self.send_message(reply_target, f"{code} is {language_name}!")
-        else:
-            await self.send_message(reply_target, f"Unknown language code: {code}")
-    
-    def parse_message(self, raw_message: str) -> Optional[tuple[str, str, str, str]]:
+        Returns:
+            The matching rule, or None
+        """
+        if self._vocabulary:
+            words = TRIGGER_WORD.findall(text.lower())
+            if not self._vocabulary.isdisjoint(words):
+                found = self._scan(words)
+                if found is not None:
+                    return self.rules[found]
+        if self._regex is not None:
+            match = self._regex.search(text)
+            if match is not None:
+                return self.rules[int(match.lastgroup[2:])]
+        return None
+    
+    def _scan(self, words: list[str]) -> Optional[int]:
+        """Index of the first-listed literal rule found in a word list."""
+        goto, fail, out = self._goto, self._fail, self._out
+        last = len(words) - 1
+        best: Optional[int] = None
+        state = 0
+        for position, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for index, end in out[state]:
+                if (best is None or index < best) and (not end or position == last):
+                    best = index
+        return best
+
+
+class TriggerEngine:
+    """
+    Finds the conversational trigger for a line, per channel.
+    
+    Channels with rules of their own get their own matcher; every other
+    channel, and private messages, share one. Matchers are compiled on
+    first use and dropped when the nick changes.
+    
+    Example:
+        >>> engine = TriggerEngine(load_trigger_rules(config.triggers_file))
+        >>> rule = engine.match("AvicBot dance", "#avicbot", "AvicBot")
+    
+    Attributes:
+        rules: The rules, in priority order
+        builds: Number of matchers compiled so far
+    """
+    
+    def __init__(self, rules: list[TriggerRule]) -> None:
+        self.rules = rules
+        self.builds: int = 0
+        self._scoped: frozenset[str] = frozenset().union(*(rule.channels for rule in rules))
+        self._matchers: dict[str, TriggerMatcher] = {}
+        self._nick: str = ""
+    
+    def match(self, text: str, channel: str, nick: str) -> Optional[TriggerRule]:
+        """
+        The rule a line triggers, if any.
+        
+        Args:
+            text: The message text
+            channel: Lowercased channel the line was sent to, or "" for a
+                private message
+            nick: The bot's current nick
+        
+        Returns:
+            The matching rule, or None
+        """
+        if nick != self._nick:
+            self._matchers.clear()
+            self._nick = nick
+        key = channel if channel in self._scoped else ""
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            matcher = TriggerMatcher([rule for rule in self.rules if rule.applies_in(key)], nick)
+            self._matchers[key] = matcher
+            self.builds += 1
+        return matcher.match(text)
+
+
+# =============================================================================
+# LINE FRAMING
+# =============================================================================
+# IRC is a line-oriented protocol, but TCP delivers an arbitrary byte stream.
+# The framer accumulates raw bytes and hands back complete lines as soon as
+# their terminator arrives, so no polling delay is needed in the read loop.
+
+# Either half of CRLF on its own also ends a line
+_LINE_TERMINATOR = re.compile(rb"[\r\n]")
+
+
+class LineFramer:
+    """
+    Incremental splitter that turns raw socket data into complete IRC lines.
+    
+    Lines are terminated by CRLF as RFC 1459 requires, but a bare LF is also
+    accepted because a number of servers and bouncers send one (as is a
+    bare CR, which the RFC forbids inside a message). Only the
+    unterminated tail of the stream is kept between calls, so each chunk of
+    data is scanned once rather than re-copying the whole buffer on every read.
+    
+    A line longer than max_line_length is dropped rather than buffered
+    forever; if the server never sends a terminator at all, the partial data
+    is discarded up to the next CR or LF.
+    
+    Example:
+        >>> framer = LineFramer()
+        >>> framer.feed(b"PING :a\\r\\nPRIVMSG #c :hi\\nPART")
+        [b'PING :a', b'PRIVMSG #c :hi']
+        >>> framer.feed(b" #c\\rPING :b\\r")
+        [b'PART #c', b'PING :b']
+    
+    Attributes:
+        max_line_length: Longest line (without terminator) that is accepted
+        dropped_lines: Number of overlong lines discarded so far
+    """
+    
+    def __init__(self, max_line_length: int = 8703) -> None:
+        """
+        Initialize an empty framer.
+        
+        Args:
+            max_line_length: Longest line in bytes that will be returned. The
+                default allows the full IRCv3 size of 8191 bytes of tags plus
+                a 512-byte message.
+        """
+        self.max_line_length = max_line_length
+        self.dropped_lines: int = 0
+        self._partial = bytearray()
+        self._discarding: bool = False
+    
+    def feed(self, data: bytes) -> list[bytes]:
+        """
+        Add received data and return every line it completes.
+        
+        Args:
+            data: Raw bytes read from the socket
+        
+        Returns:
+            Complete lines with their CR/LF terminator removed. Empty lines
+            are skipped.
+        """
+        # The last terminator of either kind ends the complete part; a CR
+        # that is really the first half of a CRLF split across reads just
+        # leaves an empty line in front of the next chunk, which is skipped
+        end = max(data.rfind(b"\n"), data.rfind(b"\r"))
+        if end < 0:
+            # No terminator yet: just accumulate, but never past the limit
+            if not self._discarding:
+                self._partial += data
+                if len(self._partial) > self.max_line_length:
+                    self._drop_partial()
+            return []
+        
+        # Only the (usually short) unterminated tail is copied here
+        if self._partial:
+            end += len(self._partial)
+            data = bytes(self._partial) + data
+            self._partial.clear()
+        
+        complete = data[:end]
+        tail = data[end + 1:]
+        
+        if self._discarding:
+            # Everything up to the first terminator is the rest of an overlong line
+            first = _LINE_TERMINATOR.search(complete)
+            complete = complete[first.end():] if first else b""
+            self._discarding = False
+        
+        # splitlines() and filter() do the per-line work in C: CR, LF and
+        # CRLF all end a line (RFC 1459 forbids bare CRs inside messages),
+        # and the empty strings left by blank lines are dropped
+        lines = list(filter(None, complete.splitlines()))
+        limit = self.max_line_length
+        if len(complete) > limit and max(map(len, lines), default=0) > limit:
+            for line in lines:
+                if len(line) > limit:
+                    self.dropped_lines += 1
+                    logger.warning(f"Dropped overlong line ({len(line)} bytes)")
+            lines = [line for line in lines if len(line) <= limit]
+        
+        if tail:
+            self._partial += tail
+            if len(self._partial) > limit:
+                self._drop_partial()
+        
+        return lines
+    
+    def _drop_partial(self) -> None:
+        """Discard the buffered partial line and skip to the next terminator."""
+        self.dropped_lines += 1
+        logger.warning(f"Dropped unterminated line over {self.max_line_length} bytes")
+        self._partial.clear()
+        self._discarding = True
+    
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes still waiting for a line terminator."""
+        return len(self._partial)
+    
+    def take_partial(self) -> bytes:
+        """Remove and return the buffered, still unterminated tail."""
+        partial = bytes(self._partial)
+        self._partial.clear()
+        return partial
+
+
+# =============================================================================
+# CONNECTION TRANSPORT
+# =============================================================================
+# The default transport is an asyncio.Protocol whose data_received() feeds
+# the LineFramer directly: bytes go from the event loop's socket callback
+# into complete lines with no StreamReader buffer in between, and the read
+# loop is woken once per batch of lines rather than once per read(). The
+# same object implements the StreamWriter methods the bot uses, so the send
+# queue writes to it unchanged. The streams-based transport remains
+# available (AVICBOT_TRANSPORT=streams) through StreamLineReader.
+
+class IRCProtocol(asyncio.Protocol):
+    """
+    Protocol that frames incoming data into lines as it arrives.
+    
+    Reading: read_lines() returns every line received since the previous
+    call, waiting if there are none. If the read loop falls behind by more
+    than max_backlog lines, the transport stops reading from the socket
+    until it catches up, so a flood cannot grow memory without bound.
+    
+    Writing: write(), drain(), close(), wait_closed(), is_closing() and
+    get_extra_info() behave like their StreamWriter counterparts, with
+    drain() honouring the transport's write flow control.
+    
+    Example:
+        >>> _, protocol = await loop.create_connection(lambda: IRCProtocol(), host, port)
+        >>> protocol.write(b"NICK AvicBot\\r\\n")
+        >>> lines = await protocol.read_lines()
+    
+    Attributes:
+        framer: The LineFramer fed by data_received()
+        max_backlog: Unread lines at which reading is paused
+    """
+    
+    def __init__(self, max_line_length: int = 8703, max_backlog: int = 10_000) -> None:
+        """
+        Initialize the protocol.
+        
+        Args:
+            max_line_length: Passed on to the LineFramer
+            max_backlog: Unread lines at which the socket is paused
+        """
+        self.framer = LineFramer(max_line_length)
+        self.max_backlog = max_backlog
+        self.transport: Optional[asyncio.Transport] = None
+        self._lines: list[bytes] = []
+        self._eof = False
+        self._error: Optional[Exception] = None
+        self._reading_paused = False
+        self._read_waiter: Optional[asyncio.Future] = None
+        self._write_paused = False
+        self._drain_waiters: list[asyncio.Future] = []
+        self._closed: asyncio.Future = asyncio.get_running_loop().create_future()
+    
+    # -- asyncio.Protocol callbacks --------------------------------------------
+    
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+    
+    def data_received(self, data: bytes) -> None:
+        lines = self.framer.feed(data)
+        if not lines:
+            return
+        self._lines.extend(lines)
+        self._wake_reader()
+        if len(self._lines) >= self.max_backlog and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+    
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wake_reader()
+        return False  # Let the transport close itself
+    
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._eof = True
+        self._error = exc
+        self._wake_reader()
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
+        self._drain_waiters.clear()
+        if not self._closed.done():
+            self._closed.set_result(None)
+    
+    def pause_writing(self) -> None:
+        self._write_paused = True
+    
+    def resume_writing(self) -> None:
+        self._write_paused = False
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._drain_waiters.clear()
+    
+    # -- Reading ---------------------------------------------------------------
+    
+    def _wake_reader(self) -> None:
+        waiter = self._read_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+    
+    async def read_lines(self) -> list[bytes]:
+        """
+        Wait for and return the lines received since the last call.
+        
+        Returns:
+            Complete lines without terminators, or an empty list once the
+            connection has closed
+        
+        Raises:
+            ConnectionError: If the connection was lost with an error
+        """
+        while not self._lines:
+            if self._eof:
+                if self._error is not None:
+                    raise ConnectionError(str(self._error)) from self._error
+                return []
+            self._read_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._read_waiter
+            finally:
+                self._read_waiter = None
+        
+        lines = self._lines
+        self._lines = []
+        if self._reading_paused:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        return lines
+    
+    def feed_eof(self) -> None:
+        """Make read_lines() report end of stream, as StreamReader.feed_eof does."""
+        self._eof = True
+        self._wake_reader()
+    
+    def detach(self) -> bytes:
+        """
+        Stop reading and take back everything received but not yet read.
+        
+        Used to hand the connection to another process: the returned bytes
+        (unread lines plus any partial line) are what that process must
+        process before reading from the socket itself.
+        
+        Returns:
+            The unread data, with each complete line ending in CRLF
+        """
+        if self.transport is not None:
+            self.transport.pause_reading()
+        self._reading_paused = True
+        unread = b"".join(line + b"\r\n" for line in self._lines) + self.framer.take_partial()
+        self._lines = []
+        return unread
+    
+    def reattach(self, unread: bytes = b"") -> None:
+        """
+        Undo detach(): put data back in front of the stream and read again.
+        
+        Also used by a process taking over a connection, to process the
+        data its predecessor had received but not read.
+        
+        Args:
+            unread: Data returned by detach()
+        """
+        if unread:
+            self._lines.extend(self.framer.feed(unread))
+            self._wake_reader()
+        if self._reading_paused and self.transport is not None:
+            self._reading_paused = False
+            self.transport.resume_reading()
+    
+    # -- Writing (StreamWriter interface) --------------------------------------
+    
+    def write(self, data: bytes) -> None:
+        """Queue bytes on the transport."""
+        self.transport.write(data)
+    
+    async def drain(self) -> None:
+        """Wait until the transport's write buffer has room again."""
+        if self.transport.is_closing():
+            # Give connection_lost() a chance to run, as StreamWriter does
+            await asyncio.sleep(0)
+            if self._error is not None:
+                raise ConnectionResetError(str(self._error))
+        if not self._write_paused:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+    
+    def close(self) -> None:
+        """Close the transport; buffered data is still flushed."""
+        if self.transport is not None:
+            self.transport.close()
+    
+    def is_closing(self) -> bool:
+        """True once the transport is closing or closed."""
+        return self.transport is None or self.transport.is_closing()
+    
+    async def wait_closed(self) -> None:
+        """Wait until the connection is fully closed."""
+        await self._closed
+    
+    async def wait_written(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until the transport has passed every written byte to the kernel.
+        
+        Args:
+            timeout: Maximum number of seconds to wait
+        
+        Returns:
+            True if the write buffer emptied in time
+        """
+        deadline = time.monotonic() + timeout
+        while self.transport is not None and self.transport.get_write_buffer_size():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+    
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        """Transport information, e.g. "peername" or "socket"."""
+        return self.transport.get_extra_info(name, default) if self.transport else default
+
+
+class StreamLineReader:
+    """
+    read_lines() over a StreamReader, for the streams-based transport.
+    
+    Attributes:
+        reader: The underlying StreamReader
+        framer: LineFramer splitting its data into lines
+    """
+    
+    def __init__(self, reader: asyncio.StreamReader, max_line_length: int = 8703,
+                 buffer_size: int = 4096) -> None:
+        self.reader = reader
+        self.framer = LineFramer(max_line_length)
+        self.buffer_size = buffer_size
+    
+    async def read_lines(self) -> list[bytes]:
+        """Wait for at least one complete line; an empty list means EOF."""
+        while True:
+            data = await self.reader.read(self.buffer_size)
+            if not data:
+                return []
+            lines = self.framer.feed(data)
+            if lines:
+                return lines
+    
+    def feed_eof(self) -> None:
+        """Wake a pending read_lines() with end of stream."""
+        self.reader.feed_eof()
+
+
+def use_uvloop() -> bool:
+    """
+    Switch asyncio to uvloop's event loop if it is installed.
+    
+    Set AVICBOT_UVLOOP=0 to keep the standard loop even when uvloop is
+    available. Must be called before the event loop is created.
+    
+    Returns:
+        True if uvloop is now the event loop implementation
+    """
+    if uvloop is None or os.getenv("AVICBOT_UVLOOP", "1") == "0":
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+# =============================================================================
+# MESSAGE PARSING
+# =============================================================================
+# Parser for RFC 1459 messages with IRCv3 message tags:
+#
+#     [@tag1=value;tag2 ][:nick!user@host ]COMMAND [param ...][ :trailing]
+#
+# Parsing is plain string slicing rather than a regular expression, and the
+# command is located first so that callers can skip lines they do not care
+# about before tags, prefix and parameters are split apart.
+
+# Escape sequences allowed in IRCv3 tag values
+_TAG_ESCAPE_RE = re.compile(r"\\(.?)")
+_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+def _unescape_tag_value(value: str) -> str:
+    """Decode the IRCv3 escape sequences in a tag value."""
+    return _TAG_ESCAPE_RE.sub(lambda m: _TAG_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+class Message:
+    """
+    A parsed IRC protocol message.
+    
+    Uses __slots__ so that the thousands of messages a busy connection
+    produces stay small and attribute access stays fast.
+    
+    Example:
+        >>> msg = parse_line("@time=2026-01-01T00:00:00Z :Nick!user@host PRIVMSG #chan :Hello")
+        >>> msg.nick, msg.command, msg.params
+        ('Nick', 'PRIVMSG', ['#chan', 'Hello'])
+    
+    Attributes:
+        tags: IRCv3 message tags (valueless tags map to "")
+        source: The raw prefix without its leading colon, or ""
+        nick: Nickname (or server name) from the prefix, or ""
+        user: Username from the prefix, or ""
+        host: Hostname from the prefix, or ""
+        command: Upper-cased command or three-digit numeric
+        params: Middle parameters followed by the trailing parameter, if any
+    """
+    
+    __slots__ = ("tags", "source", "nick", "user", "host", "command", "params")
+    
+    def __init__(self, tags: dict[str, str], source: str, command: str, params: list[str]) -> None:
+        """
+        Initialize a message, splitting the prefix into nick, user and host.
+        
+        Args:
+            tags: Parsed IRCv3 tags
+            source: Raw prefix (nick!user@host or server name), or ""
+            command: Command name or numeric
+            params: Parameter list
+        """
+        self.tags = tags
+        self.source = source
+        self.command = command
+        self.params = params
+        
+        # nick!user@host, nick@host or a bare server name
+        nick, _, host = source.partition("@")
+        nick, _, user = nick.partition("!")
+        self.nick = nick
+        self.user = user
+        self.host = host
+    
+    @property
+    def target(self) -> str:
+        """The first parameter (channel or nick for most commands), or ""."""
+        return self.params[0] if self.params else ""
+    
+    @property
+    def text(self) -> str:
+        """The last parameter (message text for PRIVMSG/NOTICE), or ""."""
+        return self.params[-1] if self.params else ""
+    
+    def __repr__(self) -> str:
+        return (
+            f"Message(tags={self.tags!r}, source={self.source!r}, "
+            f"command={self.command!r}, params={self.params!r})"
+        )
+
+
+def parse_line(line: str, commands: Optional[Container[str]] = None) -> Optional[Message]:
+    """
+    Parse one IRC line into a Message.
+    
+    Args:
+        line: A single line without its CRLF terminator
+        commands: If given, only messages whose command is in this set are
+            fully parsed; anything else returns None after only the command
+            has been located. The set must contain upper-case names.
+    
+    Returns:
+        The parsed Message, or None if the line is malformed or filtered out
+    
+    Example:
+        >>> parse_line(":irc.example 001 AvicBot :Welcome").params
+        ['AvicBot', 'Welcome']
+        >>> parse_line(":irc.example 001 AvicBot :Welcome", {"PRIVMSG"}) is None
+        True
+    """
+    pos = 0
+    tags_raw = ""
+    source = ""
+    
+    # Optional @tags section
+    if line.startswith("@"):
+        end = line.find(" ")
+        if end == -1:
+            return None
+        tags_raw = line[1:end]
+        pos = end + 1
+        while line.startswith(" ", pos):
+            pos += 1
+    
+    # Optional :prefix section
+    if line.startswith(":", pos):
+        end = line.find(" ", pos)
+        if end == -1:
+            return None
+        source = line[pos + 1:end]
+        pos = end + 1
+        while line.startswith(" ", pos):
+            pos += 1
+    
+    # Command: the cheap part, checked before any further work
+    end = line.find(" ", pos)
+    if end == -1:
+        command = line[pos:].upper()
+        rest = ""
+    else:
+        command = line[pos:end].upper()
+        rest = line[end + 1:]
+    if not command:
+        return None
+    if commands is not None and command not in commands:
+        return None
+    
+    # Parameters: space-separated middles, then an optional :trailing
+    if rest.startswith(":"):
+        params = [rest[1:]]
+    else:
+        split_at = rest.find(" :")
+        if split_at == -1:
+            params = rest.split()
+        else:
+            params = rest[:split_at].split()
+            params.append(rest[split_at + 2:])
+    
+    tags: dict[str, str] = {}
+    if tags_raw:
+        for item in tags_raw.split(";"):
+            if not item:
+                continue
+            key, _, value = item.partition("=")
+            tags[key] = _unescape_tag_value(value) if "\\" in value else value
+    
+    return Message(tags, source, command, params)
+
+
+# =============================================================================
+# HANDLER DISPATCH
+# =============================================================================
+# Message handlers run as background tasks so that a slow command never holds
+# up the read loop. Protocol-critical lines such as PING are still handled
+# inline by the reader, which keeps the connection alive under load.
+
+# The dispatcher task running the current handler. asyncio.wait_for() runs
+# the handler in a task of its own on Python < 3.12, so current_task()
+# inside a handler is not the task the dispatcher tracks.
+_handler_task: contextvars.ContextVar[Optional[asyncio.Task]] = contextvars.ContextVar(
+    "avicbot_handler_task", default=None,
+)
+
+
+class HandlerDispatcher:
+    """
+    Runs message handlers as tracked tasks with a concurrency cap and timeout.
+    
+    At most max_concurrent handlers execute at the same time; further
+    handlers wait their turn. To keep a flood of messages from piling up
+    unbounded, new work is refused once max_pending handlers are waiting or
+    running. Every handler is cancelled if it exceeds the timeout.
+    
+    Example:
+        >>> dispatcher = HandlerDispatcher(max_concurrent=8, timeout=30)
+        >>> dispatcher.submit(bot.handle_message(sender, target, text))
+        >>> await dispatcher.shutdown()
+    
+    Attributes:
+        max_concurrent: Number of handlers allowed to run at once
+        max_pending: Number of handlers allowed to be waiting or running
+        timeout: Seconds a handler may run before it is cancelled
+        tasks: The set of handler tasks that have not yet finished
+        dropped: Number of handlers refused because the backlog was full
+        timed_out: Number of handlers cancelled for exceeding the timeout
+    """
+    
+    def __init__(self, max_concurrent: int = 16, timeout: float = 30.0,
+                 max_pending: Optional[int] = None) -> None:
+        """
+        Initialize the dispatcher.
+        
+        Args:
+            max_concurrent: Number of handlers allowed to run at once
+            timeout: Seconds a handler may run before it is cancelled
+            max_pending: Backlog limit (default: 16 times max_concurrent)
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_pending = max_pending or self.max_concurrent * 16
+        self.timeout = timeout
+        self.tasks: set[asyncio.Task] = set()
+        self.dropped: int = 0
+        self.timed_out: int = 0
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+    
+    def submit(self, coro: Coroutine[Any, Any, None], name: str = "handler",
+               wait_histogram: Optional["LatencyHistogram"] = None) -> Optional[asyncio.Task]:
+        """
+        Schedule a handler coroutine without waiting for it.
+        
+        Args:
+            coro: The handler coroutine to run
+            name: Short description used in log messages
+            wait_histogram: If given, records how long the handler waited
+                before it started running
+        
+        Returns:
+            The task running the handler, or None if the backlog was full
+        """
+        if len(self.tasks) >= self.max_pending:
+            self.dropped += 1
+            # Log the first drop and then every hundredth, not every one
+            if self.dropped % 100 == 1:
+                logger.warning(f"Handler backlog full, dropping {name} ({self.dropped} dropped so far)")
+            coro.close()
+            return None
+        
+        task = asyncio.create_task(self._run(coro, name, wait_histogram, time.perf_counter()))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+    
+    async def _run(self, coro: Coroutine[Any, Any, None], name: str,
+                   wait_histogram: Optional["LatencyHistogram"], submitted: float) -> None:
+        """Run one handler under the semaphore, timeout and error guard."""
+        started = False
+        try:
+            async with self._semaphore:
+                started = True
+                _handler_task.set(asyncio.current_task())
+                if wait_histogram is not None:
+                    wait_histogram.observe(time.perf_counter() - submitted)
+                await asyncio.wait_for(coro, self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning(f"{name} timed out after {self.timeout}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in {name}: {e}")
+        finally:
+            # A handler cancelled while still queued was never awaited
+            if not started:
+                coro.close()
+    
+    async def wait_idle(self, timeout: float = 5.0) -> bool:
+        """
+        Wait for outstanding handlers to finish without cancelling them.
+        
+        The calling task is not waited for, so a handler may call this.
+        
+        Args:
+            timeout: Maximum number of seconds to wait
+        
+        Returns:
+            True if every other handler finished in time
+        """
+        current = _handler_task.get() or asyncio.current_task()
+        pending = {task for task in self.tasks if task is not current}
+        if not pending:
+            return True
+        _, still_running = await asyncio.wait(pending, timeout=timeout)
+        return not still_running
+    
+    async def shutdown(self, grace: float = 2.0) -> None:
+        """
+        Stop all outstanding handlers.
+        
+        Handlers get a short grace period to finish (so that, for example,
+        a goodbye message still goes out) before the rest are cancelled.
+        
+        Args:
+            grace: Seconds to wait for running handlers before cancelling
+        """
+        current = _handler_task.get() or asyncio.current_task()
+        pending = {task for task in self.tasks if task is not current}
+        if not pending:
+            return
+        
+        _, still_running = await asyncio.wait(pending, timeout=grace)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            await asyncio.gather(*still_running, return_exceptions=True)
+            logger.info(f"Cancelled {len(still_running)} unfinished handler(s)")
+
+
+# =============================================================================
+# OUTBOUND SEND QUEUE
+# =============================================================================
+# All outgoing lines go through a single writer task. Lines wait in priority
+# lanes, a token bucket keeps the bot under the server's flood limit, and
+# everything that may be sent at once is written and drained as one batch.
+
+# Priority lanes, highest first. Keepalive and shutdown traffic must never
+# wait behind bulk output, so PRIORITY_HIGH lines bypass the rate limit.
+PRIORITY_HIGH = 0    # PONG, QUIT, registration
+PRIORITY_NORMAL = 1  # Replies to users, JOINs
+PRIORITY_LOW = 2     # Bulk output such as owner notifications
+
+# Longest IRC line in bytes, including the CRLF (RFC 1459)
+IRC_MAX_LINE = 512
+
+# Assumed length of our own hostname until the server tells us the real one
+HOST_LENGTH_ESTIMATE = 63
+
+# Most (target, text) pairs kept in an IRCBot's cache of encoded static replies
+STATIC_CACHE_SIZE = 4096
+
+
+def split_utf8(text: str, max_bytes: int) -> list[bytes]:
+    """
+    Encode text and split it into pieces of at most max_bytes bytes.
+    
+    Pieces never end inside a multibyte character, and a piece is broken
+    at the last space when there is one in its second half, so words are
+    only cut when they are very long. Leading spaces of continuation
+    pieces are dropped.
+    
+    Example:
+        >>> split_utf8("héllo wörld", 8)
+        [b'h\xc3\xa9llo', b'w\xc3\xb6rld']
+    
+    Args:
+        text: The message text
+        max_bytes: Byte budget per piece (at least 4)
+    
+    Returns:
+        The encoded pieces; a single piece if the text fits
+    """
+    data = text.encode("utf-8")
+    if len(data) <= max_bytes:
+        return [data]
+    
+    max_bytes = max(4, max_bytes)
+    pieces = []
+    start = 0
+    while len(data) - start > max_bytes:
+        end = start + max_bytes
+        # Back off past UTF-8 continuation bytes (0b10xxxxxx)
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        space = data.rfind(b" ", start + max_bytes // 2, end + 1)
+        if space > start:
+            end = space
+        pieces.append(data[start:end])
+        start = end
+        while start < len(data) and data[start] == 0x20:
+            start += 1
+    if start < len(data):
+        pieces.append(data[start:])
+    return pieces
+
+
+class SendQueue:
+    """
+    Rate-limited, prioritized outbound line queue with a single writer task.
+    
+    The token bucket holds up to `burst` tokens and refills at `rate` tokens
+    per second; every line sent costs one token. High-priority lines are
+    sent immediately even when the bucket is empty (the bucket simply goes
+    into debt), so a PONG is never delayed by a long reply. A rate of 0
+    turns pacing off: every queued line is sent at once.
+    
+    Lines that can be sent together are joined into a single write followed
+    by a single drain, instead of a write/drain round trip per line.
+    
+    Example:
+        >>> queue = SendQueue(writer, rate=2.0, burst=10)
+        >>> queue.start()
+        >>> queue.put("PRIVMSG #channel :hello")
+        >>> queue.put(b"PRIVMSG #channel :pre-encoded\r\n")
+        >>> queue.put("PONG :irc.libera.chat", PRIORITY_HIGH)
+        >>> await queue.close()
+    
+    Attributes:
+        rate: Sustained lines per second allowed by the token bucket
+            (0: unpaced)
+        burst: Maximum number of lines that may be sent back to back
+        sent_lines: Total number of lines written
+        sent_batches: Total number of write/drain batches
+        last_wait: Seconds the most recently sent line spent queued
+        max_wait: Longest time any line has spent queued, in seconds
+    """
+    
+    def __init__(self, writer: Any, rate: float = 2.0, burst: int = 10,
+                 traffic_log: logging.Logger = traffic_logger) -> None:
+        """
+        Initialize the queue.
+        
+        Args:
+            writer: Object with write() and async drain(), e.g. a StreamWriter
+            rate: Sustained lines per second; 0 for no pacing
+            burst: Number of lines that may be sent back to back
+            traffic_log: Logger that sent lines are logged to at DEBUG
+        """
+        self.writer = writer
+        self.traffic_log = traffic_log
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.sent_lines: int = 0
+        self.sent_batches: int = 0
+        self.last_wait: float = 0.0
+        self.max_wait: float = 0.0
+        self._total_wait: float = 0.0
+        self._lanes: tuple[deque, ...] = (deque(), deque(), deque())
+        self._tokens: float = float(self.burst)
+        self._refilled_at: float = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start the writer task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    def put(self, line: str | bytes, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Queue a line for sending.
+        
+        Args:
+            line: The raw IRC protocol line, either as a str without CRLF or
+                as already encoded bytes ending in CRLF
+            priority: One of PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+        """
+        if isinstance(line, str):
+            line = f"{line}\r\n".encode("utf-8")
+        self._lanes[priority].append((time.monotonic(), line))
+        self._idle.clear()
+        self._wakeup.set()
+    
+    @property
+    def depth(self) -> int:
+        """Number of lines waiting to be sent."""
+        return sum(len(lane) for lane in self._lanes)
+    
+    def stats(self) -> dict[str, float]:
+        """
+        Snapshot of queue health for monitoring.
+        
+        Returns:
+            Dictionary with queue depth per lane, lines and batches sent,
+            and time-in-queue figures in milliseconds
+        """
+        now = time.monotonic()
+        oldest = min((lane[0][0] for lane in self._lanes if lane), default=now)
+        return {
+            "depth": self.depth,
+            "depth_high": len(self._lanes[PRIORITY_HIGH]),
+            "depth_normal": len(self._lanes[PRIORITY_NORMAL]),
+            "depth_low": len(self._lanes[PRIORITY_LOW]),
+            "sent_lines": self.sent_lines,
+            "sent_batches": self.sent_batches,
+            "oldest_wait_ms": (now - oldest) * 1000,
+            "last_wait_ms": self.last_wait * 1000,
+            "avg_wait_ms": self._total_wait / self.sent_lines * 1000 if self.sent_lines else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+    
+    def _refill(self, now: float) -> None:
+        """Add the tokens earned since the last refill."""
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+    
+    def _take_batch(self) -> list[tuple[float, str]]:
+        """Remove every line that may be sent right now, in priority order."""
+        if self.rate <= 0:
+            # Unpaced: everything goes, still in priority order
+            batch = [line for lane in self._lanes for line in lane]
+            for lane in self._lanes:
+                lane.clear()
+            return batch
+        self._refill(time.monotonic())
+        
+        # High-priority lines always go out, even if it puts us into debt
+        high = self._lanes[PRIORITY_HIGH]
+        batch = list(high)
+        high.clear()
+        self._tokens -= len(batch)
+        
+        for lane in self._lanes[PRIORITY_HIGH + 1:]:
+            while lane and self._tokens >= 1:
+                batch.append(lane.popleft())
+                self._tokens -= 1
+        return batch
+    
+    async def _run(self) -> None:
+        """Writer task: send batches as tokens become available."""
+        while True:
+            self._wakeup.clear()
+            batch = self._take_batch()
+            
+            if batch:
+                now = time.monotonic()
+                log_traffic = self.traffic_log.isEnabledFor(logging.DEBUG)
+                for queued_at, line in batch:
+                    wait = now - queued_at
+                    self._total_wait += wait
+                    if wait > self.max_wait:
+                        self.max_wait = wait
+                    if log_traffic:
+                        self.traffic_log.debug(">>> %s", line[:-2].decode("utf-8", errors="replace"))
+                self.last_wait = wait
+                
+                # One write and one drain for the whole batch
+                self.writer.write(b"".join([line for _, line in batch]))
+                self.sent_lines += len(batch)
+                self.sent_batches += 1
+                try:
+                    await self.writer.drain()
+                except (ConnectionError, OSError) as e:
+                    logger.error(f"Send failed: {e}")
+                    self._drop_all()
+                continue
+            
+            if not self.depth:
+                self._idle.set()
+                await self._wakeup.wait()
+                continue
+            
+            # Lines are waiting for tokens; sleep until one is earned, but wake
+            # early if something new (e.g. a PONG) is queued
+            delay = (1 - self._tokens) / self.rate
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _drop_all(self) -> None:
+        """Discard queued lines after the connection has failed."""
+        for lane in self._lanes:
+            lane.clear()
+        self._idle.set()
+    
+    def take_pending(self) -> list[tuple[int, bytes]]:
+        """
+        Remove every queued line without sending it.
+        
+        Used to carry unsent output across a session handoff; the lines can
+        be queued again, in order, with put().
+        
+        Returns:
+            (priority, encoded line) pairs, highest priority first
+        """
+        pending = [(priority, line) for priority, lane in enumerate(self._lanes) for _, line in lane]
+        self._drop_all()
+        return pending
+    
+    async def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until every queued line has been written.
+        
+        Args:
+            timeout: Maximum number of seconds to wait
+        
+        Returns:
+            True if the queue emptied, False if the timeout expired first
+        """
+        if self._task is None or self._idle.is_set():
+            return not self.depth
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Flush the queue (up to a timeout) and stop the writer task.
+        
+        Args:
+            timeout: Seconds to wait for queued lines to be sent
+        """
+        if self._task is None:
+            return
+        if not await self.flush(timeout):
+            logger.warning(f"Discarding {self.depth} unsent line(s)")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+# =============================================================================
+# COMMAND REGISTRY
+# =============================================================================
+# Bot commands register themselves with the @command decorator. The registry
+# maps every name and alias straight to its Command, so dispatch is a single
+# dictionary lookup no matter how many commands exist, and the !commands
+# listing is generated from the same data.
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram with fixed bucket boundaries.
+    
+    Bucket boundaries are in seconds and follow the Prometheus convention:
+    counts[i] is the number of observations <= buckets[i], with a final
+    implicit +Inf bucket. BUCKETS suits command run times; pass finer
+    boundaries for faster operations.
+    
+    Attributes:
+        buckets: Upper bounds of the buckets, ascending
+        counts: Observations per bucket (non-cumulative), plus +Inf
+        total: Number of observations
+        sum: Sum of all observed values in seconds
+    """
+    
+    BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+    
+    __slots__ = ("buckets", "counts", "total", "sum")
+    
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.total: int = 0
+        self.sum: float = 0.0
+    
+    def observe(self, seconds: float) -> None:
+        """Record one observation."""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+    
+    def cumulative(self) -> list[int]:
+        """Running totals per bucket, as Prometheus expects them."""
+        return list(itertools.accumulate(self.counts))
+
+
+@dataclass(slots=True)
+class CommandContext:
+    """
+    Everything a command handler needs to know about one invocation.
+    
+    Attributes:
+        bot: The IRCBot that received the command
+        sender: Nickname of the user who sent the command
+        reply_target: Channel (or nick, for private messages) to reply to
+        name: The command name as typed, lower-cased (e.g. "!lang")
+        args: Everything after the command name, or ""
+    """
+    bot: "IRCBot"
+    sender: str
+    reply_target: str
+    name: str
+    args: str
+    
+    async def reply(self, text: str, static: bool = False) -> None:
+        """
+        Send a message to wherever the command came from.
+        
+        Pass static=True for fixed text (songs, help, canned replies) so
+        its encoded form is cached; see IRCBot.send_message.
+        """
+        await self.bot.send_message(self.reply_target, text, static=static)
+    
+    async def notify_master(self, text: str, immediate: bool = False) -> None:
+        """
+        Tell the bot owner about this command.
+        
+        The notification goes into the owner digest unless immediate is
+        set, which is meant for critical events such as !die.
+        """
+        await self.bot.notify_master(text, self.name, self.reply_target, immediate)
+
+
+CommandHandler = Callable[[CommandContext], Awaitable[None]]
+
+
+@dataclass
+class Command:
+    """
+    A registered bot command.
+    
+    Attributes:
+        name: Primary name including the ! prefix (e.g. "!lang")
+        handler: Coroutine function called with a CommandContext
+        usage: Argument synopsis shown in !commands (e.g. "<code>?")
+        help: One-line description shown in !commands
+        aliases: Alternative names that invoke the same handler
+        min_args: Minimum number of whitespace-separated arguments
+        max_args: Maximum number of arguments, or None for no limit
+        owner_only: Whether only the bot master may use the command
+        coalesce: Whether repeats inside the coalescing window are dropped
+        calls: Number of successful invocations
+        latency: Histogram of handler run times
+    """
+    name: str
+    handler: CommandHandler
+    usage: str = ""
+    help: str = ""
+    aliases: tuple[str, ...] = ()
+    min_args: int = 0
+    max_args: Optional[int] = None
+    owner_only: bool = False
+    coalesce: bool = True
+    calls: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    
+    def accepts(self, args: str) -> bool:
+        """Check whether an argument string satisfies the command's arity."""
+        if not self.min_args and self.max_args is None:
+            return True
+        count = len(args.split())
+        return count >= self.min_args and (self.max_args is None or count <= self.max_args)
+
+
+class CommandRegistry:
+    """
+    Name-to-command table populated by the @command decorator.
+    
+    Example:
+        >>> registry = CommandRegistry()
+        >>> @registry.command("!ping", help="Check that I'm alive")
+        ... async def cmd_ping(ctx: CommandContext) -> None:
+        ...     await ctx.reply("pong")
+        >>> registry.get("!ping").help
+        "Check that I'm alive"
+    """
+    
+    def __init__(self) -> None:
+        self._commands: dict[str, Command] = {}
+        self._order: list[Command] = []
+        self._help_cache: dict[int, list[str]] = {}
+    
+    def command(self, name: str, *, usage: str = "", help: str = "",
+                aliases: tuple[str, ...] = (), min_args: int = 0,
+                max_args: Optional[int] = None, owner_only: bool = False,
+                coalesce: bool = True) -> Callable[[CommandHandler], CommandHandler]:
+        """
+        Decorator that registers a coroutine function as a command.
+        
+        Args:
+            name: Command name including the ! prefix
+            usage: Argument synopsis for !commands
+            help: One-line description for !commands
+            aliases: Alternative names for the command
+            min_args: Minimum number of arguments required
+            max_args: Maximum number of arguments allowed
+            owner_only: Restrict the command to the bot master
+            coalesce: Drop repeats inside the coalescing window; off for
+                commands whose every call should be answered
+        
+        Returns:
+            Decorator that registers the function and returns it unchanged
+        
+        Raises:
+            ValueError: If the name or an alias is already registered
+        """
+        def decorator(handler: CommandHandler) -> CommandHandler:
+            self.register(Command(
+                name=name.lower(),
+                handler=handler,
+                usage=usage,
+                help=help,
+                aliases=tuple(alias.lower() for alias in aliases),
+                min_args=min_args,
+                max_args=max_args,
+                owner_only=owner_only,
+                coalesce=coalesce,
+            ))
+            return handler
+        return decorator
+    
+    def register(self, cmd: Command) -> None:
+        """Add a Command under its name and all of its aliases."""
+        for key in (cmd.name, *cmd.aliases):
+            if key in self._commands:
+                raise ValueError(f"Command {key} is already registered")
+        for key in (cmd.name, *cmd.aliases):
+            self._commands[key] = cmd
+        self._order.append(cmd)
+        self._help_cache.clear()
+    
+    def get(self, name: str) -> Optional[Command]:
+        """Look up a command by name or alias (case-insensitive)."""
+        return self._commands.get(name.lower())
+    
+    def __iter__(self) -> Iterator[Command]:
+        """Iterate over commands in registration order (aliases once)."""
+        return iter(self._order)
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def help_lines(self, width: int = 350) -> list[str]:
+        """
+        Build the !commands listing.
+        
+        Entries are packed into as few lines as possible so that the
+        listing costs little of the outbound line budget.
+        
+        Args:
+            width: Maximum characters per line
+        
+        Returns:
+            Lines of "!name usage: help" entries separated by " | "
+        """
+        cached = self._help_cache.get(width)
+        if cached is not None:
+            return cached
+        lines: list[str] = []
+        current = ""
+        for cmd in self._order:
+            entry = f"{cmd.name} {cmd.usage}".rstrip()
+            if cmd.help:
+                entry = f"{entry}: {cmd.help}"
+            if current and len(current) + 3 + len(entry) > width:
+                lines.append(current)
+                current = entry
+            else:
+                current = f"{current} | {entry}" if current else entry
+        if current:
+            lines.append(current)
+        self._help_cache[width] = lines
+        return lines
+    
+    async def dispatch(self, bot: "IRCBot", sender: str, reply_target: str, message: str,
+                       source: str = "", account: Optional[str] = None) -> bool:
+        """
+        Run the command named at the start of a message.
+        
+        Unknown commands, calls with the wrong number of arguments and
+        owner-only commands from anyone but the master are ignored. The
+        master is recognized by services account or prefix mask (see
+        IRCBot.is_owner), never by nick alone.
+        
+        Args:
+            bot: The IRCBot that received the message
+            sender: Nickname of the user who sent the message
+            reply_target: Where command output should go
+            message: The full message text including the ! prefix
+            source: The sender's nick!user@host, or "" if unknown
+            account: The sender's services account, or None if not logged
+                in (or not known)
+        
+        Returns:
+            True if a command handler was run
+        """
+        name, _, args = message.partition(" ")
+        cmd = self._commands.get(name.lower())
+        if cmd is None:
+            return False
+        
+        args = args.strip()
+        if not cmd.accepts(args):
+            return False
+        if cmd.owner_only and not bot.is_owner(source, account):
+            bot.logger.info(f"Ignoring owner-only {cmd.name} from {source or sender} (account: {account or 'none'})")
+            return False
+        
+        started = time.perf_counter()
+        try:
+            await cmd.handler(CommandContext(bot, sender, reply_target, name.lower(), args))
+        finally:
+            cmd.latency.observe(time.perf_counter() - started)
+        cmd.calls += 1
+        return True
+
+
+# The registry shared by every IRCBot instance, and its decorator
+COMMANDS = CommandRegistry()
+command = COMMANDS.command
+
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+# Commands are limited per nick, per host and per channel so that nobody can
+# spend the bot's outbound budget (and the master's notification copies) by
+# repeating them. Each limit keeps two integers per key and forgets the least
+# recently seen keys first, so memory stays bounded however many nicks pass.
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding-window event counts for many keys.
+    
+    Time is cut into fixed windows and each key keeps only the count of the
+    current and the previous window. The count over the last `window`
+    seconds is estimated as the current count plus the part of the previous
+    count that still overlaps the sliding window - exact when events are
+    spread evenly, and never more than one window's worth off.
+    
+    Keys are held in LRU order; once max_keys are tracked, adding a key
+    forgets the one seen longest ago.
+    
+    Example:
+        >>> counter = SlidingWindowCounter("nick", limit=5, window=30.0)
+        >>> counter.allows("alice", time.monotonic())
+        True
+    
+    Attributes:
+        scope: Name of what is being counted, e.g. "nick" (used in metrics)
+        limit: Events allowed per window; 0 or less means unlimited
+        window: Window length in seconds
+        max_keys: Most keys remembered at once
+        rejected: Events refused because their key was over the limit
+        evicted: Keys forgotten to stay within max_keys
+    """
+    
+    __slots__ = ("scope", "limit", "window", "max_keys", "rejected", "evicted", "_keys")
+    
+    def __init__(self, scope: str, limit: int, window: float, max_keys: int = 4096) -> None:
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.max_keys = max(1, max_keys)
+        self.rejected: int = 0
+        self.evicted: int = 0
+        # key -> [window number, previous window's count, current window's count]
+        self._keys: OrderedDict[str, list[int]] = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def _entry(self, key: str, now: float) -> list[int]:
+        """Fetch (or create) a key's counts, rolled forward to now."""
+        number = int(now // self.window)
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = [number, 0, 0]
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+                self.evicted += 1
+            return entry
+        self._keys.move_to_end(key)
+        if entry[0] != number:
+            entry[1] = entry[2] if entry[0] == number - 1 else 0
+            entry[2] = 0
+            entry[0] = number
+        return entry
+    
+    def _estimate(self, entry: list[int], now: float) -> float:
+        """Estimated events in the sliding window ending at now."""
+        overlap = 1.0 - (now / self.window - entry[0])
+        return entry[1] * overlap + entry[2]
+    
+    def allows(self, key: str, now: float) -> bool:
+        """
+        Check a key against the limit without counting an event.
+        
+        Args:
+            key: The nick, host or channel
+            now: Current time.monotonic()
+        
+        Returns:
+            True if one more event would stay within the limit
+        """
+        if self.limit <= 0:
+            return True
+        return self._estimate(self._entry(key, now), now) < self.limit
+    
+    def add(self, key: str, now: float) -> None:
+        """Count one event for a key."""
+        if self.limit > 0:
+            self._entry(key, now)[2] += 1
+
+
+class CommandRateLimiter:
+    """
+    Per-nick, per-host and per-channel command limits for one IRCBot.
+    
+    A command is allowed only if every applicable limit allows it, and is
+    then counted against all of them; a refused command counts against
+    none, so a nick that is being limited does not also use up its
+    channel's allowance.
+    
+    Attributes:
+        counters: The nick, host and channel SlidingWindowCounters, in the
+            order they are checked
+    """
+    
+    def __init__(self, config: BotConfig) -> None:
+        window = config.rate_limit_window
+        self.nick = SlidingWindowCounter("nick", config.nick_rate_limit, window, config.rate_limit_keys)
+        self.host = SlidingWindowCounter("host", config.host_rate_limit, window, config.rate_limit_keys)
+        self.channel = SlidingWindowCounter("channel", config.channel_rate_limit, window, config.rate_limit_keys)
+        self.counters: tuple[SlidingWindowCounter, ...] = (self.nick, self.host, self.channel)
+    
+    def check(self, nick: str, host: str, channel: str, now: Optional[float] = None) -> Optional[str]:
+        """
+        Decide whether a command may run, counting it if so.
+        
+        Args:
+            nick: Nickname of the sender
+            host: Hostname of the sender, or "" if unknown
+            channel: Channel the command was sent to, or "" for a private message
+            now: Current time.monotonic() (read if omitted)
+        
+        Returns:
+            None if the command is allowed, otherwise the scope ("nick",
+            "host" or "channel") whose limit it exceeded
+        """
+        if now is None:
+            now = time.monotonic()
+        keys = (nick.lower(), host, channel.lower())
+        for counter, key in zip(self.counters, keys):
+            if key and not counter.allows(key, now):
+                counter.rejected += 1
+                return counter.scope
+        for counter, key in zip(self.counters, keys):
+            if key:
+                counter.add(key, now)
+        return None
+
+
+# =============================================================================
+# COMMAND COALESCING
+# =============================================================================
+# When a link is pasted, several people often type the same command within
+# a second or two. The first one runs; identical ones (same place, same
+# command, same arguments) inside the coalescing window are dropped, since
+# the answer is already on its way to the same channel.
+
+# Most distinct (target, command, arguments) keys remembered at once
+COALESCE_MAX_KEYS = 1024
+
+
+class CommandCoalescer:
+    """
+    Recognizes repeats of a command inside a time window.
+    
+    The window starts at the first request, so a command that keeps being
+    repeated is still answered once per window. Keys are kept in the order
+    they started, which is also the order they expire in, so expired keys
+    are dropped from the front in amortized constant time; past max_keys
+    the oldest is dropped early.
+    
+    Example:
+        >>> coalescer = CommandCoalescer(window=2.0)
+        >>> coalescer.first("#avicbot", "!lang", "de?")
+        True
+        >>> coalescer.first("#avicbot", "!lang", "de?")
+        False
+    
+    Attributes:
+        window: Seconds during which repeats are dropped; 0 disables it
+        max_keys: Most keys remembered at once
+        suppressed: Repeats dropped
+        evicted: Keys dropped early to stay within max_keys
+    """
+    
+    __slots__ = ("window", "max_keys", "suppressed", "evicted", "_started")
+    
+    def __init__(self, window: float, max_keys: int = COALESCE_MAX_KEYS) -> None:
+        self.window = window
+        self.max_keys = max(1, max_keys)
+        self.suppressed: int = 0
+        self.evicted: int = 0
+        self._started: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._started)
+    
+    def first(self, target: str, name: str, args: str, now: Optional[float] = None) -> bool:
+        """
+        Record a request, telling whether it is the first in its window.
+        
+        Args:
+            target: Where the reply goes (channel, or nick for a private message)
+            name: The command's primary name, so aliases coalesce together
+            args: The arguments; runs of whitespace are treated as one space
+            now: Current time.monotonic() (read if omitted)
+        
+        Returns:
+            True if the command should run, False if it repeats one that
+            started less than window seconds ago
+        """
+        if self.window <= 0:
+            return True
+        if now is None:
+            now = time.monotonic()
+        started = self._started
+        while started:
+            oldest, at = next(iter(started.items()))
+            if now - at < self.window:
+                break
+            del started[oldest]
+        
+        key = (target.lower(), name, " ".join(args.split()))
+        if key in started:
+            self.suppressed += 1
+            return False
+        started[key] = now
+        if len(started) > self.max_keys:
+            started.popitem(last=False)
+            self.evicted += 1
+        return True
+
+
+# =============================================================================
+# CHANNEL MEMBERSHIP
+# =============================================================================
+# Who is in each channel, kept up to date from JOIN, PART, KICK, QUIT, NICK
+# and NAMES replies. Nicks are case-folded and interned, so a user in many
+# channels costs one string plus one set slot per channel. With the
+# extended-join and account-notify capabilities the services account of
+# each member is tracked too, and forgotten along with the nick.
+
+# Channel-status prefixes that may precede nicks in a NAMES reply
+NAMES_PREFIXES = "~&@%+"
+
+
+class MembershipTracker:
+    """
+    Members of every channel the bot is in.
+    
+    Each channel is a set of case-folded, interned nick keys; the nick as
+    last written by its owner is stored once, in a table shared by all
+    channels. A nick that is in no tracked channel is forgotten, and so is
+    its services account: a stale account must never outlive the user,
+    or whoever takes the nick next would inherit it.
+    
+    Example:
+        >>> members = MembershipTracker()
+        >>> members.joined("#avicbot")
+        >>> members.add_names("#avicbot", ["@Avicennasis", "+Someone"])
+        >>> members.channels_of("someone")
+        ['#avicbot']
+    """
+    
+    __slots__ = ("_channels", "_channel_names", "_nicks", "_accounts")
+    
+    def __init__(self) -> None:
+        # case-folded channel -> set of nick keys
+        self._channels: dict[str, set[str]] = {}
+        # case-folded channel -> channel name as the server spelled it
+        self._channel_names: dict[str, str] = {}
+        # nick key -> nick as last seen
+        self._nicks: dict[str, str] = {}
+        # nick key -> services account, for members known to be logged in
+        self._accounts: dict[str, str] = {}
+    
+    def __len__(self) -> int:
+        """Number of distinct nicks across all channels."""
+        return len(self._nicks)
+    
+    def _key(self, nick: str) -> str:
+        """Intern a nick and return its case-folded key."""
+        key = sys.intern(nick.lower())
+        if self._nicks.get(key) != nick:
+            self._nicks[key] = sys.intern(nick)
+        return key
+    
+    def _forget_if_gone(self, key: str) -> None:
+        for members in self._channels.values():
+            if key in members:
+                return
+        self._nicks.pop(key, None)
+        self._accounts.pop(key, None)
+    
+    def clear(self) -> None:
+        """Forget everything, e.g. when the connection is lost."""
+        self._channels.clear()
+        self._channel_names.clear()
+        self._nicks.clear()
+        self._accounts.clear()
+    
+    def joined(self, channel: str) -> None:
+        """Start tracking a channel the bot has just joined."""
+        folded = channel.lower()
+        self._channels[folded] = set()
+        self._channel_names[folded] = channel
+    
+    def left(self, channel: str) -> None:
+        """Stop tracking a channel the bot has left or been kicked from."""
+        folded = channel.lower()
+        members = self._channels.pop(folded, set())
+        self._channel_names.pop(folded, None)
+        for key in members:
+            self._forget_if_gone(key)
+    
+    def add(self, channel: str, nick: str) -> None:
+        """Record a nick joining a tracked channel."""
+        members = self._channels.get(channel.lower())
+        if members is not None:
+            members.add(self._key(nick))
+    
+    def add_names(self, channel: str, names: Iterable[str]) -> None:
+        """
+        Record the nicks of a NAMES reply (RPL_NAMREPLY).
+        
+        Args:
+            channel: The channel the reply is for
+            names: Entries such as "@nick", "+nick" or "nick!user@host"
+        """
+        members = self._channels.get(channel.lower())
+        if members is None:
+            return
+        for name in names:
+            nick = name.lstrip(NAMES_PREFIXES).partition("!")[0]
+            if nick:
+                members.add(self._key(nick))
+    
+    def remove(self, channel: str, nick: str) -> bool:
+        """
+        Record a nick leaving a channel.
+        
+        Returns:
+            True if the nick was a known member
+        """
+        members = self._channels.get(channel.lower())
+        key = nick.lower()
+        if members is None or key not in members:
+            return False
+        members.discard(key)
+        self._forget_if_gone(key)
+        return True
+    
+    def quit(self, nick: str) -> list[str]:
+        """
+        Remove a nick from every channel.
+        
+        Returns:
+            The channels it was in
+        """
+        key = nick.lower()
+        channels = [folded for folded, members in self._channels.items() if key in members]
+        for folded in channels:
+            self._channels[folded].discard(key)
+        self._nicks.pop(key, None)
+        self._accounts.pop(key, None)
+        return [self._channel_names[folded] for folded in channels]
+    
+    def rename(self, old: str, new: str) -> list[str]:
+        """
+        Follow a nick change in every channel.
+        
+        Returns:
+            The channels the nick is in
+        """
+        old_key = old.lower()
+        channels = [folded for folded, members in self._channels.items() if old_key in members]
+        self._nicks.pop(old_key, None)
+        account = self._accounts.pop(old_key, None)
+        new_key = self._key(new)
+        for folded in channels:
+            members = self._channels[folded]
+            members.discard(old_key)
+            members.add(new_key)
+        if account is not None and channels:
+            self._accounts[new_key] = account
+        return [self._channel_names[folded] for folded in channels]
+    
+    def set_account(self, nick: str, account: str) -> None:
+        """
+        Record the services account of a member (extended-join, ACCOUNT).
+        
+        Args:
+            nick: The member's nick; ignored unless it is in a tracked channel
+            account: The account name, or "*" for logged out
+        """
+        key = nick.lower()
+        if key not in self._nicks:
+            return
+        if account == "*":
+            self._accounts.pop(key, None)
+        else:
+            self._accounts[key] = account
+    
+    def account_of(self, nick: str) -> Optional[str]:
+        """The services account a member is logged in to, or None if not known."""
+        return self._accounts.get(nick.lower())
+    
+    def channels_of(self, nick: str) -> list[str]:
+        """Channels a nick is currently in."""
+        key = nick.lower()
+        return [self._channel_names[folded] for folded, members in self._channels.items() if key in members]
+    
+    def members(self, channel: str) -> list[str]:
+        """Nicks currently in a channel."""
+        return [self._nicks[key] for key in self._channels.get(channel.lower(), ())]
+
+
+# =============================================================================
+# CHANNEL JOINS
+# =============================================================================
+# Channels are joined several to a line ("JOIN #a,#b,#c keyA"), packed up
+# to the 512-byte limit, and paced by a token bucket counted in channels
+# rather than lines, since channels are what server join throttles count.
+# The server answers each channel with our JOIN echo or an error numeric;
+# channels it refused are tried again with exponential backoff.
+
+# Characters a channel name can start with
+CHANNEL_PREFIXES = "#&+!"
+
+# Why the server refused a channel, by numeric
+JOIN_FAILURES: dict[str, str] = {
+    "403": "no such channel",  # ERR_NOSUCHCHANNEL
+    "405": "joined too many channels",  # ERR_TOOMANYCHANNELS
+    "437": "temporarily unavailable",  # ERR_UNAVAILRESOURCE
+    "471": "channel is full",  # ERR_CHANNELISFULL
+    "473": "invite only",  # ERR_INVITEONLYCHAN
+    "474": "banned",  # ERR_BANNEDFROMCHAN
+    "475": "wrong key",  # ERR_BADCHANNELKEY
+    "477": "needs a registered nick",  # ERR_NEEDREGGEDNICK
+}
+
+
+def parse_channel(entry: str) -> tuple[str, str]:
+    """
+    Split a channel list entry into its name and key.
+    
+    Example:
+        >>> parse_channel("#secret hunter2")
+        ('#secret', 'hunter2')
+    
+    Args:
+        entry: "#channel", or "#channel key" for a keyed (+k) channel
+    
+    Returns:
+        The channel name and its key ("" for none)
+    """
+    name, _, key = entry.strip().partition(" ")
+    return name, key.strip()
+
+
+def join_lines(channels: Iterable[tuple[str, str]], max_bytes: int = IRC_MAX_LINE) -> list[str]:
+    """
+    Pack channels into as few JOIN lines as fit in max_bytes each.
+    
+    Keys are matched to channels by position, so within each line the
+    keyed channels come first.
+    
+    Example:
+        >>> join_lines([("#a", ""), ("#b", "key"), ("#c", "")])
+        ['JOIN #b,#a,#c key']
+    
+    Args:
+        channels: (name, key) pairs, key "" for none
+        max_bytes: Longest line, counting the CRLF
+    
+    Returns:
+        JOIN lines without CRLF
+    """
+    lines: list[str] = []
+    keyed: list[str] = []
+    keys: list[str] = []
+    unkeyed: list[str] = []
+    names_size = keys_size = 0  # Bytes of each comma-separated list
+    
+    for name, key in channels:
+        name_size = len(name.encode("utf-8"))
+        key_size = len(key.encode("utf-8"))
+        grown_names = names_size + name_size + (1 if keyed or unkeyed else 0)
+        grown_keys = keys_size + key_size + (1 if keys else 0) if key else keys_size
+        # "JOIN " names [" " keys] CRLF
+        if (keyed or unkeyed) and 5 + grown_names + (1 + grown_keys if grown_keys else 0) + 2 > max_bytes:
+            lines.append(f"JOIN {','.join(keyed + unkeyed)}" + (f" {','.join(keys)}" if keys else ""))
+            keyed, keys, unkeyed = [], [], []
+            grown_names, grown_keys = name_size, key_size
+        if key:
+            keyed.append(name)
+            keys.append(key)
+        else:
+            unkeyed.append(name)
+        names_size, keys_size = grown_names, grown_keys
+    if keyed or unkeyed:
+        lines.append(f"JOIN {','.join(keyed + unkeyed)}" + (f" {','.join(keys)}" if keys else ""))
+    return lines
+
+
+@dataclass
+class JoinFailure:
+    """
+    A channel the server refused, waiting to be tried again.
+    
+    Attributes:
+        name: The channel
+        key: Its key, or ""
+        reason: Why it was refused, e.g. "banned"
+        attempts: Consecutive refusals so far
+        retry_at: Monotonic time of the next attempt
+    """
+    name: str
+    key: str
+    reason: str
+    attempts: int
+    retry_at: float
+
+
+class ChannelJoiner:
+    """
+    Queues, paces and tracks the channel joins of one connection.
+    
+    Channels wait in a queue until start() is called (once registration is
+    done); after that take() hands out JOIN lines for as many channels as
+    the token bucket allows. Every channel sent is pending until the
+    server confirms it (confirmed()) or refuses it (failed()), and refused
+    channels are queued again after their backoff.
+    
+    Example:
+        >>> joiner = ChannelJoiner(rate=2.0, burst=20)
+        >>> joiner.reset({"#avicbot": "", "#secret": "hunter2"})
+        >>> joiner.start()
+        >>> joiner.take(time.monotonic())
+        (['JOIN #secret,#avicbot hunter2'], None)
+    
+    Attributes:
+        rate: Channels joined per second, sustained; 0 disables pacing
+        burst: Channels that may be joined at once
+        retry_delay: Backoff in seconds before the first retry
+        retry_max_delay: Longest backoff between retries
+        pending: Channels sent and not yet answered (lowercase -> name)
+        joined: Channels the server confirmed (lowercase -> name)
+        failures: Channels refused and not joined since (lowercase ->
+            failure); those whose retry is due are queued again
+        lines_sent: JOIN lines handed out by take()
+        channels_sent: Channels in those lines
+        refused: Refusals received in total
+    """
+    
+    def __init__(self, rate: float = 2.0, burst: int = 20, retry_delay: float = 60.0,
+                 retry_max_delay: float = 3600.0) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.pending: dict[str, str] = {}
+        self.joined: dict[str, str] = {}
+        self.failures: dict[str, JoinFailure] = {}
+        self.lines_sent = 0
+        self.channels_sent = 0
+        self.refused = 0
+        self._queue: dict[str, tuple[str, str]] = {}
+        self._keys: dict[str, str] = {}
+        self._started = False
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._wakeup = asyncio.Event()
+    
+    @property
+    def done(self) -> bool:
+        """True once every channel has been answered, joined or refused."""
+        return self._started and not self._queue and not self.pending
+    
+    def reset(self, channels: dict[str, str], joined: bool = False) -> None:
+        """
+        Start over for a new connection, with every channel queued.
+        
+        Args:
+            channels: Channel name to key ("" for none)
+            joined: The channels are already joined (a resumed session)
+        """
+        self.pending.clear()
+        self.joined.clear()
+        self.failures.clear()
+        self._queue.clear()
+        self._keys.clear()
+        self._started = joined
+        self._tokens = float(self.burst)
+        for name, key in channels.items():
+            self._keys[name.lower()] = key
+            if joined:
+                self.joined[name.lower()] = name
+            else:
+                self._queue[name.lower()] = (name, key)
+    
+    def start(self) -> None:
+        """Allow queued channels to be joined."""
+        self._started = True
+        self._wakeup.set()
+    
+    def add(self, name: str, key: str = "") -> None:
+        """Queue a channel, unless it is already joined or on its way."""
+        folded = name.lower()
+        self._keys[folded] = key
+        if folded in self.joined or folded in self.pending:
+            return
+        self._queue[folded] = (name, key)
+        self._wakeup.set()
+    
+    def take(self, now: float) -> tuple[list[str], Optional[float]]:
+        """
+        JOIN lines for the channels that may be joined now.
+        
+        Args:
+            now: The current time.monotonic()
+        
+        Returns:
+            The lines to send, and seconds until take() may have more
+            (None: nothing is waiting)
+        """
+        for folded, failure in self.failures.items():
+            if failure.retry_at <= now and folded not in self.pending and folded not in self._queue:
+                self._queue[folded] = (failure.name, failure.key)
+        if not self._started:
+            return [], None
+        
+        lines: list[str] = []
+        # Once the burst is spent, wait for half a burst of tokens rather
+        # than sending a line per token: the same rate in fewer, fuller lines
+        wanted = min(len(self._queue), max(1, self.burst // 2))
+        if self._queue:
+            if self.rate > 0:
+                self._tokens = min(float(self.burst), self._tokens + (now - self._refilled) * self.rate)
+                count = min(int(self._tokens), len(self._queue)) if self._tokens >= wanted else 0
+                self._tokens -= count
+            else:
+                count = len(self._queue)
+            self._refilled = now
+            batch = list(itertools.islice(self._queue.items(), count))
+            for folded, (name, _) in batch:
+                del self._queue[folded]
+                self.pending[folded] = name
+            lines = join_lines(channel for _, channel in batch)
+            self.lines_sent += len(lines)
+            self.channels_sent += count
+        
+        # Without a rate the whole queue was taken above
+        if self._queue and self.rate > 0:
+            return lines, max(0.0, (min(len(self._queue), max(1, self.burst // 2)) - self._tokens) / self.rate)
+        retries = [failure.retry_at for folded, failure in self.failures.items() if folded not in self.pending]
+        if retries:
+            return lines, max(0.0, min(retries) - now)
+        return lines, None
+    
+    def confirmed(self, name: str) -> bool:
+        """Record our JOIN echo; returns True if the channel was pending."""
+        folded = name.lower()
+        self.joined[folded] = name
+        self.failures.pop(folded, None)
+        return self.pending.pop(folded, None) is not None
+    
+    def failed(self, name: str, reason: str, now: float) -> Optional[JoinFailure]:
+        """
+        Record the server refusing a pending channel, and schedule a retry.
+        
+        Args:
+            name: The channel from the error numeric
+            reason: Why it was refused
+            now: The current time.monotonic()
+        
+        Returns:
+            The failure with its retry time, or None if the channel was not
+            pending (an error for a JOIN someone else asked for)
+        """
+        folded = name.lower()
+        if self.pending.pop(folded, None) is None:
+            return None
+        self.refused += 1
+        previous = self.failures.get(folded)
+        attempts = previous.attempts + 1 if previous is not None else 1
+        delay = min(self.retry_max_delay, self.retry_delay * 2 ** min(attempts - 1, 16))
+        failure = self.failures[folded] = JoinFailure(name, self._keys.get(folded, ""), reason, attempts,
+                                                      now + delay)
+        self._wakeup.set()
+        return failure
+    
+    def left(self, name: str) -> None:
+        """Forget a channel we parted or were kicked from."""
+        self.joined.pop(name.lower(), None)
+    
+    async def wait(self, timeout: Optional[float]) -> None:
+        """Sleep until timeout, or until a channel is queued or refused."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+
+# =============================================================================
+# SEEN INDEX
+# =============================================================================
+# The last thing each nick was seen doing, persisted in SQLite so that !seen
+# survives restarts. Events are collected in a dictionary on the event loop
+# (a busy talker overwrites their own entry) and handed to a writer thread
+# in batches, so the database is never touched by the read loop.
+
+# Seconds between batches handed to the writer thread
+SEEN_FLUSH_SECONDS = 2.0
+
+# Pending records that trigger an early flush
+SEEN_MAX_PENDING = 1000
+
+# Longest message text stored with a "message" record
+SEEN_DETAIL_LENGTH = 200
+
+_SEEN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    network TEXT NOT NULL,
+    nick TEXT NOT NULL,
+    display TEXT NOT NULL,
+    event TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    detail TEXT NOT NULL,
+    at REAL NOT NULL,
+    PRIMARY KEY (network, nick)
+) WITHOUT ROWID
+"""
+
+
+@dataclass
+class SeenRecord:
+    """
+    The last thing a nick was seen doing.
+    
+    Attributes:
+        nick: The nick as it was written
+        event: "message", "join", "part", "quit", "nick" or "kick"
+        channel: Channel the event happened in, or "" (quit, nick)
+        detail: Message text, part/quit/kick reason, or the new nick
+        at: Wall-clock time of the event (time.time())
+    """
+    nick: str
+    event: str
+    channel: str
+    detail: str
+    at: float
+    
+    def describe(self) -> str:
+        """Describe the event, e.g. "in #avicbot, saying: hello"."""
+        reason = f" ({self.detail})" if self.detail else ""
+        if self.event == "message":
+            return f"in {self.channel}, saying: {self.detail}"
+        if self.event == "join":
+            return f"joining {self.channel}"
+        if self.event == "part":
+            return f"leaving {self.channel}{reason}"
+        if self.event == "kick":
+            return f"being kicked from {self.channel}{reason}"
+        if self.event == "nick":
+            return f"changing nick to {self.detail}"
+        return f"quitting{reason}"
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as its two largest units, e.g. "3d 4h" or "12s"."""
+    seconds = max(0, int(seconds))
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        if seconds >= size or (unit == "s" and not parts):
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return " ".join(parts[:2])
+
+
+class SeenIndex:
+    """
+    Persistent last-seen index for one network.
+    
+    record() only updates an in-memory dictionary. Every SEEN_FLUSH_SECONDS
+    (or once SEEN_MAX_PENDING nicks are waiting) the dictionary is handed
+    to a writer thread, which stores each batch in one SQLite transaction.
+    The database uses write-ahead logging, so lookups never wait for a
+    write, and several networks or worker processes can share one file.
+    
+    Example:
+        >>> seen = SeenIndex("avicbot_seen.db", "libera")
+        >>> await seen.open()
+        >>> seen.record("Someone", "message", "#avicbot", "hello")
+        >>> (await seen.lookup("someone")).describe()
+        'in #avicbot, saying: hello'
+    
+    Attributes:
+        path: SQLite database file
+        network: Network name the records are stored under
+        records_written: Records committed to the database so far
+    """
+    
+    def __init__(self, path: str, network: str, flush_interval: float = SEEN_FLUSH_SECONDS,
+                 max_pending: int = SEEN_MAX_PENDING) -> None:
+        self.path = path
+        self.network = network
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.records_written: int = 0
+        # nick key -> (nick, event, channel, detail, at), not yet handed over
+        self._pending: dict[str, tuple[str, str, str, str, float]] = {}
+        # Batches handed to the writer thread but not yet committed
+        self._unwritten: deque[dict[str, tuple]] = deque()
+        self._unwritten_lock = threading.Lock()
+        self._batches: queue.Queue[Optional[dict[str, tuple]]] = queue.Queue()
+        self._reader: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._flusher: Optional[asyncio.Task] = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def _create(self) -> sqlite3.Connection:
+        writer = self._connect()
+        with writer:
+            writer.execute(_SEEN_SCHEMA)
+        self._reader = self._connect()
+        return writer
+    
+    async def open(self) -> None:
+        """
+        Open (creating if needed) the database and start the writer.
+        
+        Raises:
+            sqlite3.Error: If the database cannot be opened
+        """
+        writer = await asyncio.to_thread(self._create)
+        self._thread = threading.Thread(
+            target=self._write_batches, args=(writer,), name=f"seen-{self.network}", daemon=True
+        )
+        self._thread.start()
+        self._flusher = asyncio.create_task(self._flush_periodically())
+    
+    def record(self, nick: str, event: str, channel: str = "", detail: str = "") -> None:
+        """
+        Note what a nick was just seen doing.
+        
+        Args:
+            nick: The nick
+            event: "message", "join", "part", "quit", "nick" or "kick"
+            channel: Channel the event happened in, if any
+            detail: Message text, reason, or new nick
+        """
+        self._pending[nick.lower()] = (nick, event, channel, detail[:SEEN_DETAIL_LENGTH], time.time())
+        if len(self._pending) >= self.max_pending:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Hand the pending records to the writer thread."""
+        if not self._pending or self._thread is None:
+            return
+        batch, self._pending = self._pending, {}
+        with self._unwritten_lock:
+            self._unwritten.append(batch)
+        self._batches.put(batch)
+    
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+    
+    def _write_batches(self, conn: sqlite3.Connection) -> None:
+        """Writer thread: commit batches until the None sentinel arrives."""
+        stopping = False
+        while not stopping:
+            batches = [self._batches.get()]
+            # Whatever else is already waiting goes into the same transaction
+            while True:
+                try:
+                    batches.append(self._batches.get_nowait())
+                except queue.Empty:
+                    break
+            if batches[-1] is None:
+                batches.pop()
+                stopping = True
+            if not batches:
+                continue
+            merged: dict[str, tuple] = {}
+            for batch in batches:
+                merged.update(batch)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO seen VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(self.network, key, *values) for key, values in merged.items()],
+                    )
+                self.records_written += len(merged)
+            except sqlite3.Error as e:
+                logger.error(f"Could not save {len(merged)} seen record(s): {e}")
+            finally:
+                with self._unwritten_lock:
+                    for _ in batches:
+                        self._unwritten.popleft()
+        conn.close()
+    
+    def _lookup(self, key: str) -> Optional[tuple]:
+        """Thread-side lookup: uncommitted batches first, then the database."""
+        with self._unwritten_lock:
+            for batch in reversed(self._unwritten):
+                if key in batch:
+                    return batch[key]
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT display, event, channel, detail, at FROM seen WHERE network = ? AND nick = ?",
+                (self.network, key),
+            ).fetchone()
+        return row
+    
+    async def lookup(self, nick: str) -> Optional[SeenRecord]:
+        """
+        Find the last thing a nick was seen doing.
+        
+        Args:
+            nick: The nick to look up (case-insensitive)
+        
+        Returns:
+            The most recent SeenRecord, or None if the nick was never seen
+        """
+        key = nick.lower()
+        values = self._pending.get(key)
+        if values is None:
+            if self._reader is None:
+                return None
+            values = await asyncio.to_thread(self._lookup, key)
+        return SeenRecord(*values) if values else None
+    
+    async def close(self) -> None:
+        """Write everything still pending and stop the writer thread."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._thread is not None:
+            self.flush()
+            self._batches.put(None)
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+# =============================================================================
+# OWNER NOTIFICATIONS
+# =============================================================================
+# Commands such as !say and !guc tell the bot owner what they did. Sent one
+# by one, those copies double the bot's output and flood the owner's query
+# window, so they are gathered into a periodic digest instead, with repeats
+# of the same notification counted rather than sent again.
+
+# Widest digest line, in characters, before entries continue on a new line
+DIGEST_LINE_WIDTH = 350
+
+
+class NotificationDigest:
+    """
+    Owner notifications waiting to be sent as one digest.
+    
+    Notifications are keyed by (command, target, text); repeats only raise
+    the count. The digest is sent every `interval` seconds, or as soon as
+    `max_entries` distinct notifications are waiting, whichever is first.
+    
+    Example:
+        >>> digest = NotificationDigest(interval=300, max_entries=50)
+        >>> digest.add("!say", "#avicbot", "Message sent: hi")
+        False
+        >>> digest.add("!say", "#avicbot", "Message sent: hi")
+        False
+        >>> digest.drain()
+        ['Digest of 2 notification(s): [#avicbot] !say Message sent: hi (x2)']
+    
+    Attributes:
+        interval: Seconds between digests; 0 or less sends every
+            notification immediately
+        max_entries: Distinct notifications that trigger an early digest
+        notifications: Notifications received, digested or not
+        lines_sent: Digest lines produced by drain()
+    """
+    
+    def __init__(self, interval: float, max_entries: int) -> None:
+        self.interval = interval
+        self.max_entries = max(1, max_entries)
+        self.notifications: int = 0
+        self.lines_sent: int = 0
+        self._entries: dict[tuple[str, str, str], int] = {}
+        self._pending: int = 0
+    
+    def __len__(self) -> int:
+        """Number of distinct notifications waiting."""
+        return len(self._entries)
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether notifications are batched at all."""
+        return self.interval > 0
+    
+    def add(self, command: str, target: str, text: str) -> bool:
+        """
+        Queue a notification for the next digest.
+        
+        Args:
+            command: Command that caused it, e.g. "!guc"
+            target: Channel (or nick) the command was used in
+            text: The notification text
+        
+        Returns:
+            True if the digest is now full and should be sent
+        """
+        key = (command, target, text)
+        self._entries[key] = self._entries.get(key, 0) + 1
+        self._pending += 1
+        self.notifications += 1
+        return len(self._entries) >= self.max_entries
+    
+    def drain(self, width: int = DIGEST_LINE_WIDTH) -> list[str]:
+        """
+        Build the digest lines and clear the waiting notifications.
+        
+        Args:
+            width: Characters per line before entries wrap to the next
+        
+        Returns:
+            Digest lines, or an empty list if nothing is waiting
+        """
+        if not self._entries:
+            return []
+        lines: list[str] = []
+        current = ""
+        for (command, target, text), count in self._entries.items():
+            entry = f"[{target}] {command} {text}"
+            if count > 1:
+                entry = f"{entry} (x{count})"
+            if current and len(current) + 3 + len(entry) > width:
+                lines.append(current)
+                current = entry
+            else:
+                current = f"{current} | {entry}" if current else entry
+        lines.append(current)
+        lines[0] = f"Digest of {self._pending} notification(s): {lines[0]}"
+        self._entries.clear()
+        self._pending = 0
+        self.lines_sent += len(lines)
+        return lines
+
+
+# =============================================================================
+# METRICS
+# =============================================================================
+# Optional Prometheus-format metrics served over plain HTTP. When
+# AVICBOT_METRICS_PORT is unset, IRCBot.metrics is None and every hot-path
+# hook reduces to a single "is not None" check.
+
+# Histogram buckets for per-line parse time, which is measured in microseconds
+PARSE_BUCKETS: tuple[float, ...] = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 1e-3)
+
+# Seconds between server lag probes while metrics are enabled
+LAG_PROBE_SECONDS = 30.0
+
+
+class BotMetrics:
+    """
+    Counters and histograms for one IRCBot connection.
+    
+    Attributes:
+        lines_received: Inbound lines framed from the socket
+        lines_queued: Outbound lines handed to send_raw()
+        commands: Commands dispatched through handle_command()
+        parse_latency: Time spent parsing each inbound line
+        dispatch_latency: Time handlers waited in the dispatcher before running
+        server_lag: Round-trip time of the last PING/PONG lag probe, in seconds
+    """
+    
+    __slots__ = ("lines_received", "lines_queued", "commands",
+                 "parse_latency", "dispatch_latency", "server_lag")
+    
+    def __init__(self) -> None:
+        self.lines_received: int = 0
+        self.lines_queued: int = 0
+        self.commands: int = 0
+        self.parse_latency = LatencyHistogram(PARSE_BUCKETS)
+        self.dispatch_latency = LatencyHistogram()
+        self.server_lag: float = 0.0
+
+
+class EventLoopMonitor:
+    """
+    Measures event-loop lag: how late a periodic timer actually fires.
+    
+    A loop that is blocked by slow synchronous code (or simply overloaded)
+    wakes the monitor late; the overshoot is the lag every other task saw.
+    
+    Attributes:
+        lag: Most recent lag measurement in seconds
+        latency: Histogram of all lag measurements
+    """
+    
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.lag: float = 0.0
+        self.latency = LatencyHistogram()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start sampling on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    def stop(self) -> None:
+        """Stop sampling."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            self.latency.observe(self.lag)
+
+
+def _prometheus_label(name: str, value: str) -> str:
+    """A name="value" label, with the value escaped for the text format."""
+    value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{name}="{value}"'
+
+
+def _prometheus_histogram(lines: list[str], name: str, labels: str,
+                          histogram: LatencyHistogram) -> None:
+    """Append the _bucket/_sum/_count samples of one histogram."""
+    separator = "," if labels else ""
+    suffix = f"{{{labels}}}" if labels else ""
+    cumulative = histogram.cumulative()
+    for bound, count in zip(histogram.buckets, cumulative):
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound:g}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {cumulative[-1]}')
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.9f}")
+    lines.append(f"{name}_count{suffix} {histogram.total}")
+
+
+def render_metrics(bots: list["IRCBot"], loop_monitor: Optional[EventLoopMonitor] = None) -> str:
+    """
+    Render metrics for a set of bots in the Prometheus text format.
+    
+    Args:
+        bots: Bots to include; each is labelled with its network name
+        loop_monitor: Optional event-loop lag monitor for the process
+    
+    Returns:
+        The exposition text, ending with a newline
+    """
+    lines: list[str] = []
+    
+    def header(name: str, kind: str, text: str) -> None:
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+    
+    def network(bot: "IRCBot") -> str:
+        return _prometheus_label("network", bot.config.name or bot.config.server)
+    
+    def per_bot(name: str, kind: str, text: str, value: Callable[["IRCBot"], float]) -> None:
+        header(name, kind, text)
+        for bot in bots:
+            lines.append(f'{name}{{{network(bot)}}} {value(bot):g}')
+    
+    measured = [bot for bot in bots if bot.metrics is not None]
+    per_bot("avicbot_lines_received_total", "counter", "Inbound IRC lines received.",
+            lambda b: b.metrics.lines_received if b.metrics else 0)
+    per_bot("avicbot_lines_queued_total", "counter", "Outbound IRC lines queued by send_raw.",
+            lambda b: b.metrics.lines_queued if b.metrics else 0)
+    per_bot("avicbot_lines_sent_total", "counter", "Outbound IRC lines written to the socket.",
+            lambda b: b.send_queue.sent_lines if b.send_queue else 0)
+    per_bot("avicbot_commands_total", "counter", "Bot commands dispatched.",
+            lambda b: b.metrics.commands if b.metrics else 0)
+    per_bot("avicbot_send_queue_depth", "gauge", "Outbound lines waiting in the send queue.",
+            lambda b: b.send_queue.depth if b.send_queue else 0)
+    per_bot("avicbot_send_queue_wait_seconds", "gauge", "Time-in-queue of the last line sent.",
+            lambda b: b.send_queue.last_wait if b.send_queue else 0)
+    per_bot("avicbot_reconnects_total", "counter", "Connections re-established after a loss.",
+            lambda b: b.reconnects)
+    per_bot("avicbot_connected", "gauge", "Whether the bot is connected (1) or not (0).",
+            lambda b: 1 if b.writer is not None else 0)
+    per_bot("avicbot_channels", "gauge", "Channels the bot is configured to be in.",
+            lambda b: len(b.channels))
+    per_bot("avicbot_channels_joined", "gauge", "Channels the server confirmed joining.",
+            lambda b: len(b.joiner.joined))
+    per_bot("avicbot_join_refusals_total", "counter", "Channel joins refused by the server.",
+            lambda b: b.joiner.refused)
+    per_bot("avicbot_owner_notifications_total", "counter", "Notifications for the bot owner.",
+            lambda b: b.digest.notifications)
+    per_bot("avicbot_owner_digest_lines_total", "counter", "Digest lines sent to the bot owner.",
+            lambda b: b.digest.lines_sent)
+    per_bot("avicbot_known_nicks", "gauge", "Distinct nicks in the bot's channels.",
+            lambda b: len(b.members))
+    per_bot("avicbot_seen_records_written_total", "counter", "Records saved to the !seen database.",
+            lambda b: b.seen.records_written if b.seen else 0)
+    per_bot("avicbot_server_lag_seconds", "gauge", "Round-trip time of the last PING lag probe.",
+            lambda b: b.metrics.server_lag if b.metrics else 0)
+    per_bot("avicbot_connect_seconds", "gauge", "Time from connecting to having joined every channel.",
+            lambda b: b.connect_seconds)
+    
+    header("avicbot_rate_limited_total", "counter", "Commands dropped by a rate limit, per scope.")
+    for bot in bots:
+        for counter in bot.rate_limiter.counters:
+            lines.append(f'avicbot_rate_limited_total{{{network(bot)},scope="{counter.scope}"}} {counter.rejected}')
+    header("avicbot_rate_limit_keys", "gauge", "Nicks, hosts or channels tracked per rate limit.")
+    for bot in bots:
+        for counter in bot.rate_limiter.counters:
+            lines.append(f'avicbot_rate_limit_keys{{{network(bot)},scope="{counter.scope}"}} {len(counter)}')
+    
+    per_bot("avicbot_commands_coalesced_total", "counter", "Repeated commands dropped by coalescing.",
+            lambda b: b.coalescer.suppressed)
+    per_bot("avicbot_coalesce_keys", "gauge", "Recent commands remembered for coalescing.",
+            lambda b: len(b.coalescer))
+    
+    header("avicbot_parse_seconds", "histogram", "Time spent parsing one inbound line.")
+    for bot in measured:
+        _prometheus_histogram(lines, "avicbot_parse_seconds", network(bot), bot.metrics.parse_latency)
+    header("avicbot_dispatch_wait_seconds", "histogram", "Time handlers waited before running.")
+    for bot in measured:
+        _prometheus_histogram(lines, "avicbot_dispatch_wait_seconds", network(bot), bot.metrics.dispatch_latency)
+    
+    # Commands live in the shared registry, so these are per process
+    registry = bots[0].commands if bots else COMMANDS
+    header("avicbot_command_invocations_total", "counter", "Invocations per bot command.")
+    for cmd in registry:
+        lines.append(f'avicbot_command_invocations_total{{{_prometheus_label("command", cmd.name)}}} {cmd.calls}')
+    header("avicbot_command_seconds", "histogram", "Run time per bot command.")
+    for cmd in registry:
+        _prometheus_histogram(lines, "avicbot_command_seconds", _prometheus_label("command", cmd.name), cmd.latency)
+    
+    # The HTTP client is shared too
+    http = bots[0].http if bots else None
+    if http is not None:
+        for name, text, value in (
+            ("avicbot_http_requests_total", "HTTP requests sent.", http.requests),
+            ("avicbot_http_connections_total", "HTTP connections opened.", http.connections),
+            ("avicbot_http_errors_total", "HTTP requests that failed.", http.errors),
+            ("avicbot_http_cache_hits_total", "HTTP lookups answered from the cache.", http.cache_hits),
+            ("avicbot_http_coalesced_total", "HTTP lookups that joined a fetch in flight.", http.coalesced),
+        ):
+            header(name, "counter", text)
+            lines.append(f"{name} {value}")
+    
+    if loop_monitor is not None:
+        header("avicbot_event_loop_lag_seconds", "gauge", "Most recent event-loop lag sample.")
+        lines.append(f"avicbot_event_loop_lag_seconds {loop_monitor.lag:.6f}")
+        header("avicbot_event_loop_lag", "histogram", "Event-loop lag samples in seconds.")
+        _prometheus_histogram(lines, "avicbot_event_loop_lag", "", loop_monitor.latency)
+    
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Minimal asyncio HTTP server exposing GET /metrics.
+    
+    Example:
+        >>> server = MetricsServer(bots, "127.0.0.1", 9108)
+        >>> await server.start()
+    
+    Attributes:
+        bots: The bots whose metrics are served
+        host: Interface to listen on
+        port: TCP port to listen on (the bound port after start())
+        loop_monitor: Event-loop lag monitor started alongside the server
+    """
+    
+    def __init__(self, bots: list["IRCBot"], host: str = "127.0.0.1", port: int = 9108) -> None:
+        self.bots = bots
+        self.host = host
+        self.port = port
+        self.loop_monitor = EventLoopMonitor()
+        self._server: Optional[asyncio.AbstractServer] = None
+    
+    async def start(self) -> None:
+        """Start listening and sampling event-loop lag."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.loop_monitor.start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self) -> None:
+        """Stop listening."""
+        self.loop_monitor.stop()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the request headers
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = render_metrics(self.bots, self.loop_monitor).encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+
+# =============================================================================
+# HTTP CLIENT
+# =============================================================================
+# A small asyncio HTTP/1.1 client for JSON APIs, shared by every bot in the
+# process. Connections are kept alive and reused per host, a semaphore caps
+# the requests in flight to each host, successful responses are kept in a
+# bounded TTL/LRU cache, and concurrent requests for the same URL share a
+# single fetch (single-flight), so a burst of identical lookups costs one
+# round trip.
+
+# Seconds allowed for one request, including connecting
+HTTP_TIMEOUT = 5.0
+
+# Requests in flight to one host at once
+HTTP_PER_HOST = 4
+
+# Idle keep-alive connections kept per host, and for how long
+HTTP_MAX_IDLE = 4
+HTTP_IDLE_SECONDS = 30.0
+
+# Responses kept in the cache, least recently used dropped first
+HTTP_CACHE_ENTRIES = 1024
+
+# Largest response body accepted, in bytes
+HTTP_MAX_BODY = 1 << 20
+
+# Wikimedia asks API clients to identify themselves
+HTTP_USER_AGENT = "AvicBotIRC (https://github.com/Avicennasis/AvicBotIRC)"
+
+
+class HTTPClient:
+    """
+    Keep-alive HTTP client with per-host limits, caching and single-flight.
+    
+    Example:
+        >>> http = HTTPClient()
+        >>> data = await http.get_json("https://meta.wikimedia.org/w/api.php?...", ttl=300)
+        >>> await http.close()
+    
+    Attributes:
+        per_host: Requests allowed in flight to one host at once
+        timeout: Seconds allowed for one request
+        requests: Requests sent
+        connections: Connections opened
+        reused: Requests sent on a kept-alive connection
+        cache_hits: get_json() calls answered from the cache
+        coalesced: get_json() calls that joined a fetch already in flight
+        errors: Requests that failed
+    """
+    
+    def __init__(self, per_host: int = HTTP_PER_HOST, timeout: float = HTTP_TIMEOUT,
+                 cache_entries: int = HTTP_CACHE_ENTRIES) -> None:
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self.requests: int = 0
+        self.connections: int = 0
+        self.reused: int = 0
+        self.cache_hits: int = 0
+        self.coalesced: int = 0
+        self.errors: int = 0
+        self._idle: dict[tuple[str, str, int], list[tuple[asyncio.StreamReader, asyncio.StreamWriter, float]]] = {}
+        self._limits: dict[tuple[str, str, int], asyncio.Semaphore] = {}
+        self._cache: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._ssl: Optional[ssl.SSLContext] = None
+    
+    async def get_json(self, url: str, ttl: float = 0.0) -> Any:
+        """
+        GET a URL and decode its JSON body, through the cache.
+        
+        Args:
+            url: The http:// or https:// URL
+            ttl: Seconds to cache the result for (0: do not cache)
+        
+        Returns:
+            The decoded JSON value
+        
+        Raises:
+            RuntimeError: If the request failed or the body is not JSON
+        """
+        cached = self._cache.get(url)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(url)
+                self.cache_hits += 1
+                return cached[1]
+            del self._cache[url]
+        
+        # The fetch runs in a task of its own, so one caller timing out
+        # does not cancel it for the others
+        task = self._inflight.get(url)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._fetch_json(url, ttl))
+            self._inflight[url] = task
+            task.add_done_callback(lambda done: self._fetched(url, done))
+        return await asyncio.shield(task)
+    
+    def _fetched(self, url: str, task: asyncio.Task) -> None:
+        """Forget a finished fetch, marking its error as retrieved."""
+        if self._inflight.get(url) is task:
+            del self._inflight[url]
+        if not task.cancelled():
+            task.exception()
+    
+    async def _fetch_json(self, url: str, ttl: float) -> Any:
+        body = await self.get(url)
+        try:
+            value = json.loads(body)
+        except ValueError as e:
+            self.errors += 1
+            raise RuntimeError(f"GET {url}: invalid JSON: {e}") from e
+        if ttl > 0:
+            self._cache[url] = (time.monotonic() + ttl, value)
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return value
+    
+    async def get(self, url: str) -> bytes:
+        """
+        GET a URL, waiting for a slot under the host's limit.
+        
+        Args:
+            url: The http:// or https:// URL
+        
+        Returns:
+            The response body
+        
+        Raises:
+            RuntimeError: If the request failed or the status was not 200
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise RuntimeError(f"unsupported URL: {url}")
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.per_host)
+        async with limit:
+            self.requests += 1
+            try:
+                status, body = await asyncio.wait_for(self._request(key, parts.netloc, path), self.timeout)
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.errors += 1
+                raise RuntimeError(f"GET {url} failed: {e!r}") from e
+        if status != 200:
+            self.errors += 1
+            raise RuntimeError(f"GET {url}: HTTP {status}")
+        return body
+    
+    async def _request(self, key: tuple[str, str, int], netloc: str, path: str) -> tuple[int, bytes]:
+        """Send one request, on an idle connection if there is one."""
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {netloc}\r\n"
+            f"User-Agent: {HTTP_USER_AGENT}\r\n"
+            f"Accept: application/json\r\n\r\n"
+        ).encode("latin-1")
+        
+        while True:
+            connection = self._checkout(key)
+            reused = connection is not None
+            if connection is None:
+                scheme, host, port = key
+                if scheme == "https" and self._ssl is None:
+                    self._ssl = ssl.create_default_context()
+                connection = await asyncio.open_connection(host, port, ssl=self._ssl if scheme == "https" else None)
+                self.connections += 1
+            else:
+                self.reused += 1
+            reader, writer = connection
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive, body = await self._read_response(reader)
+            except (ConnectionError, EOFError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue  # The server closed the idle connection; use a new one
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._checkin(key, reader, writer)
+            else:
+                writer.close()
+            return status, body
+    
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> tuple[int, bool, bytes]:
+        """Read a status line, headers and body; returns (status, keep-alive, body)."""
+        status_line = await reader.readline()
+        if not status_line:
+            raise EOFError("connection closed before the response")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n"):
+            if not line:
+                raise EOFError("connection closed in the headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while size := int((await reader.readline()).split(b";")[0], 16):
+                if len(body) + size > HTTP_MAX_BODY:
+                    raise ValueError("response too large")
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # Trailers
+            return int(status), keep_alive, bytes(body)
+        if "content-length" in headers:
+            length = int(headers["content-length"])
+            if length > HTTP_MAX_BODY:
+                raise ValueError("response too large")
+            return int(status), keep_alive, await reader.readexactly(length)
+        # No length: the body runs until the server closes the connection
+        return int(status), False, await reader.read(HTTP_MAX_BODY)
+    
+    def _checkout(self, key: tuple[str, str, int]) -> Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+        """An idle connection to the host that is still usable, if any."""
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            reader, writer, since = idle.pop()
+            if now - since < HTTP_IDLE_SECONDS and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+    
+    def _checkin(self, key: tuple[str, str, int], reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter) -> None:
+        """Keep a connection for reuse, or close it if enough are idle."""
+        idle = self._idle.setdefault(key, [])
+        if len(idle) >= HTTP_MAX_IDLE:
+            writer.close()
+            return
+        idle.append((reader, writer, time.monotonic()))
+    
+    async def close(self) -> None:
+        """Cancel fetches in flight and close every idle connection."""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+        for idle in self._idle.values():
+            for _, writer, _ in idle:
+                writer.close()
+        self._idle.clear()
+
+
+# =============================================================================
+# WIKIMEDIA ACCOUNTS
+# =============================================================================
+# !guc and !cauth can add a one-line summary of the global account (edit
+# count, global groups, lock and global block status) fetched from the
+# MediaWiki API of the network's configured wiki.
+
+def account_info_url(api: str, username: str) -> str:
+    """
+    MediaWiki API URL for a global account's info and global blocks.
+    
+    Args:
+        api: The wiki's api.php URL
+        username: The account name
+    
+    Returns:
+        The URL, with the query string
+    """
+    query = urllib.parse.urlencode({
+        "action": "query",
+        "meta": "globaluserinfo",
+        "guiuser": username,
+        "guiprop": "groups|editcount",
+        "list": "globalblocks",
+        "bgtargets": username,
+        "bgprop": "target|expiry",
+        "format": "json",
+        "formatversion": "2",
+    })
+    return f"{api}?{query}"
+
+
+def summarize_account(data: dict[str, Any]) -> str:
+    """
+    One-line summary of an account_info_url() response.
+    
+    Example:
+        >>> summarize_account(data)
+        '12,345 edits; groups: global-rollbacker; locked'
+    
+    Raises:
+        ValueError: If the API returned an error
+        KeyError: If the response is not shaped as expected
+    """
+    if "error" in data:
+        raise ValueError(data["error"].get("info", "API error"))
+    info = data["query"]["globaluserinfo"]
+    if info.get("missing"):
+        return "no such global account"
+    parts = [f"{info.get('editcount', 0):,} edits"]
+    groups = info.get("groups") or []
+    parts.append(f"groups: {', '.join(groups)}" if groups else "no global groups")
+    if info.get("locked"):
+        parts.append("locked")
+    if data["query"].get("globalblocks"):
+        parts.append("globally blocked")
+    return "; ".join(parts)
+
+
+# =============================================================================
+# REGISTRATION
+# =============================================================================
+# The bot opens every connection with CAP LS 302, so the server holds
+# registration until CAP END. The capabilities it wants are requested in one
+# CAP REQ, and if the server offers sasl the bot logs in to its account
+# before registration completes: by the time 001 arrives it is identified,
+# and its JOINs cannot race NickServ. Servers without CAP ignore the request
+# (or answer 421) and register the bot as before.
+
+# Seconds allowed for SASL before it is aborted and registration carries on
+SASL_TIMEOUT = 15.0
+
+# Seconds to wait after 001 for a NickServ login (900) before joining anyway
+LOGIN_WAIT_SECONDS = 5.0
+
+# Longest base64 chunk in one AUTHENTICATE line
+SASL_CHUNK_SIZE = 400
+
+# Alternative nicks tried when ours is taken before giving up on the connection
+MAX_NICK_ATTEMPTS = 10
+
+# Numerics that end a SASL attempt without logging in
+SASL_FAILURES: dict[str, str] = {
+    "902": "nick locked",  # ERR_NICKLOCKED
+    "904": "authentication failed",  # ERR_SASLFAIL
+    "905": "message too long",  # ERR_SASLTOOLONG
+    "906": "aborted",  # ERR_SASLABORTED
+}
+
+# Numerics refusing a nick: erroneous, in use, temporarily unavailable
+NICK_REJECTED: frozenset[str] = frozenset({"432", "433", "437"})
+
+# Everything IRCBot.handle_registration() handles
+REGISTRATION_COMMANDS: frozenset[str] = frozenset({
+    "CAP", "AUTHENTICATE",
+    "001",  # RPL_WELCOME
+    "900",  # RPL_LOGGEDIN
+    "903",  # RPL_SASLSUCCESS
+    "907",  # ERR_SASLALREADY
+} | SASL_FAILURES.keys() | NICK_REJECTED)
+
+
+def sasl_mechanism(config: BotConfig) -> str:
+    """
+    The SASL mechanism a config asks for.
+    
+    With sasl set to "auto", a TLS client certificate means EXTERNAL and a
+    password means PLAIN.
+    
+    Returns:
+        "PLAIN", "EXTERNAL", or "" to register without SASL
+    """
+    choice = config.sasl.lower()
+    if choice == "external" or (choice == "auto" and config.tls and config.tls_cert):
+        return "EXTERNAL"
+    if choice in ("plain", "auto") and config.password:
+        return "PLAIN"
+    return ""
+
+
+def tls_context(config: BotConfig) -> ssl.SSLContext:
+    """
+    The TLS context for connections made with a config.
+    
+    Raises:
+        OSError: If the client certificate cannot be read
+        ssl.SSLError: If the client certificate is invalid
+    """
+    context = ssl.create_default_context()
+    if not config.tls_verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if config.tls_cert:
+        context.load_cert_chain(config.tls_cert)
+    return context
+
+
+class Registration:
+    """
+    One connection's registration: CAP negotiation, SASL and the welcome.
+    
+    Each on_*() method takes a reply from the server and returns the lines
+    to send in answer, so the whole exchange can be driven (and checked)
+    without a connection.
+    
+    Example:
+        >>> registration = Registration(config)
+        >>> registration.opening_lines("AvicBot")
+        ['CAP LS 302', 'NICK AvicBot', 'USER AvicBot 2 3 :Avicennasis']
+        >>> registration.on_cap(["*", "LS", "multi-prefix sasl=PLAIN"])
+        ['CAP REQ :multi-prefix sasl']
+        >>> registration.on_cap(["*", "ACK", "multi-prefix sasl"])
+        ['AUTHENTICATE PLAIN']
+    
+    Attributes:
+        config: The connection's BotConfig
+        mechanism: SASL mechanism to use, or "" for none
+        offered: Capabilities the server listed, and their values
+        enabled: Capabilities the server acknowledged
+        negotiating: True from CAP LS until CAP END has been sent
+        authenticating: True while a SASL exchange is under way
+        logged_in: True once the server reported us logged in (900)
+        sasl_result: "", "success", or why SASL was skipped or failed
+        welcomed: True once registration completed (001)
+        joins_sent: True once joining the channels has started
+        nick_attempts: Alternative nicks tried so far
+        started: Monotonic time the connection was started
+        welcome_seconds: Seconds from start to 001, once welcomed
+    """
+    
+    def __init__(self, config: BotConfig, started: Optional[float] = None) -> None:
+        """
+        Initialize the state for a new connection.
+        
+        Args:
+            config: The connection's BotConfig
+            started: Monotonic time the connection attempt began (default: now)
+        """
+        self.config = config
+        self.mechanism = sasl_mechanism(config)
+        self.offered: dict[str, str] = {}
+        self.enabled: set[str] = set()
+        self.negotiating = False
+        self.authenticating = False
+        self.logged_in = False
+        self.sasl_result = ""
+        self.welcomed = False
+        self.joins_sent = False
+        self.nick_attempts = 0
+        self.started = time.monotonic() if started is None else started
+        self.welcome_seconds: Optional[float] = None
+    
+    @property
+    def needs_nickserv(self) -> bool:
+        """Whether to identify to NickServ after the welcome."""
+        return bool(self.config.password) and not self.logged_in
+    
+    def opening_lines(self, nick: str) -> list[str]:
+        """CAP LS, NICK and USER, sent as soon as the connection is up."""
+        self.negotiating = True
+        return [
+            "CAP LS 302",
+            f"NICK {nick}",
+            # USER <username> <mode> <unused> :<realname>
+            f"USER {self.config.username} 2 3 :{self.config.realname}",
+        ]
+    
+    def on_cap(self, params: list[str]) -> list[str]:
+        """
+        Answer a CAP reply: LS (possibly over several lines), ACK or NAK.
+        
+        Args:
+            params: The CAP message's parameters: target, subcommand, and
+                the capability list (preceded by "*" on continued LS lines)
+        """
+        if len(params) < 3:
+            return []
+        subcommand = params[1].upper()
+        if subcommand == "LS":
+            for cap in params[-1].split():
+                name, _, value = cap.partition("=")
+                self.offered[name] = value
+            if len(params) > 3 and params[2] == "*":
+                return []  # More of the list follows
+            return self._request()
+        if subcommand == "ACK":
+            for cap in params[-1].split():
+                if cap.startswith("-"):
+                    self.enabled.discard(cap[1:])
+                else:
+                    self.enabled.add(cap)
+            if self.negotiating and "sasl" in self.enabled and self.mechanism and not self.sasl_result:
+                self.authenticating = True
+                return [f"AUTHENTICATE {self.mechanism}"]
+            return self.end()
+        if subcommand == "NAK":
+            self.sasl_result = self.sasl_result or "capabilities refused"
+            return self.end()
+        if subcommand == "DEL":
+            # e.g. account-tag going away with services; stop relying on it
+            for cap in params[-1].split():
+                self.enabled.discard(cap)
+        return []  # NEW, DEL and LIST need no answer
+    
+    def _request(self) -> list[str]:
+        """The CAP REQ for what we want of what the server offers."""
+        wanted = [cap for cap in self.config.caps if cap in self.offered and cap != "sasl"]
+        if self.mechanism:
+            mechanisms = self.offered.get("sasl")
+            if mechanisms is None:
+                self.sasl_result = "not offered by the server"
+            elif mechanisms and self.mechanism not in mechanisms.upper().split(","):
+                self.sasl_result = f"server only offers {mechanisms}"
+            else:
+                wanted.append("sasl")
+        if not wanted:
+            return self.end()
+        return [f"CAP REQ :{' '.join(wanted)}"]
+    
+    def on_authenticate(self, params: list[str]) -> list[str]:
+        """
+        Answer the server's AUTHENTICATE challenge with our credentials.
+        
+        PLAIN sends the account and password, base64-encoded and split into
+        400-byte chunks; EXTERNAL sends nothing, the TLS client certificate
+        being the credential.
+        """
+        if not self.authenticating or not params or params[0] != "+":
+            return []
+        if self.mechanism == "EXTERNAL":
+            return ["AUTHENTICATE +"]
+        account = self.config.account or self.config.nick
+        payload = base64.b64encode(
+            f"{account}\0{account}\0{self.config.password}".encode("utf-8")
+        ).decode("ascii")
+        lines = [f"AUTHENTICATE {payload[start:start + SASL_CHUNK_SIZE]}"
+                 for start in range(0, len(payload), SASL_CHUNK_SIZE)]
+        if len(payload) % SASL_CHUNK_SIZE == 0:
+            lines.append("AUTHENTICATE +")  # An exact multiple needs an empty last chunk
+        return lines
+    
+    def on_sasl_reply(self, command: str) -> list[str]:
+        """Record a SASL result numeric; ends CAP negotiation once SASL is over."""
+        if command == "900":
+            self.logged_in = True
+            return []
+        if command in ("903", "907"):
+            self.sasl_result = "success"
+        elif command in SASL_FAILURES:
+            self.sasl_result = SASL_FAILURES[command]
+        else:
+            return []
+        self.authenticating = False
+        return self.end()
+    
+    def abort_sasl(self) -> list[str]:
+        """Give up on a SASL exchange that is taking too long."""
+        if not self.authenticating:
+            return []
+        self.sasl_result = "timed out"
+        self.authenticating = False
+        return ["AUTHENTICATE *"] + self.end()
+    
+    def end(self) -> list[str]:
+        """CAP END, unless negotiation is already over."""
+        if not self.negotiating:
+            return []
+        self.negotiating = False
+        return ["CAP END"]
+    
+    def alternate_nick(self) -> Optional[str]:
+        """
+        The next nick to try after ours was refused during registration.
+        
+        Returns:
+            "nick_", "nick__", then "nick1", "nick2" and so on; None after
+            MAX_NICK_ATTEMPTS
+        """
+        self.nick_attempts += 1
+        if self.nick_attempts > MAX_NICK_ATTEMPTS:
+            return None
+        if self.nick_attempts <= 2:
+            return self.config.nick + "_" * self.nick_attempts
+        return f"{self.config.nick}{self.nick_attempts - 2}"
+    
+    def welcome(self) -> None:
+        """Record the end of registration (001)."""
+        self.welcomed = True
+        self.negotiating = self.authenticating = False
+        self.welcome_seconds = time.monotonic() - self.started
+
+
+# =============================================================================
+# IRC BOT CLASS
+# =============================================================================
+
+# A connection that lasted this long resets the reconnect backoff
+STABLE_SESSION_SECONDS = 60.0
+
+# Most language codes answered for a single !lang query
+MAX_LANGUAGE_QUERIES = 10
+
+# PING token used for server lag probes, followed by a monotonic timestamp
+LAG_PROBE_PREFIX = "avicbot-lag-"
+
+# Commands routed by IRCBot.run; all other lines are skipped unparsed
+ROUTED_COMMANDS: frozenset[str] = frozenset({
+    "ACCOUNT", "JOIN", "KICK", "NICK", "PART", "PING", "PONG", "PRIVMSG", "QUIT",
+    "353",  # RPL_NAMREPLY
+}) | REGISTRATION_COMMANDS | frozenset(JOIN_FAILURES)
+
+
+class IRCBot:
+    """
+    Asynchronous IRC Bot implementation.
+    
+    This class encapsulates all IRC bot functionality including connection management,
+    message parsing, and command handling. It uses Python's asyncio for non-blocking
+    network operations, allowing the bot to handle multiple messages efficiently.
+    
+    Features:
+        - Automatic reconnection with backoff on connection loss
+        - IRCv3 capability negotiation, SASL and NickServ authentication
+        - TLS, optionally with a client certificate
+        - Command-based message handling
+        - Conversational reply triggers
+        - Language code lookups
+        - Wikimedia tool integration
+    
+    Example:
+        >>> config = BotConfig()
+        >>> bot = IRCBot(config)
+        >>> asyncio.run(bot.run())
+    
+    Attributes:
+        config: BotConfig instance containing bot settings
+        logger: Logger for this connection (named after the network)
+        traffic_log: Logger for raw lines sent and received, at DEBUG
+        reader: asyncio StreamReader for receiving data
+        writer: asyncio StreamWriter for sending data
+        running: Boolean flag indicating if bot is running
+        dispatcher: HandlerDispatcher running message handlers as tasks
+        commands: CommandRegistry used to look up and run bot commands
+        languages: LanguageIndex used by the !lang and !langname commands
+        send_queue: SendQueue through which all outbound lines are written
+        nick: The nickname currently in use
+        channels: Channels the bot is in, rejoined after a reconnect, with
+            their keys ("" for none)
+        joiner: ChannelJoiner pacing and tracking this connection's joins
+        members: MembershipTracker of who is in each channel
+        seen: SeenIndex behind !seen while running, if seen_db is set
+        digest: NotificationDigest batching notifications to the owner
+        reloader: Reloader behind !reload, set by run_bots()
+        handoff: SessionHandoff behind !upgrade, set by run_bots()
+        handed_off: True once the connection belongs to a new process
+        registration: Registration state of the current connection, or
+            None for a session handed over by the previous process
+        caps: IRCv3 capabilities enabled on the current connection
+        connect_seconds: Seconds from starting the current connection to
+            having joined every channel (0 until then)
+        reconnects: Number of times the connection has been re-established
+        metrics: BotMetrics when metrics are enabled, otherwise None
+        triggers: TriggerEngine matching the conversational triggers
+    """
+    
+    def __init__(self, config: BotConfig, resume: Optional["ResumedSession"] = None) -> None:
+        """
+        Initialize the IRC bot with the given configuration.
+        
+        Args:
+            config: BotConfig instance containing all bot settings
+            resume: A connection handed over by the previous process, to
+                carry on with instead of connecting
+        """
+        self.config = config
+        self.logger = logger.getChild(config.name) if config.name else logger
+        self.traffic_log = traffic_logger.getChild(config.name) if config.name else traffic_logger
+        self.reader: Optional[IRCProtocol | StreamLineReader] = None
+        self.writer: Optional[IRCProtocol | asyncio.StreamWriter] = None
+        self.running: bool = False
+        self.dispatcher: Optional[HandlerDispatcher] = None
+        self.commands: CommandRegistry = COMMANDS
+        self.languages: LanguageIndex = LANGUAGE_INDEX
+        self.send_queue: Optional[SendQueue] = None
+        
+        # Session state restored after a reconnect
+        self.nick: str = config.nick
+        self.channels: dict[str, str] = dict(
+            parse_channel(channel) for channel in config.channels if channel.strip()
+        )
+        self.joiner = ChannelJoiner(config.join_rate, config.join_burst, config.join_retry_delay,
+                                    config.join_retry_max_delay)
+        self.reconnects: int = 0
+        self.metrics: Optional[BotMetrics] = BotMetrics() if config.metrics_port else None
+        self.rate_limiter = CommandRateLimiter(config)
+        self.coalescer = CommandCoalescer(config.coalesce_window)
+        self.members = MembershipTracker()
+        self.seen: Optional[SeenIndex] = None
+        self.digest = NotificationDigest(config.notify_interval, config.notify_max_entries)
+        self._digest_changed = asyncio.Event()
+        self.reloader: Optional[Reloader] = None
+        self.handoff: Optional[SessionHandoff] = None
+        self.http: Optional[HTTPClient] = None
+        self.handed_off: bool = False
+        self.registration: Optional[Registration] = None
+        self.caps: set[str] = set()
+        self.connect_seconds: float = 0.0
+        self._resume = resume
+        self._tls: Optional[ssl.SSLContext] = tls_context(config) if config.tls else None
+        self._prefix_length: int = len(config.nick) + len(config.username) + HOST_LENGTH_ESTIMATE + 3
+        self._static_lines: dict[tuple[str, str], list[bytes]] = {}
+        self._connection_lost_at: Optional[float] = None
+        self._last_received: float = 0.0
+        
+        # Conversational triggers, from the rules file or the built-in replies
+        self.triggers = TriggerEngine(load_trigger_rules(config.triggers_file))
+    
+    def reloadable_state(self) -> tuple[BotConfig, CommandRegistry, LanguageIndex, TriggerEngine]:
+        """
+        Everything a hot reload replaces, for rolling it back.
+        
+        Returns:
+            Arguments for apply_reload() that restore the current state
+        """
+        return self.config, self.commands, self.languages, self.triggers
+    
+    def apply_reload(self, config: BotConfig, commands: CommandRegistry, languages: LanguageIndex,
+                     triggers: TriggerEngine) -> None:
+        """
+        Swap in reloaded code and config without touching the connection.
+        
+        Limits derived from the config (rate limits, owner digest, send
+        and join rates) are updated in place, so their counters carry over.
+        The digest task is woken so a new notify_interval (including turning
+        digests on or off) takes effect right away.
+        
+        Args:
+            config: The new config; connection fields should already match
+            commands: The new command registry
+            languages: The new language index
+            triggers: The new conversational trigger engine
+        """
+        self.config = config
+        self.commands = commands
+        self.languages = languages
+        self.triggers = triggers
+        for counter, limit in zip(self.rate_limiter.counters,
+                                  (config.nick_rate_limit, config.host_rate_limit, config.channel_rate_limit)):
+            counter.limit = limit
+            counter.window = config.rate_limit_window
+        self.coalescer.window = config.coalesce_window
+        self.joiner.rate = config.join_rate
+        self.joiner.burst = max(1, config.join_burst)
+        self.joiner.retry_delay = config.join_retry_delay
+        self.joiner.retry_max_delay = config.join_retry_max_delay
+        self.digest.interval = config.notify_interval
+        self.digest.max_entries = max(1, config.notify_max_entries)
+        self._digest_changed.set()
+        if self.send_queue is not None:
+            self.send_queue.rate = config.send_rate
+            self.send_queue.burst = max(1, config.send_burst)
+    
+    async def connect(self) -> None:
+        """
+        Establish a connection to the IRC server.
+        
+        This method opens an async TCP (or TLS) connection to the configured
+        IRC server and port. Upon successful connection, it starts
+        registration: CAP LS, NICK and USER. The rest of registration (CAP
+        negotiation, SASL, the welcome) is driven by the server's replies,
+        see handle_registration().
+        
+        Host names are resolved afresh on every call, and every address of
+        every configured server (main server first, then the fallbacks) is
+        tried in turn until one accepts the connection.
+        
+        Raises:
+            ConnectionError: If unable to connect to the server
+            asyncio.TimeoutError: If connection times out
+        """
+        self.registration = Registration(self.config)
+        # Shared with the registration, so it follows CAP ACK and DEL
+        self.caps = self.registration.enabled
+        self.connect_seconds = 0.0
+        self.joiner.reset(self.channels)
+        self.reader, self.writer = await self._open_connection()
+        self._last_received = time.monotonic()
+        # Membership is rebuilt from the JOIN echoes and NAMES replies
+        self.members.clear()
+        
+        # All outbound traffic goes through the rate-limited send queue
+        self.send_queue = SendQueue(self.writer, self.config.send_rate, self.config.send_burst, self.traffic_log)
+        self.send_queue.start()
+        
+        self.logger.info("Connection established, sending registration...")
+        
+        self.nick = self.config.nick
+        self._set_prefix_length(len(self.nick) + len(self.config.username) + HOST_LENGTH_ESTIMATE + 3)
+        for line in self.registration.opening_lines(self.nick):
+            await self.send_raw(line, PRIORITY_HIGH)
+    
+    async def _open_connection(self) -> tuple[Any, Any]:
+        """
+        Connect to the first reachable address of the configured servers.
+        
+        With the "protocol" transport the reader and the writer are the
+        same IRCProtocol; with "streams" they are a StreamLineReader and a
+        StreamWriter.
+        
+        Returns:
+            The (reader, writer) pair of the new connection
+        
+        Raises:
+            OSError: The error from the last attempt if every address failed
+        """
+        loop = asyncio.get_running_loop()
+        last_error: Exception = ConnectionError("No servers configured")
+        
+        for host, port in self.config.server_addresses():
+            try:
+                # Resolve on every attempt so DNS changes are picked up
+                infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            except OSError as e:
+                self.logger.warning(f"Could not resolve {host}: {e}")
+                last_error = e
+                continue
+            
+            for family, _, _, _, sockaddr in infos:
+                self.logger.info(f"Connecting to {host} ({sockaddr[0]}) port {port}...")
+                try:
+                    return await asyncio.wait_for(
+                        self._connect_transport(sockaddr[0], port, family, host),
+                        self.config.connect_timeout,
+                    )
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.logger.warning(f"Connection to {sockaddr[0]} failed: {e!r}")
+                    last_error = e
+        
+        raise last_error
+    
+    async def _connect_transport(self, address: str, port: int, family: int, host: str) -> tuple[Any, Any]:
+        """Open one connection using the configured transport; host is checked against TLS certificates."""
+        tls = {"ssl": self._tls, "server_hostname": host} if self._tls is not None else {}
+        if self.config.transport == "streams":
+            reader, writer = await asyncio.open_connection(address, port, family=family, **tls)
+            return StreamLineReader(reader, self.config.max_line_length, self.config.buffer_size), writer
+        
+        max_line_length = self.config.max_line_length
+        _, protocol = await asyncio.get_running_loop().create_connection(
+            lambda: IRCProtocol(max_line_length), address, port, family=family, **tls,
+        )
+        return protocol, protocol
+    
+    async def resume_session(self, session: "ResumedSession") -> None:
+        """
+        Carry on with a connection handed over by the previous process.
+        
+        Registration and JOINs are skipped: the server still sees the same
+        session. Data the previous process had received but not processed
+        is processed first.
+        
+        Args:
+            session: The socket and session state received at startup
+        """
+        max_line_length = self.config.max_line_length
+        _, protocol = await asyncio.get_running_loop().create_connection(
+            lambda: IRCProtocol(max_line_length), sock=session.sock,
+        )
+        protocol.reattach(session.unread)
+        self.reader = self.writer = protocol
+        self._last_received = time.monotonic()
+        self.members.clear()
+        self.registration = None
+        self.caps = set(session.caps)
+        
+        self.send_queue = SendQueue(self.writer, self.config.send_rate, self.config.send_burst, self.traffic_log)
+        for priority, line in session.unsent:
+            self.send_queue.put(line, priority)
+        self.send_queue.start()
+        self.nick = session.nick
+        self._set_prefix_length(session.prefix_length)
+        # Keys come with the session; the config's fill in for a previous
+        # process that handed over channel names only
+        keys = dict(parse_channel(channel) for channel in self.config.channels if channel.strip())
+        self.channels = {channel: key or keys.get(channel, "") for channel, key in session.channels.items()}
+        self.joiner.reset(self.channels, joined=True)
+        self.logger.info(f"Resumed session as {self.nick} in {len(self.channels)} channel(s) "
+                         f"({len(session.unread)} unread bytes, {len(session.unsent)} unsent lines)")
+    
+    async def detach_session(self) -> tuple[dict[str, Any], int]:
+        """
+        Stop using the connection so that another process can take it over.
+        
+        Reading stops first, so no new commands start, and running handlers
+        are given time to finish. Whatever output they left in the send
+        queue is taken out and carried in the state, to be sent by the next
+        process; lines already handed to the transport are flushed, so the
+        two processes never interleave their output.
+        
+        Returns:
+            The JSON-serializable session state and the socket's file
+            descriptor
+        
+        Raises:
+            RuntimeError: If the bot is not connected through IRCProtocol,
+                is connected with TLS (whose session state cannot be
+                handed over), or its output could not be flushed
+        """
+        if not isinstance(self.reader, IRCProtocol) or self.send_queue is None:
+            raise RuntimeError(f"{self.config.name or self.config.server} is not connected through IRCProtocol")
+        if self._tls is not None:
+            raise RuntimeError(f"{self.config.name or self.config.server} is connected with TLS")
+        unread = self.reader.detach()
+        try:
+            if not await self.dispatcher.wait_idle():
+                self.logger.warning("Handing over while handlers are still running; their later output is lost")
+            await self.flush_digest()
+        except BaseException:
+            # Cancelled (or failed) half-way: resume reading before giving up
+            self.reader.reattach(unread)
+            raise
+        unsent = self.send_queue.take_pending()
+        state = {
+            "name": self.config.name,
+            "nick": self.nick,
+            "channels": dict(self.channels),
+            "prefix_length": self._prefix_length,
+            "caps": sorted(self.caps),
+            "unread": base64.b64encode(unread).decode("ascii"),
+            "unsent": [[priority, base64.b64encode(line).decode("ascii")] for priority, line in unsent],
+        }
+        try:
+            written = await self.reader.wait_written()
+        except BaseException:
+            self.reattach_session(state)
+            raise
+        if not written:
+            self.reattach_session(state)
+            raise RuntimeError(f"could not flush output to {self.config.server}")
+        return state, self.writer.get_extra_info("socket").fileno()
+    
+    def reattach_session(self, state: dict[str, Any]) -> None:
+        """
+        Take the connection back after a handoff failed.
+        
+        Args:
+            state: The state returned by detach_session()
+        """
+        for priority, line in state["unsent"]:
+            self.send_queue.put(base64.b64decode(line), priority)
+        self.reader.reattach(base64.b64decode(state["unread"]))
+    
+    async def send_raw(self, message: str | bytes, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Send a raw IRC protocol message to the server.
+        
+        IRC protocol requires messages to end with CRLF (\\r\\n).
+        This method handles the encoding and line termination automatically.
+        
+        The line is placed on the send queue and written by its writer task,
+        which paces output to stay under the server's flood limit. This
+        method returns as soon as the line is queued.
+        
+        Args:
+            message: The raw IRC protocol message to send (without CRLF),
+                or an already encoded line ending in CRLF
+            priority: Send queue lane (PRIORITY_HIGH, _NORMAL or _LOW)
+        
+        Note:
+            This is a low-level method. For sending channel messages,
+            use send_message() instead.
+        """
+        if self.send_queue is None:
+            self.logger.error("Cannot send message: not connected")
+            return
+        
+        self.send_queue.put(message, priority)
+        if self.metrics is not None:
+            self.metrics.lines_queued += 1
+    
+    async def send_message(self, target: str, message: str, priority: int = PRIORITY_NORMAL,
+                           static: bool = False) -> None:
+        """
+        Send a PRIVMSG to a channel or user.
+        
+        PRIVMSG is the IRC command used for both channel messages and
+        private messages. The target determines the recipient.
+        
+        The server relays the message with our nick!user@host prefix in
+        front, and cuts anything past 512 bytes. Messages that would not
+        fit are therefore split into several PRIVMSGs by byte length,
+        never inside a UTF-8 character (see split_utf8).
+        
+        For static text the encoded lines are cached per target, so sending
+        a canned reply again costs a dictionary lookup and no encoding.
+        
+        Args:
+            target: Channel name (e.g., "#channel") or nickname for PM
+            message: The message text to send
+            priority: Send queue lane (PRIORITY_LOW for bulk output)
+            static: Cache the encoded message; only for text from a fixed set
+        """
+        if static:
+            key = (target, message)
+            lines = self._static_lines.get(key)
+            if lines is None:
+                if len(self._static_lines) >= STATIC_CACHE_SIZE:
+                    self._static_lines.clear()
+                lines = self._static_lines[key] = self.encode_message(target, message)
+        else:
+            lines = self.encode_message(target, message)
+        
+        for line in lines:
+            await self.send_raw(line, priority)
+    
+    def encode_message(self, target: str, message: str) -> list[bytes]:
+        """
+        Encode a PRIVMSG as one or more complete lines that fit in 512 bytes.
+        
+        Until our JOIN echo shows the prefix the server uses for us, the
+        hostname is assumed to be as long as a hostname can be.
+        
+        Args:
+            target: Channel or nickname the message is for
+            message: The message text
+        
+        Returns:
+            Encoded lines, each ending in CRLF
+        """
+        # The server adds ":" prefix " " in front of what we send
+        limit = IRC_MAX_LINE - self._prefix_length - 2
+        line = f"PRIVMSG {target} :{message}\r\n".encode("utf-8")
+        if len(line) <= limit:
+            return [line]
+        
+        head = f"PRIVMSG {target} :".encode("utf-8")
+        return [
+            b"".join((head, piece, b"\r\n"))
+            for piece in split_utf8(message, limit - len(head) - 2)
+        ]
+    
+    def _set_prefix_length(self, length: int) -> None:
+        """Record the length of our nick!user@host as the server shows it."""
+        if length != self._prefix_length:
+            self._prefix_length = length
+            # Cached static lines were split for the old length
+            self._static_lines.clear()
+    
+    async def notify_master(self, text: str, command: str = "", target: str = "",
+                            immediate: bool = False) -> None:
+        """
+        Send a low-priority notification to the bot owner.
+        
+        Unless immediate is set (or digests are disabled), the notification
+        is added to the owner digest and sent with the next one.
+        
+        Args:
+            text: The notification
+            command: Command that caused it, shown in the digest
+            target: Channel (or nick) the command was used in
+            immediate: Send now rather than in the digest
+        """
+        if immediate or not self.digest.enabled:
+            await self.send_message(self.config.master, text, PRIORITY_LOW)
+        elif self.digest.add(command, target, text):
+            await self.flush_digest()
+    
+    async def flush_digest(self) -> None:
+        """Send the owner digest now, if anything is waiting and we are connected."""
+        if self.send_queue is None or not len(self.digest):
+            return
+        for line in self.digest.drain():
+            await self.send_message(self.config.master, line, PRIORITY_LOW)
+    
+    async def _send_digests(self) -> None:
+        """
+        Send the owner digest every notify_interval seconds.
+        
+        A reload may change the interval or turn digests on or off; it sets
+        _digest_changed, which restarts the wait with the new setting. While
+        digests are off the task just waits for that, without a timer.
+        """
+        changed = self._digest_changed
+        while True:
+            changed.clear()
+            if not self.digest.enabled:
+                # Just turned off: what was collected goes out now
+                await self.flush_digest()
+                await changed.wait()
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), self.digest.interval)
+            except asyncio.TimeoutError:
+                await self.flush_digest()
+    
+    async def join_channel(self, channel: str, key: str = "") -> None:
+        """
+        Join an IRC channel.
+        
+        The channel is queued on the joiner, which sends it in the next
+        batched JOIN line its pacing allows. The channel name should
+        include the # prefix. The channel is remembered so that it is
+        rejoined after a reconnect.
+        
+        Args:
+            channel: Channel name to join (e.g., "#mychannel")
+            key: The channel's key, if it is keyed (+k)
+        """
+        self.channels[channel] = key
+        self.joiner.add(channel, key)
+        self.logger.info(f"Joining channel: {channel}")
+    
+    async def join_channels(self) -> None:
+        """Start joining every configured (or previously joined) channel, once registered and logged in."""
+        registration = self.registration
+        if registration is not None:
+            if registration.joins_sent:
+                return
+            registration.joins_sent = True
+        self.logger.info(f"Joining {len(self.channels)} channel(s)")
+        self.joiner.start()
+        self._check_ready()
+    
+    async def _send_joins(self) -> None:
+        """Send JOIN lines as the joiner's pacing allows, including retries of refused channels."""
+        joiner = self.joiner
+        while True:
+            lines, wait = joiner.take(time.monotonic())
+            for line in lines:
+                await self.send_raw(line)
+            await joiner.wait(wait)
+    
+    def _check_ready(self) -> None:
+        """
+        Log the connect-to-ready time once every channel of a new connection
+        has been answered, and after a reconnect the time since the loss.
+        """
+        joiner = self.joiner
+        if not joiner.done:
+            return
+        registration = self.registration
+        if registration is not None and not self.connect_seconds:
+            self.connect_seconds = time.monotonic() - registration.started
+            refused = f", {len(joiner.failures)} refused" if joiner.failures else ""
+            self.logger.info(f"Joined {len(joiner.joined)} of {len(self.channels)} channel(s) "
+                             f"{self.connect_seconds:.2f}s after connecting "
+                             f"(registered in {registration.welcome_seconds:.2f}s{refused})")
+        if self._connection_lost_at is not None:
+            elapsed = time.monotonic() - self._connection_lost_at
+            self._connection_lost_at = None
+            self.logger.info(f"Rejoined {len(joiner.joined)} channel(s) {elapsed:.2f}s after connection loss")
+    
+    def handle_join(self, msg: Message) -> None:
+        """
+        Track JOINs: other users' for membership and !seen, and the
+        server's confirmation of our own.
+        
+        Once every channel has been answered, the time from starting the
+        connection to having joined them is logged, and after a reconnect
+        the time from connection loss to full session restoration.
+        
+        Args:
+            msg: A parsed JOIN message
+        """
+        if not msg.params:
+            return
+        channel = msg.params[0]
+        if msg.nick.lower() != self.nick.lower():
+            self.members.add(channel, msg.nick)
+            # extended-join: channel, account ("*" if none), realname
+            if len(msg.params) >= 3 and "extended-join" in self.caps:
+                self.members.set_account(msg.nick, msg.params[1])
+            if self.seen is not None:
+                self.seen.record(msg.nick, "join", channel)
+            return
+        self.members.joined(channel)
+        # Our JOIN echo carries the exact prefix others see our messages with
+        self._set_prefix_length(len(msg.source.encode("utf-8")))
+        if self.joiner.confirmed(channel):
+            self._check_ready()
+    
+    def handle_join_failed(self, msg: Message) -> None:
+        """
+        Record the server refusing to let us into a channel, to retry later.
+        
+        Args:
+            msg: A parsed refusal (see JOIN_FAILURES): me, channel, reason
+        """
+        if len(msg.params) < 2:
+            return
+        channel = msg.params[1]
+        failure = self.joiner.failed(channel, JOIN_FAILURES[msg.command], time.monotonic())
+        if failure is None:
+            return
+        self.logger.warning(f"Could not join {channel}: {msg.text or failure.reason}; "
+                            f"retrying in {failure.retry_at - time.monotonic():.0f}s")
+        self._check_ready()
+    
+    def handle_part(self, msg: Message) -> None:
+        """
+        Track a PART from one of our channels.
+        
+        Args:
+            msg: A parsed PART message (channel, optional reason)
+        """
+        if not msg.params:
+            return
+        channel = msg.params[0]
+        if msg.nick.lower() == self.nick.lower():
+            self.members.left(channel)
+            self.joiner.left(channel)
+            return
+        self.members.remove(channel, msg.nick)
+        if self.seen is not None:
+            self.seen.record(msg.nick, "part", channel, msg.params[1] if len(msg.params) > 1 else "")
+    
+    def handle_kick(self, msg: Message) -> None:
+        """
+        Track a KICK from one of our channels.
+        
+        Args:
+            msg: A parsed KICK message (channel, victim, optional reason)
+        """
+        if len(msg.params) < 2:
+            return
+        channel, victim = msg.params[0], msg.params[1]
+        if victim.lower() == self.nick.lower():
+            self.members.left(channel)
+            self.joiner.left(channel)
+            self.logger.warning(f"Kicked from {channel} by {msg.nick}")
+            return
+        self.members.remove(channel, victim)
+        if self.seen is not None:
+            self.seen.record(victim, "kick", channel, msg.params[2] if len(msg.params) > 2 else "")
+    
+    def handle_quit(self, msg: Message) -> None:
+        """
+        Track a user disconnecting from the network.
+        
+        Args:
+            msg: A parsed QUIT message (optional reason)
+        """
+        self.members.quit(msg.nick)
+        if self.seen is not None:
+            self.seen.record(msg.nick, "quit", "", msg.text)
+    
+    def handle_account(self, msg: Message) -> None:
+        """
+        Track a member logging in to or out of services (account-notify).
+        
+        Args:
+            msg: A parsed ACCOUNT message (account name, or "*" on logout)
+        """
+        if msg.params:
+            self.members.set_account(msg.nick, msg.params[0])
+    
+    def sender_account(self, msg: Message) -> Optional[str]:
+        """
+        The services account a message was sent from, as far as we can tell.
+        
+        With account-tag the server stamps every message with the sender's
+        account, which is authoritative; otherwise the account tracked
+        from extended-join and account-notify is used, and only while
+        account-notify keeps it current.
+        
+        Args:
+            msg: A parsed message from a user
+        
+        Returns:
+            The account name, or None if not logged in or not known
+        """
+        if "account-tag" in self.caps:
+            return msg.tags.get("account") or None
+        if "account-notify" in self.caps:
+            return self.members.account_of(msg.nick)
+        return None
+    
+    def is_owner(self, source: str, account: Optional[str]) -> bool:
+        """
+        Whether a user is the bot owner, for owner-only commands and the
+        rate-limit exemption.
+        
+        Anyone can take the owner's nick while the owner is away, so the
+        nick proves nothing: the owner must be logged in to master_account
+        (by default the account named like master), or match one of
+        master_masks.
+        
+        Args:
+            source: The user's nick!user@host, or "" if unknown
+            account: The user's services account, or None
+        """
+        owner_account = self.config.master_account or self.config.master
+        if account is not None and account.lower() == owner_account.lower():
+            return True
+        if source:
+            folded = source.lower()
+            return any(fnmatch.fnmatchcase(folded, mask.lower()) for mask in self.config.master_masks)
+        return False
+    
+    def handle_nick(self, msg: Message) -> None:
+        """
+        Track a nick change, including our own.
+        
+        Args:
+            msg: A parsed NICK message (new nick)
+        """
+        if not msg.params:
+            return
+        new = msg.params[0]
+        self.members.rename(msg.nick, new)
+        if msg.nick.lower() == self.nick.lower():
+            # Our prefix, and so the room left in each line, changes with the nick
+            self._set_prefix_length(self._prefix_length - len(self.nick) + len(new))
+            self.nick = new
+        elif self.seen is not None:
+            self.seen.record(msg.nick, "nick", "", new)
+    
+    def handle_names(self, msg: Message) -> None:
+        """
+        Add the nicks of a NAMES reply to a channel's membership.
+        
+        Args:
+            msg: A parsed RPL_NAMREPLY (353): me, symbol, channel, names
+        """
+        if len(msg.params) >= 4:
+            self.members.add_names(msg.params[2], msg.params[3].split())
+    
+    async def handle_registration(self, msg: Message) -> None:
+        """
+        Drive registration from the server's replies.
+        
+        CAP and AUTHENTICATE replies and the SASL numerics advance the
+        Registration state; 001 completes registration, and nick refusals
+        are answered with an alternative nick.
+        
+        Args:
+            msg: A parsed message whose command is in REGISTRATION_COMMANDS
+        """
+        registration = self.registration
+        if registration is None:
+            return  # A resumed session registered long ago
+        if msg.command == "001":
+            await self.handle_welcome(msg)
+            return
+        if msg.command in NICK_REJECTED:
+            await self.handle_nick_rejected(msg)
+            return
+        
+        if msg.command == "CAP":
+            lines = registration.on_cap(msg.params)
+            if registration.authenticating and lines == [f"AUTHENTICATE {registration.mechanism}"]:
+                self.logger.info(f"Logging in with SASL {registration.mechanism}...")
+                asyncio.get_running_loop().call_later(SASL_TIMEOUT, self._registration_deadline, registration)
+            elif registration.mechanism and registration.sasl_result and "CAP END" in lines:
+                self.logger.warning(f"SASL skipped: {registration.sasl_result}")
+        elif msg.command == "AUTHENTICATE":
+            lines = registration.on_authenticate(msg.params)
+        else:
+            lines = registration.on_sasl_reply(msg.command)
+            if msg.command in SASL_FAILURES:
+                self.logger.warning(f"SASL {registration.mechanism} failed: {registration.sasl_result}")
+            elif msg.command == "900":
+                self.logger.info(f"Logged in: {msg.text}")
+                if registration.welcomed:
+                    await self.join_channels()  # The NickServ login we were waiting for
+        
+        for line in lines:
+            await self.send_raw(line, PRIORITY_HIGH)
+    
+    async def handle_welcome(self, msg: Message) -> None:
+        """
+        Finish registration (RPL_WELCOME) and join the channels.
+        
+        If we are not logged in yet but have a password, we identify to
+        NickServ first and join when the login is confirmed (900), or after
+        LOGIN_WAIT_SECONDS on networks whose services do not confirm it.
+        
+        Args:
+            msg: A parsed 001: our nick as registered, welcome text
+        """
+        registration = self.registration
+        registration.welcome()
+        if msg.params and msg.params[0] != self.nick:
+            # The server may have truncated or changed our nick
+            self._set_prefix_length(self._prefix_length - len(self.nick) + len(msg.params[0]))
+            self.nick = msg.params[0]
+        caps = ", ".join(sorted(registration.enabled)) or "none"
+        self.logger.info(f"Registered as {self.nick} in {registration.welcome_seconds:.2f}s (capabilities: {caps})")
+        
+        if not registration.needs_nickserv:
+            await self.join_channels()
+            return
+        self.logger.info("Authenticating with NickServ...")
+        account = self.config.account or self.config.nick
+        await self.send_raw(f"PRIVMSG NickServ :identify {account} {self.config.password}", PRIORITY_HIGH)
+        asyncio.get_running_loop().call_later(LOGIN_WAIT_SECONDS, self._registration_deadline, registration)
+    
+    def _registration_deadline(self, registration: Registration) -> None:
+        """Stop waiting for SASL, or for a NickServ login, once its time is up."""
+        if registration is not self.registration or self.send_queue is None or self.dispatcher is None:
+            return  # The connection this was for is gone
+        if registration.authenticating:
+            self.logger.warning(f"SASL timed out after {SASL_TIMEOUT:g}s; registering without it")
+            for line in registration.abort_sasl():
+                self.send_queue.put(line, PRIORITY_HIGH)
+        elif registration.welcomed and not registration.joins_sent:
+            self.logger.warning(f"No NickServ login after {LOGIN_WAIT_SECONDS:g}s; joining anyway")
+            self.dispatcher.submit(self.join_channels(), name="channel joins")
+    
+    async def handle_nick_rejected(self, msg: Message) -> None:
+        """
+        Pick another nick when ours is refused (432, 433 or 437).
+        
+        During registration the server will not welcome us without a nick,
+        so the next alternative is tried at once; the primary nick is taken
+        back when its holder leaves (see regain_nick). Later refusals, of a
+        NICK change, are only logged.
+        
+        Args:
+            msg: A parsed refusal: me, the refused nick, reason
+        """
+        refused = msg.params[1] if len(msg.params) > 2 else self.nick
+        if msg.command == "437" and refused[:1] in CHANNEL_PREFIXES:
+            self.handle_join_failed(msg)  # A channel, not a nick, is unavailable
+            return
+        registration = self.registration
+        if registration is None or registration.welcomed:
+            self.logger.warning(f"Nick {refused} unavailable: {msg.text}")
+            return
+        nick = registration.alternate_nick()
+        if nick is None:
+            self.logger.error(f"No usable nick after {MAX_NICK_ATTEMPTS} attempts; dropping the connection")
+            self.writer.close()
+            return
+        self.logger.warning(f"Nick {refused} unavailable ({msg.text}), trying {nick}")
+        self._set_prefix_length(self._prefix_length - len(self.nick) + len(nick))
+        self.nick = nick
+        await self.send_raw(f"NICK {nick}", PRIORITY_HIGH)
+    
+    async def regain_nick(self, departed: str) -> None:
+        """
+        Take our configured nick back when its holder quits or changes nick.
+        
+        Args:
+            departed: The nick that was just given up
+        """
+        primary = self.config.nick
+        if self.nick.lower() == primary.lower() or departed.lower() != primary.lower():
+            return
+        self.logger.info(f"{primary} is free again, taking it back")
+        await self.send_raw(f"NICK {primary}", PRIORITY_HIGH)
+    
+    async def handle_ping(self, payload: str) -> None:
+        """
+        Respond to server PING with PONG to maintain connection.
+        
+        IRC servers periodically send PING messages to verify the client
+        is still connected. Failing to respond with PONG results in
+        disconnection (ping timeout).
+        
+        Args:
+            payload: The payload from the PING message to echo back
+        """
+        await self.send_raw(f"PONG :{payload}", PRIORITY_HIGH)
+        self.logger.debug("Responded to PING")
+    
+    def handle_pong(self, msg: Message) -> None:
+        """
+        Record server lag from the answer to one of our lag probes.
+        
+        Args:
+            msg: A parsed PONG message
+        """
+        token = msg.text
+        if self.metrics is not None and token.startswith(LAG_PROBE_PREFIX):
+            try:
+                sent_at = float(token[len(LAG_PROBE_PREFIX):])
+            except ValueError:
+                return
+            self.metrics.server_lag = time.monotonic() - sent_at
+    
+    async def handle_message(self, sender: str, target: str, message: str, host: str = "",
+                             source: str = "", account: Optional[str] = None) -> None:
+        """
+        Process an incoming PRIVMSG and dispatch to appropriate handler.
+        
+        This is the main message routing method. It examines incoming messages
+        for commands (prefixed with !) and conversational triggers (when the
+        bot's nick is mentioned).
+        
+        Args:
+            sender: Nickname of the message sender
+            target: Channel or nickname where message was sent
+            message: The message content
+            host: Hostname of the sender, for per-host rate limits
+            source: The sender's nick!user@host, for recognizing the owner
+            account: The sender's services account, or None
+        """
+        # Determine where to send replies
+        # If message was sent to a channel, reply there; otherwise reply to sender
+        in_channel = target.startswith("#")
+        reply_target = target if in_channel else sender
+        if in_channel and self.seen is not None:
+            self.seen.record(sender, "message", target, message)
+        
+        # Check for commands (messages starting with !)
+        if message.startswith("!"):
+            await self.handle_command(sender, reply_target, message, host, source, account)
+            return
+        
+        # Check for conversational triggers (e.g. "hello AvicBot")
+        channel = target.lower() if in_channel else ""
+        rule = self.triggers.match(message, channel, self.nick)
+        if rule is not None:
+            reply = rule.render({"nick": self.nick, "master": self.config.master,
+                                 "sender": sender, "channel": reply_target})
+            await self.send_message(reply_target, reply, static="{sender}" not in rule.reply)
+    
+    async def handle_command(self, sender: str, reply_target: str, message: str, host: str = "",
+                             source: str = "", account: Optional[str] = None) -> None:
+        """
+        Parse and execute bot commands.
+        
+        Commands are messages starting with ! and may include arguments.
+        The command name is looked up in the command registry, which checks
+        the arguments and owner restrictions before running the handler.
+        Known commands from anyone but the owner (see is_owner) are
+        checked against the per-nick, per-host and per-channel rate limits,
+        and dropped without a reply when over them. A command that then
+        repeats one asked in the same place within the coalescing window
+        is dropped too, since its answer is already on the way; only a
+        command that is actually run starts a window.
+        
+        Supported commands (see the BOT COMMANDS section):
+            !commands - List available commands
+            !die <botname> - Gracefully disconnect (owner only)
+            !say <text> - Echo text to channel
+            !guc <username> - Global User Contributions link
+            !cauth <username> - CentralAuth page link
+            !link <path> - Custom link builder
+            !lang <code>? - Language code lookup
+            !sing - Bot sings a song
+            !random - Random number (fair dice roll)
+        
+        Args:
+            sender: Nickname of the command sender
+            reply_target: Where to send command output
+            message: The full command message including !
+            host: Hostname of the sender, or "" if unknown
+            source: The sender's nick!user@host, or "" if unknown
+            account: The sender's services account, or None
+        """
+        name, _, args = message.partition(" ")
+        cmd = self.commands.get(name)
+        if cmd is not None:
+            # Rate limits first: a dropped request must not claim the
+            # coalescing key, or everyone asking the same thing after it
+            # would be dropped too without anyone getting an answer
+            if not self.is_owner(source, account):
+                channel = reply_target if reply_target.startswith("#") else ""
+                scope = self.rate_limiter.check(sender, host, channel)
+                if scope is not None:
+                    self.logger.debug("Rate limited (%s) command from %s: %s", scope, sender, message)
+                    return
+            if cmd.coalesce and not cmd.owner_only and not self.coalescer.first(reply_target, cmd.name, args):
+                self.logger.debug("Coalesced repeated command from %s: %s", sender, message)
+                return
+        if self.metrics is not None:
+            self.metrics.commands += 1
+        await self.commands.dispatch(self, sender, reply_target, message, source, account)
+    
+    async def account_summary(self, username: str) -> Optional[str]:
+        """
+        Summarize a global account for !guc and !cauth.
+        
+        Args:
+            username: The account name
+        
+        Returns:
+            A one-line summary, or None if lookups are off or failed
+        """
+        if not self.config.wiki_api or self.http is None:
+            return None
+        try:
+            data = await self.http.get_json(account_info_url(self.config.wiki_api, username),
+                                            self.config.wiki_cache_ttl)
+            return summarize_account(data)
+        except (RuntimeError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.warning(f"Account lookup for {username} failed: {e}")
+            return None
+    
+    async def handle_language_lookup(self, reply_target: str, args: str) -> None:
+        """
+        Look up one or more language codes and respond with their names.
+        
+        Every code in the query is answered in a single line, e.g.
+        "!lang en? de? zh-yue?" gives
+        "en is English! | de is German! | zh-yue is Cantonese!".
+        Unknown codes get "did you mean" suggestions from the language index.
+        
+        Args:
+            reply_target: Channel or user to send the response to
+            args: The language code query (e.g., "en?" or "zh-yue?")
+        """
+        # Strip trailing ? from each code, normalize to lowercase, and
+        # drop duplicates while keeping the order they were asked in
+        codes = list(dict.fromkeys(
+            word.rstrip("?").lower() for word in args.split() if word.rstrip("?")
+        ))[:MAX_LANGUAGE_QUERIES]
+        if not codes:
+            return
+        
+        answers = []
+        for code in codes:
+            language_name = self.languages.lookup(code)
+            if language_name is not None:
+                answers.append(f"{code} is {language_name}!")
+                continue
+            answer = f"Unknown language code: {code}"
+            suggestions = self.languages.suggest(code)
+            if suggestions:
+                answer += f" (did you mean {', '.join(suggestions)}?)"
+            answers.append(answer)
+        
+        await self.send_message(reply_target, " | ".join(answers))
+    
+    async def handle_language_name_lookup(self, reply_target: str, name: str) -> None:
+        """
+        Reverse lookup: respond with the code for a language name.
+        
+        Args:
+            reply_target: Channel or user to send the response to
+            name: The language name (e.g., "Yiddish"), case-insensitive
+        """
+        name = name.strip()
+        code = self.languages.code_for(name)
+        if code is not None:
+            await self.send_message(reply_target, f"{self.languages.lookup(code)} is {code}!")
+            return
+        
+        suggestions = [
+            f"{self.languages.lookup(match)} ({match})"
+            for match in self.languages.suggest_names(name)
+        ]
+        answer = f"Unknown language: {name}"
+        if suggestions:
+            answer += f" (did you mean {', '.join(suggestions)}?)"
+        await self.send_message(reply_target, answer)
+    
+    def parse_message(self, raw_message: str) -> Optional[Message]:
+        """
+        Parse a raw IRC protocol message into its components.
+        
+        IRC message format: [@tags] [:prefix] command [params] [:trailing]
+        For PRIVMSG: :nick!user@host PRIVMSG #channel :message text
+        
+        Only the commands the bot routes (ROUTED_COMMANDS) are fully
+        parsed; every other line is rejected as soon as its command has
+        been read.
+        
+        Args:
+            raw_message: The raw IRC protocol message string
+        
+        Returns:
+            A Message, or None if the line is malformed or not routed
+        
+        Example:
+            >>> msg = bot.parse_message(":Nick!user@host PRIVMSG #channel :Hello world")
+            >>> msg.nick, msg.command, msg.params
+            ("Nick", "PRIVMSG", ["#channel", "Hello world"])
+        """
+        return parse_line(raw_message, ROUTED_COMMANDS)
+    
+    async def run(self) -> None:
+        """
+        Main bot event loop.
+        
+        This method:
+        1. Connects to the IRC server and registers (CAP, SASL, NICK, USER)
+        2. Joins configured channels once registered and logged in
+        3. Continuously reads and processes incoming messages
+        4. Handles PING/PONG keepalive
+        5. Dispatches PRIVMSG to message handlers as background tasks
+        6. Reconnects with exponential backoff when the connection drops,
+           restoring the nick, NickServ login and joined channels
+        
+        The loop continues until self.running is set to False
+        (typically via the !die command) or the task is cancelled.
+        """
+        self.running = True
+        self.dispatcher = HandlerDispatcher(self.config.max_handlers, self.config.handler_timeout)
+        await self._open_seen_index()
+        # Runs even with digests off, so that a reload can turn them on
+        digests = asyncio.create_task(self._send_digests())
+        attempt = 0
+        
+        try:
+            while self.running:
+                resume, self._resume = self._resume, None
+                try:
+                    if resume is not None:
+                        await self.resume_session(resume)
+                    else:
+                        await self.connect()
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.logger.error(f"Could not connect to any server: {e!r}")
+                    await self._wait_before_reconnect(attempt)
+                    attempt += 1
+                    continue
+                
+                session_started = time.monotonic()
+                
+                if resume is not None:
+                    # Still in our channels; only the member lists are missing
+                    for channel in self.channels:
+                        self.members.joined(channel)
+                        await self.send_raw(f"NAMES {channel}", PRIORITY_LOW)
+                    await self.notify_master(f"Upgraded without reconnecting (pid {os.getpid()})", immediate=True)
+                # Otherwise the channels are joined once registration is done
+                
+                self.logger.info("Bot is now running. Listening for messages...")
+                await self._read_loop()
+                
+                if not self.running:
+                    break
+                
+                # Connection lost: tidy up and try again
+                self._connection_lost_at = time.monotonic()
+                self.reconnects += 1
+                await self._close_connection()
+                
+                # A session that stayed up for a while resets the backoff
+                if time.monotonic() - session_started > STABLE_SESSION_SECONDS:
+                    attempt = 0
+                await self._wait_before_reconnect(attempt)
+                attempt += 1
+        
+        except asyncio.CancelledError:
+            self.logger.info("Bot shutdown requested")
+            self.running = False
+        
+        # Let in-flight handlers finish (or cancel them), then clean up
+        await self.dispatcher.shutdown()
+        digests.cancel()
+        await self.disconnect()
+        if self.seen is not None:
+            await self.seen.close()
+            self.seen = None
+    
+    async def _open_seen_index(self) -> None:
+        """Open the !seen database, carrying on without it if that fails."""
+        if not self.config.seen_db:
+            return
+        seen = SeenIndex(self.config.seen_db, self.config.name or self.config.server)
+        try:
+            await seen.open()
+        except sqlite3.Error as e:
+            self.logger.error(f"Could not open seen database {self.config.seen_db}: {e}")
+            await seen.close()
+            return
+        self.seen = seen
+    
+    async def _read_loop(self) -> None:
+        """
+        Read and route lines until the connection closes or the bot stops.
+        """
+        watchdog = asyncio.create_task(self._keepalive())
+        joins = asyncio.create_task(self._send_joins())
+        
+        try:
+            while self.running:
+                try:
+                    # Read lines from the server
+                    # read_lines() wakes us as soon as a complete line arrives,
+                    # so lines are handled immediately without a polling delay
+                    if self.reader is None:
+                        self.logger.error("Reader is None, connection lost")
+                        break
+                    
+                    lines = await self.reader.read_lines()
+                    
+                    if not lines:
+                        if self.running:
+                            self.logger.warning("Connection closed by server")
+                        break
+                    
+                    self._last_received = time.monotonic()
+                    metrics = self.metrics
+                    if metrics is not None:
+                        metrics.lines_received += len(lines)
+                    # Checked once per batch; formatting only happens if enabled
+                    log_traffic = self.traffic_log.isEnabledFor(logging.DEBUG)
+                    
+                    for raw_line in lines:
+                        line = raw_line.decode("utf-8", errors="replace")
+                        
+                        if log_traffic:
+                            self.traffic_log.debug("<<< %s", line)
+                        
+                        # Parse and route messages; lines for commands we do
+                        # not handle are rejected cheaply by the parser
+                        if metrics is None:
+                            msg = self.parse_message(line)
+                        else:
+                            parse_started = time.perf_counter()
+                            msg = self.parse_message(line)
+                            metrics.parse_latency.observe(time.perf_counter() - parse_started)
+                        if msg is None:
+                            continue
+                        
+                        # Handle PING inline to keep connection alive, even
+                        # while command handlers are busy
+                        if msg.command == "PING":
+                            await self.handle_ping(msg.text or "pingis")
+                        
+                        # Handlers run as tasks so the reader never waits on them
+                        elif msg.command == "PRIVMSG" and len(msg.params) >= 2:
+                            self.dispatcher.submit(
+                                self.handle_message(msg.nick, msg.params[0], msg.params[-1], msg.host,
+                                                    msg.source, self.sender_account(msg)),
+                                name=f"message from {msg.nick}",
+                                wait_histogram=metrics.dispatch_latency if metrics else None,
+                            )
+                        
+                        elif msg.command == "JOIN":
+                            self.handle_join(msg)
+                        
+                        elif msg.command == "PONG":
+                            self.handle_pong(msg)
+                        
+                        # Membership changes
+                        elif msg.command == "353":
+                            self.handle_names(msg)
+                        elif msg.command == "PART":
+                            self.handle_part(msg)
+                        elif msg.command == "QUIT":
+                            self.handle_quit(msg)
+                            await self.regain_nick(msg.nick)
+                        elif msg.command == "NICK":
+                            self.handle_nick(msg)
+                            await self.regain_nick(msg.nick)
+                        elif msg.command == "KICK":
+                            self.handle_kick(msg)
+                        elif msg.command == "ACCOUNT":
+                            self.handle_account(msg)
+                        
+                        # CAP, SASL, the welcome and nick refusals
+                        elif msg.command in REGISTRATION_COMMANDS:
+                            await self.handle_registration(msg)
+                        elif msg.command in JOIN_FAILURES:
+                            self.handle_join_failed(msg)
+                    
+                    # read_lines() returns buffered lines without suspending,
+                    # so yield once per batch to let the handlers run
+                    await asyncio.sleep(0)
+                
+                except (ConnectionError, OSError) as e:
+                    self.logger.warning(f"Connection lost: {e}")
+                    break
+                except Exception as e:
+                    self.logger.error(f"Error in main loop: {e}")
+                    await asyncio.sleep(1)  # Brief delay before retry
+        finally:
+            watchdog.cancel()
+            joins.cancel()
+    
+    async def _keepalive(self) -> None:
+        """
+        Detect silently dead connections.
+        
+        If the server has been quiet for ping_interval seconds we PING it;
+        if it stays quiet for twice that long the connection is closed,
+        which ends the read loop and triggers a reconnect.
+        """
+        interval = self.config.ping_interval
+        if self.metrics is not None:
+            # Wake often enough to send a lag probe every LAG_PROBE_SECONDS
+            interval = min(interval, LAG_PROBE_SECONDS * 4)
+        while True:
+            await asyncio.sleep(interval / 4)
+            if self.metrics is not None:
+                await self.send_raw(f"PING :{LAG_PROBE_PREFIX}{time.monotonic():.6f}", PRIORITY_HIGH)
+            idle = time.monotonic() - self._last_received
+            if idle > interval * 2:
+                self.logger.warning(f"No data from server for {idle:.0f}s, reconnecting")
+                if self.writer is not None:
+                    self.writer.close()
+                return
+            if idle > interval:
+                await self.send_raw(f"PING :{self.config.server}", PRIORITY_HIGH)
+    
+    async def _wait_before_reconnect(self, attempt: int) -> None:
+        """
+        Sleep for an exponentially growing, jittered backoff.
+        
+        The delay doubles with each consecutive failure up to
+        reconnect_max_delay; the actual sleep is a random point in the
+        upper half of that range, so many bots dropped by the same netsplit
+        do not all reconnect at the same instant.
+        
+        Args:
+            attempt: Number of consecutive failed attempts so far
+        """
+        ceiling = min(self.config.reconnect_max_delay, self.config.reconnect_delay * 2 ** min(attempt, 16))
+        delay = random.uniform(ceiling / 2, ceiling)
+        self.logger.info(f"Reconnecting in {delay:.1f}s (attempt {attempt + 1})")
+        await asyncio.sleep(delay)
+    
+    async def _close_connection(self) -> None:
+        """Drop a connection that has already failed, without sending QUIT."""
+        if self.send_queue is not None:
+            await self.send_queue.close(timeout=0)
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = None
+        self.writer = None
+        self.send_queue = None
+    
+    def stats(self) -> dict[str, Any]:
+        """
+        Snapshot of this connection's health, for monitoring.
+        
+        Returns:
+            Dictionary of connection state and counters
+        """
+        return {
+            "name": self.config.name or self.config.server,
+            "nick": self.nick,
+            "connected": self.writer is not None,
+            "channels": len(self.channels),
+            "channels_joined": len(self.joiner.joined),
+            "pending_joins": len(self.joiner.pending),
+            "join_failures": len(self.joiner.failures),
+            "connect_seconds": round(self.connect_seconds, 3),
+            "reconnects": self.reconnects,
+            "send_queue_depth": self.send_queue.depth if self.send_queue else 0,
+            "handlers_running": len(self.dispatcher.tasks) if self.dispatcher else 0,
+            "handlers_dropped": self.dispatcher.dropped if self.dispatcher else 0,
+        }
+    
+    def stop(self) -> None:
+        """
+        Ask the main loop to exit.
+        
+        Handlers run as separate tasks, so clearing the running flag alone
+        would not be noticed until the next line arrives. Feeding EOF to the
+        reader wakes the pending read immediately.
+        """
+        self.running = False
+        if self.reader is not None:
+            self.reader.feed_eof()
+    
+    async def disconnect(self) -> None:
         """
-        Parse a raw IRC protocol message into its components.
+        Gracefully disconnect from the IRC server.
         
-        IRC message format: [:prefix] command [params] [:trailing]
-        For PRIVMSG: :nick!user@host PRIVMSG #channel :message text
+        Sends a QUIT message and closes the connection properly.
+        """
+        if self.handed_off:
+            # The new process has the connection; just drop our copy of the socket
+            await self._close_connection()
+            self.logger.info("Session handed off to the new process.")
+            return
         
-        Args:
-            raw_message: The raw IRC protocol message string
+        self.logger.info("Disconnecting from IRC server...")
         
-        Returns:
-            Tuple of (sender_nick, command, target, message) or None if parse fails
+        try:
+            if self.writer:
+                # Give pending replies (and the owner digest) a chance to go out before QUIT
+                await self.flush_digest()
+                await self.send_queue.flush(timeout=3.0)
+                await self.send_raw("QUIT :Goodbye!", PRIORITY_HIGH)
+                await self.send_queue.close()
+                self.writer.close()
+                await self.writer.wait_closed()
+        except Exception as e:
+            self.logger.error(f"Error during disconnect: {e}")
         
-        Example:
-            >>> parse_message(":Nick!user@host PRIVMSG #channel :Hello world")
-            ("Nick", "PRIVMSG", "#channel", "Hello world")
-        """
-        # Match IRC message format with optional prefix
-        # Group 1: sender nick (from prefix like :Nick!user@host)
-        # Group 2: command (e.g., PRIVMSG, JOIN, PING)
-        # Group 3: target (channel or nick)
-        # Group 4: message content (after the :)
-        match = re.match(
-            r"^(?::(\S+?)(?:!|\s))?\s*(\S+)\s+(\S+)\s*(?::(.*))?$",
-            raw_message
-        )
+        if self.send_queue is not None:
+            self.logger.info(f"Send queue stats: {self.send_queue.stats()}")
+        self.reader = None
+        self.writer = None
+        self.send_queue = None
+        self.logger.info("Disconnected.")
+
+
+# =============================================================================
+# BOT COMMANDS
+# =============================================================================
+# Each command is a coroutine registered with @command. Handlers receive a
+# CommandContext; argument checks and owner-only restrictions declared in
+# the decorator are enforced by the registry before the handler runs.
+
+@command("!commands", help="List available commands")
+async def cmd_commands(ctx: CommandContext) -> None:
+    """List every registered command, generated from the registry."""
+    await ctx.reply("Commands:", static=True)
+    for line in ctx.bot.commands.help_lines():
+        await ctx.reply(line, static=True)
+
+
+@command("!die", usage="<botname>", help="Makes me leave :(", min_args=1, max_args=1, owner_only=True)
+async def cmd_die(ctx: CommandContext) -> None:
+    """Disconnect from IRC, if the argument names this bot."""
+    if ctx.args.lower() != ctx.bot.config.nick.lower():
+        return
+    await ctx.reply("Do you wanna build a snowman?", static=True)
+    await ctx.reply("It doesn't have to be a snowman.", static=True)
+    await ctx.reply("Ok, Bye :(", static=True)
+    await ctx.notify_master("I have to leave now :(", immediate=True)
+    ctx.bot.stop()  # Signal main loop to stop
+
+
+@command("!loglevel", usage="<level>", help="Change the log level", min_args=1, max_args=1, owner_only=True)
+async def cmd_loglevel(ctx: CommandContext) -> None:
+    """Set the process-wide log level, e.g. !loglevel DEBUG."""
+    try:
+        set_log_level(ctx.args)
+    except ValueError as e:
+        await ctx.reply(str(e))
+        return
+    ctx.bot.logger.warning(f"Log level set to {ctx.args.upper()} by {ctx.sender}")
+    await ctx.reply(f"Log level is now {ctx.args.upper()}")
+
+
+@command("!reload", help="Reload commands, replies and config", max_args=0, owner_only=True)
+async def cmd_reload(ctx: CommandContext) -> None:
+    """Hot-reload this file and the config, keeping the connection."""
+    if ctx.bot.reloader is None:
+        await ctx.reply("Reloading is not available here.")
+        return
+    try:
+        summary = await ctx.bot.reloader.reload()
+    except RuntimeError as e:
+        await ctx.reply(f"{e}; still running the previous version.")
+        return
+    await ctx.reply(summary)
+
+
+@command("!upgrade", help="Restart without disconnecting", max_args=0, owner_only=True)
+async def cmd_upgrade(ctx: CommandContext) -> None:
+    """Hand the connections to a freshly started process running the current code."""
+    if ctx.bot.handoff is None:
+        await ctx.reply("Upgrading is not available here.")
+        return
+    await ctx.reply("Handing over to a new process...")
+    ctx.bot.handoff.start(ctx.reply)
+
+
+@command("!say", usage="<text>", help="Say stuff", min_args=1)
+async def cmd_say(ctx: CommandContext) -> None:
+    """Echo text to the channel."""
+    await ctx.reply(ctx.args)
+    await ctx.notify_master(f"Message sent: {ctx.args}")
+
+
+@command("!lang", usage="<code>? ...", help="Language lookup", min_args=1)
+async def cmd_lang(ctx: CommandContext) -> None:
+    """Look up one or more language codes (e.g. "!lang en? de?")."""
+    await ctx.bot.handle_language_lookup(ctx.reply_target, ctx.args)
+
+
+@command("!langname", usage="<language>", help="Code for a language name", min_args=1)
+async def cmd_langname(ctx: CommandContext) -> None:
+    """Find the code for a language name (e.g. "!langname Yiddish")."""
+    await ctx.bot.handle_language_name_lookup(ctx.reply_target, ctx.args)
+
+
+@command("!cauth", usage="<username>", help="CentralAuth page for a user", min_args=1)
+async def cmd_cauth(ctx: CommandContext) -> None:
+    """Link to Wikimedia's CentralAuth page for the user, with a summary if enabled."""
+    url = f"https://meta.wikimedia.org/wiki/Special:CentralAuth/{ctx.args}"
+    summary = await ctx.bot.account_summary(ctx.args)
+    await ctx.reply(f"{url} ({summary})" if summary else url)
+    await ctx.notify_master(url)
+
+
+@command("!guc", usage="<username>", help="Global User Contributions page", min_args=1)
+async def cmd_guc(ctx: CommandContext) -> None:
+    """Link to Wikimedia's Global User Contributions tool, with a summary if enabled."""
+    url = f"https://guc.toolforge.org/?user={ctx.args}&blocks=true"
+    summary = await ctx.bot.account_summary(ctx.args)
+    await ctx.reply(f"{url} ({summary})" if summary else url)
+    await ctx.notify_master(url)
+
+
+@command("!link", usage="<path>", help="Custom link builder", min_args=1)
+async def cmd_link(ctx: CommandContext) -> None:
+    """Build an avicbot.org link."""
+    url = f"http://avicbot.org/{ctx.args}"
+    await ctx.reply(url)
+    await ctx.notify_master(url)
+
+
+@command("!seen", usage="<nick>", help="When a nick was last around", min_args=1, max_args=1)
+async def cmd_seen(ctx: CommandContext) -> None:
+    """Say where a nick is, or when and doing what it was last seen."""
+    bot = ctx.bot
+    nick = ctx.args
+    if nick.lower() == bot.nick.lower():
+        await ctx.reply("I'm right here!", static=True)
+        return
+    channels = bot.members.channels_of(nick)
+    if channels:
+        await ctx.reply(f"{nick} is in {', '.join(channels)} right now.")
+        return
+    record = await bot.seen.lookup(nick) if bot.seen is not None else None
+    if record is None:
+        await ctx.reply(f"I haven't seen {nick}.")
+        return
+    ago = format_duration(time.time() - record.at)
+    await ctx.reply(f"{record.nick} was last seen {ago} ago, {record.describe()}.")
+
+
+@command("!sing", help="Sing a song")
+async def cmd_sing(ctx: CommandContext) -> None:
+    """Sing a song."""
+    await ctx.reply("Daisy, Daisy, Give me your answer, do.", static=True)
+    await ctx.reply("I'm half crazy all for the love of you.", static=True)
+
+
+@command("!random", help="Random number (guaranteed fair)", coalesce=False)
+async def cmd_random(ctx: CommandContext) -> None:
+    """Random number. This was chosen by a fair roll of a d20."""
+    await ctx.reply("7.", static=True)
+
+
+# =============================================================================
+# HOT RELOAD
+# =============================================================================
+# SIGHUP or !reload re-executes this file as a fresh module and swaps its
+# command registry, reply table, language index and config into the running
+# bots. Connections, joined channels and send queues are untouched. The new
+# version is fully loaded and checked before anything is swapped, and put
+# back if the swapped-in version fails its checks.
+
+# BotConfig fields tied to the live connection, or only read at startup;
+# a reload keeps their current values
+RELOAD_KEEPS: frozenset[str] = frozenset({
+    "name", "nick", "server", "port", "channels", "username", "realname", "password",
+    "account", "sasl", "caps", "tls", "tls_verify", "tls_cert", "fallback_servers", "transport",
+    "buffer_size", "max_line_length", "max_handlers", "shards", "metrics_port", "metrics_host", "seen_db",
+})
+
+
+class Reloader:
+    """
+    Reloads commands, replies, language codes and config in place.
+    
+    Reading, compiling and running the new source, and loading the config
+    and trigger rules it needs, happen in a worker thread; only the swap
+    into the bots runs on the event loop. Compiling changed source still
+    holds the GIL for a few tens of milliseconds, but the networks are no
+    longer stalled for the whole load.
+    
+    Example:
+        >>> reloader = Reloader(bots, config_path="networks.json")
+        >>> await reloader.reload()
+        'Reloaded: 12 commands, 150 language codes, 1 bot(s)'
+    
+    Attributes:
+        bots: The bots updated by a reload
+        config_path: JSON config file to re-read, or None for the environment
+        source: Python file the new code is loaded from
+        reloads: Successful reloads so far
+        failures: Failed (and rolled back) reloads so far
+    """
+    
+    def __init__(self, bots: list["IRCBot"], config_path: Optional[str] = None,
+                 source: Optional[str] = None) -> None:
+        self.bots = bots
+        self.config_path = config_path
+        self.source = source or os.path.abspath(__file__)
+        self.reloads: int = 0
+        self.failures: int = 0
+        self._module_name: Optional[str] = None
+        self._running = False
+    
+    def _load_module(self, name: str) -> types.ModuleType:
+        """Execute the source file as a new module."""
+        spec = importlib.util.spec_from_file_location(name, self.source)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"cannot load {self.source}")
+        module = importlib.util.module_from_spec(spec)
+        # Dataclasses look their module up in sys.modules while being built
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+        return module
+    
+    def _new_config(self, bot: "IRCBot", configs: list[Any]) -> Any:
+        """The reloaded config for a bot, keeping its connection fields."""
+        by_name = {config.name: config for config in configs}
+        # Sharded connections are named "<network>#<n>"
+        new = by_name.get(bot.config.name) or by_name.get(bot.config.name.rpartition("#")[0])
+        if new is None:
+            raise ValueError(f"network {bot.config.name!r} is missing from the new config")
+        return replace(new, **{key: getattr(bot.config, key) for key in RELOAD_KEEPS})
+    
+    def _prepare(self, name: str) -> tuple[types.ModuleType, list[tuple["IRCBot", Any, Any]]]:
+        """
+        Load the new version and build every bot's config and triggers.
         
-        if match:
-            sender = match.group(1) or ""
-            command = match.group(2)
-            target = match.group(3)
-            message = match.group(4) or ""
-            return sender, command, target, message
+        Runs in a worker thread: nothing here touches the running bots.
         
-        return None
+        Returns:
+            The new module and a (bot, config, triggers) plan per bot
+        """
+        module = self._load_module(name)
+        try:
+            configs = (module.load_network_configs(self.config_path) if self.config_path
+                       else [module.BotConfig()])
+            plans = []
+            for bot in self.bots:
+                config = self._new_config(bot, configs)
+                plans.append((bot, config, module.TriggerEngine(module.load_trigger_rules(config.triggers_file))))
+        except BaseException:
+            sys.modules.pop(name, None)
+            raise
+        return module, plans
     
-    async def run(self) -> None:
+    async def reload(self) -> str:
         """
-        Main bot event loop.
+        Load the new version and swap it into every bot.
         
-        This method:
-        1. Connects to the IRC server
-        2. Joins configured channels
-        3. Continuously reads and processes incoming messages
-        4. Handles PING/PONG keepalive
-        5. Routes PRIVMSG to message handlers
+        Returns:
+            A one-line summary of what was loaded
         
-        The loop continues until self.running is set to False
-        (typically via the !die command) or a connection error occurs.
+        Raises:
+            RuntimeError: If the new version could not be loaded or failed
+                its checks, or a reload is already running; the previous
+                version is still in place
         """
-        await self.connect()
-        self.running = True
+        if self._running:
+            raise RuntimeError("a reload is already in progress")
+        self._running = True
+        try:
+            return await self._reload()
+        finally:
+            self._running = False
+    
+    async def _reload(self) -> str:
+        """reload() without the guard against running twice at once."""
+        name = f"avicbotirc_reload{self.reloads + self.failures + 1}"
+        try:
+            module, plans = await asyncio.to_thread(self._prepare, name)
+        except asyncio.CancelledError:
+            # The thread may still finish; its module must not stay around
+            sys.modules.pop(name, None)
+            self.failures += 1
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Reload failed, keeping the running version: {e!r}")
+            raise RuntimeError(f"reload failed: {e}") from e
         
-        # Join all configured channels
-        for channel in self.config.channels:
-            await self.join_channel(channel.strip())
+        previous = [bot.reloadable_state() for bot in self.bots]
+        try:
+            for bot, config, triggers in plans:
+                bot.apply_reload(config, module.COMMANDS, module.LANGUAGE_INDEX, triggers)
+            # The new version must still be able to list and reload itself
+            if module.COMMANDS.get("!reload") is None:
+                raise ValueError("the new version has no !reload command")
+            module.COMMANDS.help_lines()
+        except Exception as e:
+            for bot, state in zip(self.bots, previous):
+                bot.apply_reload(*state)
+            del sys.modules[module.__name__]
+            self.failures += 1
+            logger.error(f"Reload rolled back: {e!r}")
+            raise RuntimeError(f"reload rolled back: {e}") from e
         
-        logger.info("Bot is now running. Listening for messages...")
+        if self._module_name is not None:
+            sys.modules.pop(self._module_name, None)
+        self._module_name = module.__name__
+        self.reloads += 1
+        summary = (f"Reloaded: {len(module.COMMANDS)} commands, "
+                   f"{len(module.LANGUAGE_CODES)} language codes, {len(self.bots)} bot(s)")
+        logger.info(summary)
+        return summary
+
+
+async def reload_quietly(reloader: Reloader) -> None:
+    """Reload for a signal or supervisor request, where failures are only logged."""
+    logger.info("Reload requested")
+    try:
+        await reloader.reload()
+    except RuntimeError:
+        pass  # Already logged; the previous version keeps running
+
+
+# =============================================================================
+# SESSION HANDOFF
+# =============================================================================
+# Upgrades that need a new process (a new interpreter, or changes a hot
+# reload cannot pick up) hand the live connections over instead of
+# reconnecting. The running process starts its successor with
+# --resume-from PATH and listens on that Unix socket; the successor
+# connects, receives every IRC socket with SCM_RIGHTS (socket.send_fds)
+# together with a JSON description of each session, and acknowledges.
+# Only then does the old process let go, without sending QUIT, so the
+# server never sees a disconnect.
+
+# Seconds the new process has to connect, and then to acknowledge
+HANDOFF_TIMEOUT = 60.0
+
+# Most sessions (file descriptors) handed over at once
+HANDOFF_MAX_SESSIONS = 64
+
+_HANDOFF_LENGTH = struct.Struct("!I")
+
+
+@dataclass
+class ResumedSession:
+    """
+    A connection received from the previous process.
+    
+    Attributes:
+        sock: The connected IRC socket
+        nick: Nick in use on the connection
+        channels: Channels the bot is in, mapped to their keys ("" if none)
+        prefix_length: Length of our nick!user@host as the server shows it
+        unread: Data received by the previous process but not processed
+        unsent: (priority, line) pairs the previous process had queued
+            but not sent
+        caps: IRCv3 capabilities enabled on the connection
+    """
+    sock: socket.socket
+    nick: str
+    channels: dict[str, str]
+    prefix_length: int
+    unread: bytes
+    unsent: list[tuple[int, bytes]] = field(default_factory=list)
+    caps: list[str] = field(default_factory=list)
+
+
+class SessionHandoff:
+    """
+    Hands this process's IRC connections to a freshly started process.
+    
+    Example:
+        >>> handoff = SessionHandoff(bots)
+        >>> await handoff.upgrade()  # Returns once the new process has them
+    
+    Attributes:
+        bots: The bots whose connections are handed over
+        argv: Command line of the new process, without --resume-from
+    """
+    
+    def __init__(self, bots: list["IRCBot"], argv: Optional[list[str]] = None) -> None:
+        self.bots = bots
+        self.argv = argv or [sys.executable, *_strip_resume_args(sys.argv)]
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, reply: Optional[Callable[[str], Awaitable[Any]]] = None) -> None:
+        """
+        Run upgrade() as a task of its own, e.g. for !upgrade.
         
-        # Buffer for accumulating partial messages
-        buffer = ""
+        A command handler must not await upgrade() itself: the dispatcher
+        cancels handlers after handler_timeout, which is shorter than
+        HANDOFF_TIMEOUT, and the handoff waits for running handlers.
         
-        while self.running:
+        Args:
+            reply: Called with the reason if the upgrade fails
+        """
+        async def run() -> None:
             try:
-                # Read data from the server
-                # IRC messages are line-delimited, so we read and split by lines
-                if self.reader is None:
-                    logger.error("Reader is None, connection lost")
-                    break
-                
-                data = await self.reader.read(self.config.buffer_size)
-                
-                if not data:
-                    logger.warning("Connection closed by server")
-                    break
-                
-                # Decode and add to buffer, then process complete lines
-                buffer += data.decode("utf-8", errors="replace")
-                lines = buffer.split("\r\n")
-                
-                # Keep the last incomplete line in the buffer
-                buffer = lines.pop()
-                
-                for line in lines:
-                    if not line:
-                        continue
-                    
-                    logger.debug(f"<<< {line}")
-                    
-                    # Handle PING to keep connection alive
-                    if line.startswith("PING"):
-                        # Extract ping payload (everything after "PING :")
-                        payload = line.split(":", 1)[1] if ":" in line else "pingis"
-                        await self.handle_ping(payload)
-                        continue
-                    
-                    # Parse and route other messages
-                    parsed = self.parse_message(line)
-                    if parsed:
-                        sender, command, target, message = parsed
-                        
-                        if command == "PRIVMSG":
-                            await self.handle_message(sender, target, message)
-                
-                # Small delay to prevent CPU spinning
-                await asyncio.sleep(0.1)
-                
-            except asyncio.CancelledError:
-                logger.info("Bot shutdown requested")
-                break
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                await asyncio.sleep(1)  # Brief delay before retry
+                await self.upgrade()
+            except RuntimeError as e:
+                if reply is not None:
+                    await reply(f"{e}; carrying on as before.")
         
-        # Clean up connection
-        await self.disconnect()
+        self._task = asyncio.create_task(run())
     
-    async def disconnect(self) -> None:
+    async def upgrade(self) -> str:
         """
-        Gracefully disconnect from the IRC server.
+        Start the new process and give it every connected session.
         
-        Sends a QUIT message and closes the connection properly.
+        If anything fails before the new process acknowledges, or the
+        upgrade is cancelled, the new process is killed, the sessions are
+        taken back and this process carries on as before. On success
+        every bot is stopped without sending QUIT.
+        
+        Returns:
+            A one-line summary
+        
+        Raises:
+            RuntimeError: If the handoff failed, or a session uses TLS
+                (its encryption state lives in this process); nothing has
+                changed
         """
-        logger.info("Disconnecting from IRC server...")
+        if self._running:
+            raise RuntimeError("an upgrade is already in progress")
+        tls = [bot.config.name or bot.config.server for bot in self.bots if bot.config.tls and bot.writer is not None]
+        if tls:
+            raise RuntimeError(f"TLS sessions cannot be handed over ({', '.join(tls)}); restart instead")
+        self._running = True
+        loop = asyncio.get_running_loop()
+        path = os.path.join(tempfile.gettempdir(), f"avicbot-upgrade-{os.getpid()}.sock")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        process: Optional[subprocess.Popen] = None
+        conn: Optional[socket.socket] = None
+        detached: list[tuple["IRCBot", dict[str, Any]]] = []
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+            listener.bind(path)
+            os.chmod(path, 0o600)
+            listener.listen(1)
+            listener.setblocking(False)
+            
+            process = subprocess.Popen([*self.argv, "--resume-from", path])
+            logger.info(f"Upgrade: started new process (pid {process.pid}), waiting for it to connect")
+            conn, _ = await asyncio.wait_for(loop.sock_accept(listener), HANDOFF_TIMEOUT)
+            
+            states: list[dict[str, Any]] = []
+            fds: list[int] = []
+            for bot in self.bots:
+                if bot.writer is None:
+                    continue  # Disconnected; the new process will connect it
+                state, fd = await bot.detach_session()
+                detached.append((bot, state))
+                states.append(state)
+                fds.append(fd)
+            if len(fds) > HANDOFF_MAX_SESSIONS:
+                raise RuntimeError(f"too many sessions to hand over ({len(fds)})")
+            
+            payload = json.dumps({"version": 1, "sessions": states}).encode("utf-8")
+            socket.send_fds(conn, [_HANDOFF_LENGTH.pack(len(payload))], fds)
+            await loop.sock_sendall(conn, payload)
+            reply = await asyncio.wait_for(loop.sock_recv(conn, 1024), HANDOFF_TIMEOUT)
+            if reply.strip() != b"ok":
+                raise RuntimeError(reply.decode("utf-8", "replace").strip() or "new process exited")
+        except BaseException as e:
+            # Cancellation too: half-done, the sessions would stay paused
+            # and the new process would keep running. Kill it before taking
+            # the sockets back, so only one process ever uses them.
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            for bot, state in detached:
+                bot.reattach_session(state)
+            logger.error(f"Upgrade failed, keeping the connections: {e!r}")
+            if not isinstance(e, Exception):
+                raise
+            raise RuntimeError(f"upgrade failed: {str(e) or type(e).__name__}") from e
+        finally:
+            self._running = False
+            if conn is not None:
+                conn.close()
+            listener.close()
+            if os.path.exists(path):
+                os.unlink(path)
+        
+        for bot, _ in detached:
+            bot.handed_off = True
+        for bot in self.bots:
+            bot.stop()
+        summary = f"Handed {len(detached)} session(s) to pid {process.pid}"
+        logger.info(summary)
+        return summary
+
+
+def _strip_resume_args(argv: list[str]) -> list[str]:
+    """A command line without any --resume-from option."""
+    stripped: list[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--resume-from":
+            skip = True
+        elif not arg.startswith("--resume-from="):
+            stripped.append(arg)
+    return stripped
+
+
+def _handoff_channels(channels: dict[str, str] | list[str]) -> dict[str, str]:
+    """
+    Channel keys from a handoff state.
+    
+    Older versions handed over a list of channel names without their keys;
+    those channels get an empty key here.
+    """
+    if isinstance(channels, list):
+        return dict.fromkeys(channels, "")
+    return dict(channels)
+
+
+def receive_sessions(path: str, configs: list[BotConfig]) -> dict[str, ResumedSession]:
+    """
+    Take over the connections of the process that started this one.
+    
+    Connects to the previous process's handoff socket, receives the IRC
+    sockets and their session state, and acknowledges once every session
+    belongs to one of the configured networks. Runs before the event loop
+    starts.
+    
+    Args:
+        path: The Unix socket given with --resume-from
+        configs: This process's network configs
+    
+    Returns:
+        Resumed sessions keyed by network name
+    
+    Raises:
+        RuntimeError: If no sessions could be taken over; the previous
+            process then keeps them
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(HANDOFF_TIMEOUT)
+    fds: list[int] = []
+    try:
+        conn.connect(path)
+        header, fds, _, _ = socket.recv_fds(conn, _HANDOFF_LENGTH.size, HANDOFF_MAX_SESSIONS)
+        while len(header) < _HANDOFF_LENGTH.size:
+            more = conn.recv(_HANDOFF_LENGTH.size - len(header))
+            if not more:
+                raise ConnectionError("handoff socket closed early")
+            header += more
+        (length,) = _HANDOFF_LENGTH.unpack(header)
+        payload = bytearray()
+        while len(payload) < length:
+            more = conn.recv(length - len(payload))
+            if not more:
+                raise ConnectionError("handoff socket closed early")
+            payload += more
         
+        states = json.loads(payload)["sessions"]
+        names = {config.name for config in configs}
+        unknown = [state["name"] for state in states if state["name"] not in names]
+        if len(states) != len(fds) or unknown:
+            raise ValueError(f"sessions for unconfigured network(s): {', '.join(map(repr, unknown))}")
+        sessions = {
+            state["name"]: ResumedSession(
+                sock=socket.socket(fileno=fd),
+                nick=state["nick"],
+                channels=_handoff_channels(state["channels"]),
+                prefix_length=state["prefix_length"],
+                unread=base64.b64decode(state["unread"]),
+                unsent=[(priority, base64.b64decode(line)) for priority, line in state.get("unsent", [])],
+                caps=state.get("caps", []),
+            )
+            for state, fd in zip(states, fds)
+        }
+        conn.sendall(b"ok\n")
+        return sessions
+    except (OSError, ValueError, KeyError) as e:
         try:
-            if self.writer:
-                await self.send_raw("QUIT :Goodbye!")
-                self.writer.close()
-                await self.writer.wait_closed()
-        except Exception as e:
-            logger.error(f"Error during disconnect: {e}")
+            conn.sendall(f"new process refused the sessions: {e}\n".encode("utf-8"))
+        except OSError:
+            pass
+        for fd in fds:
+            os.close(fd)
+        raise RuntimeError(f"could not resume from {path}: {e}") from e
+    finally:
+        conn.close()
+
+
+async def upgrade_quietly(handoff: SessionHandoff) -> None:
+    """Upgrade for a signal, where failures are only logged."""
+    logger.info("Upgrade requested")
+    try:
+        await handoff.upgrade()
+    except RuntimeError:
+        pass  # Already logged; this process keeps the connections
+
+
+# =============================================================================
+# MULTI-PROCESS SUPERVISOR
+# =============================================================================
+# With --workers N the main process becomes a supervisor: networks (and,
+# for networks with "shards" > 1, groups of their channels) are spread over
+# N worker processes, each running its share of bots on its own event loop.
+# Workers report health over a pipe, and a worker that dies is restarted
+# within seconds instead of waiting for an external restart script.
+
+def shard_configs(configs: list[BotConfig], workers: int) -> list[list[BotConfig]]:
+    """
+    Split networks across worker processes.
+    
+    A network whose config has shards > 1 is first split into that many
+    connections, each with an equal share of the channels and a numbered
+    nick (AvicBot, AvicBot1, ...). The connections are then assigned to
+    workers largest first, each to the worker with the fewest channels.
+    
+    Args:
+        configs: One BotConfig per network
+        workers: Number of worker processes
+    
+    Returns:
+        One list of configs per worker; empty lists are dropped
+    """
+    units: list[BotConfig] = []
+    for config in configs:
+        shards = max(1, min(config.shards, len(config.channels)))
+        for index in range(shards):
+            unit = replace(config, channels=config.channels[index::shards], shards=1)
+            if shards > 1:
+                unit.name = f"{config.name or config.server}#{index}"
+                unit.nick = config.nick if index == 0 else f"{config.nick}{index}"
+            units.append(unit)
+    
+    assignments: list[list[BotConfig]] = [[] for _ in range(max(1, workers))]
+    loads = [0] * len(assignments)
+    for unit in sorted(units, key=lambda u: len(u.channels), reverse=True):
+        target = loads.index(min(loads))
+        assignments[target].append(unit)
+        loads[target] += max(1, len(unit.channels))
+    return [shard for shard in assignments if shard]
+
+
+def _worker_main(index: int, configs: list[BotConfig], conn: Any, stats_interval: float,
+                 log_queue: Any = None, config_path: Optional[str] = None) -> None:
+    """
+    Entry point of a worker process.
+    
+    Runs the worker's bots and sends a stats dictionary to the supervisor
+    every stats_interval seconds. A "stop" message from the supervisor
+    shuts the bots down cleanly and a "reload" message hot-reloads them.
+    Log records are forwarded to the supervisor through log_queue.
+    """
+    # Ctrl+C (and a hangup) reach the whole process group; let the supervisor decide
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if log_queue is not None:
+        setup_worker_logging(log_queue)
+    use_uvloop()
+    
+    async def run() -> None:
+        loop = asyncio.get_running_loop()
+        # Each worker serves its own metrics, on metrics_port + worker index
+        bots = [
+            IRCBot(replace(config, metrics_port=config.metrics_port + index) if config.metrics_port else config)
+            for config in configs
+        ]
+        started = time.monotonic()
         
-        self.reader = None
-        self.writer = None
-        logger.info("Disconnected.")
+        def on_message() -> None:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = "stop"  # Supervisor is gone
+            if message == "stop":
+                loop.remove_reader(conn.fileno())
+                for bot in bots:
+                    bot.stop()
+            elif message == "reload" and bots[0].reloader is not None:
+                asyncio.ensure_future(reload_quietly(bots[0].reloader))
+        
+        async def report() -> None:
+            # First report once the bots have had a moment to connect
+            await asyncio.sleep(min(1.0, stats_interval))
+            while True:
+                conn.send({
+                    "worker": index,
+                    "pid": os.getpid(),
+                    "uptime": time.monotonic() - started,
+                    "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+                    "bots": [bot.stats() for bot in bots],
+                })
+                await asyncio.sleep(stats_interval)
+        
+        loop.add_reader(conn.fileno(), on_message)
+        reporter = asyncio.create_task(report())
+        try:
+            await run_bots(bots, config_path, standalone=False)
+        finally:
+            reporter.cancel()
+    
+    asyncio.run(run())
+
+
+class Supervisor:
+    """
+    Runs bots in worker processes and restarts any worker that dies.
+    
+    Example:
+        >>> Supervisor(load_network_configs("networks.json"), workers=4).run()
+    
+    Attributes:
+        shards: The configs assigned to each worker
+        stats: Latest stats reported by each worker, keyed by worker index
+        restarts: Number of restarts per worker index
+        stats_file: Optional path where aggregated stats are written as JSON
+        config_path: Config file the workers re-read when reloading
+    """
+    
+    def __init__(self, configs: list[BotConfig], workers: int,
+                 stats_interval: float = 10.0, stats_file: Optional[str] = None,
+                 config_path: Optional[str] = None) -> None:
+        """
+        Initialize the supervisor.
+        
+        Args:
+            configs: One BotConfig per network
+            workers: Number of worker processes to spread the networks over
+            stats_interval: Seconds between worker stats reports
+            stats_file: Optional path to write aggregated stats to
+            config_path: Config file the workers re-read when reloading
+        """
+        self.shards = shard_configs(configs, workers)
+        self.stats_interval = stats_interval
+        self.stats_file = stats_file
+        self.config_path = config_path
+        self.stats: dict[int, dict[str, Any]] = {}
+        self.restarts: dict[int, int] = dict.fromkeys(range(len(self.shards)), 0)
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._conns: dict[int, Any] = {}
+        self._restart_at: dict[int, float] = {}
+        self._backoff: dict[int, float] = {}
+        self._started_at: dict[int, float] = {}
+        self._stopping = False
+        self._reload_requested = False
+        self._log_queue: Any = None
+    
+    def _start_worker(self, index: int) -> None:
+        """Start (or restart) the worker process for one shard."""
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(index, self.shards[index], child_conn, self.stats_interval, self._log_queue, self.config_path),
+            name=f"avicbot-worker-{index}",
+        )
+        process.start()
+        child_conn.close()
+        self._processes[index] = process
+        self._conns[index] = parent_conn
+        self._started_at[index] = time.monotonic()
+        names = ", ".join(config.name or config.server for config in self.shards[index])
+        logger.info(f"Worker {index} started (pid {process.pid}): {names}")
+    
+    def _worker_exited(self, index: int) -> None:
+        """Schedule a restart for a worker that has exited."""
+        process = self._processes.pop(index)
+        self._conns.pop(index).close()
+        self.stats.pop(index, None)
+        process.join()
+        if self._stopping:
+            return
+        
+        # Restart quickly, backing off only if the worker keeps crashing
+        uptime = time.monotonic() - self._started_at[index]
+        backoff = 1.0 if uptime > STABLE_SESSION_SECONDS else min(30.0, self._backoff.get(index, 0.5) * 2)
+        self._backoff[index] = backoff
+        self._restart_at[index] = time.monotonic() + backoff
+        self.restarts[index] += 1
+        logger.error(f"Worker {index} exited with code {process.exitcode}; restarting in {backoff:.0f}s")
+    
+    def aggregate(self) -> dict[str, Any]:
+        """
+        Summarize the latest stats from every worker.
+        
+        Returns:
+            Totals across workers plus the per-worker reports
+        """
+        bots = [bot for report in self.stats.values() for bot in report["bots"]]
+        return {
+            "workers": len(self.shards),
+            "workers_alive": len(self._processes),
+            "restarts": sum(self.restarts.values()),
+            "connections": len(bots),
+            "connected": sum(1 for bot in bots if bot["connected"]),
+            "channels": sum(bot["channels"] for bot in bots),
+            "send_queue_depth": sum(bot["send_queue_depth"] for bot in bots),
+            "reconnects": sum(bot["reconnects"] for bot in bots),
+            "per_worker": self.stats,
+        }
+    
+    def _report(self) -> None:
+        """Log aggregated health and write it to the stats file."""
+        summary = self.aggregate()
+        logger.info(
+            f"Workers {summary['workers_alive']}/{summary['workers']} up, "
+            f"{summary['connected']}/{summary['connections']} connected, "
+            f"{summary['channels']} channels, {summary['restarts']} restart(s)"
+        )
+        if self.stats_file:
+            tmp_path = f"{self.stats_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+            os.replace(tmp_path, self.stats_file)
+    
+    def run(self) -> None:
+        """
+        Start all workers and supervise them until SIGINT or SIGTERM.
+        
+        SIGHUP asks every worker to hot-reload.
+        """
+        def request_stop(signum: int, _frame: Any) -> None:
+            logger.info(f"Received signal {signum}, stopping workers...")
+            self._stopping = True
+        
+        def request_reload(_signum: int, _frame: Any) -> None:
+            self._reload_requested = True
+        
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, request_reload)
+        
+        # Workers log through us, so only this process writes the log files
+        self._log_queue = multiprocessing.Queue()
+        log_forwarder = logging.handlers.QueueListener(self._log_queue, _LogForwarder())
+        log_forwarder.start()
+        
+        for index in range(len(self.shards)):
+            self._start_worker(index)
+        
+        next_report = time.monotonic() + self.stats_interval
+        while not self._stopping:
+            # Wake on worker exit, a stats message, or the next deadline
+            handles = {p.sentinel: i for i, p in self._processes.items()}
+            conns = {id(c): i for i, c in self._conns.items()}
+            ready = multiprocessing.connection.wait(
+                list(handles) + list(self._conns.values()), timeout=0.5
+            )
+            for handle in ready:
+                if isinstance(handle, int):
+                    if handles[handle] in self._processes:
+                        self._worker_exited(handles[handle])
+                    continue
+                index = conns[id(handle)]
+                try:
+                    self.stats[index] = handle.recv()
+                except (EOFError, OSError):
+                    pass  # The sentinel reports the exit
+            
+            if self._reload_requested:
+                self._reload_requested = False
+                logger.info("Asking workers to reload...")
+                for conn in self._conns.values():
+                    try:
+                        conn.send("reload")
+                    except (BrokenPipeError, OSError):
+                        pass
+            
+            now = time.monotonic()
+            for index, due in list(self._restart_at.items()):
+                if now >= due and not self._stopping:
+                    del self._restart_at[index]
+                    self._start_worker(index)
+            if now >= next_report:
+                self._report()
+                next_report = now + self.stats_interval
+        
+        self._shutdown()
+        log_forwarder.stop()
+    
+    def _shutdown(self, timeout: float = 10.0) -> None:
+        """Ask every worker to quit cleanly, then terminate stragglers."""
+        for conn in self._conns.values():
+            try:
+                conn.send("stop")
+            except (BrokenPipeError, OSError):
+                pass
+        deadline = time.monotonic() + timeout
+        for index, process in self._processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in time; terminating")
+                process.terminate()
+                process.join()
+        logger.info("All workers stopped.")
 
 
 # =============================================================================
 # MAIN ENTRY POINT
 # =============================================================================
 
-def main() -> int:
+async def run_bots(bots: list[IRCBot], config_path: Optional[str] = None,
+                   standalone: bool = True) -> None:
+    """
+    Run several bots concurrently on the current event loop.
+    
+    The bots share the command registry, the language index and the other
+    module-level read-only tables; everything tied to a connection (send
+    queue, handlers, channels, nick) belongs to its own IRCBot.
+    
+    If any bot has metrics enabled, one MetricsServer for the whole
+    process serves all of them on the first configured metrics port.
+    
+    All the bots share one HTTPClient, for account lookups, and one
+    Reloader, used by !reload. A standalone
+    process (not a --workers worker) also reloads on SIGHUP, and can hand
+    its connections to a new process with !upgrade or SIGUSR2.
+    
+    Args:
+        bots: The bots to run until all of them have stopped
+        config_path: Config file the bots were loaded from, re-read on reload
+        standalone: False in worker processes, whose signals and upgrades
+            are the supervisor's business
+    """
+    reloader = Reloader(bots, config_path)
+    handoff = SessionHandoff(bots) if standalone else None
+    http = HTTPClient()
+    for bot in bots:
+        bot.reloader = reloader
+        bot.handoff = handoff
+        bot.http = http
+    
+    loop = asyncio.get_running_loop()
+    signals: list[int] = []
+    if standalone:
+        handlers = [
+            (getattr(signal, "SIGHUP", None), lambda: asyncio.ensure_future(reload_quietly(reloader))),
+            (getattr(signal, "SIGUSR2", None), lambda: asyncio.ensure_future(upgrade_quietly(handoff))),
+        ]
+        for signum, handler in handlers:
+            if signum is None:
+                continue
+            try:
+                loop.add_signal_handler(signum, handler)
+                signals.append(signum)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not on this platform, or not the main thread
+    
+    metrics_server = None
+    measured = [bot for bot in bots if bot.metrics is not None]
+    if measured:
+        config = measured[0].config
+        metrics_server = MetricsServer(bots, config.metrics_host, config.metrics_port)
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(f"Could not start metrics server: {e}")
+            metrics_server = None
+    
+    try:
+        results = await asyncio.gather(*(bot.run() for bot in bots), return_exceptions=True)
+    finally:
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await http.close()
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+    
+    for bot, result in zip(bots, results):
+        if isinstance(result, Exception):
+            bot.logger.error(f"Bot stopped with an error: {result!r}")
+
+
+async def run_networks(configs: list[BotConfig], config_path: Optional[str] = None,
+                       sessions: Optional[dict[str, ResumedSession]] = None) -> list[IRCBot]:
+    """
+    Run one IRCBot per network concurrently on the current event loop.
+    
+    Args:
+        configs: One BotConfig per network
+        config_path: Config file the configs came from, re-read on reload
+        sessions: Connections taken over from the previous process, by
+            network name; other networks connect as usual
+    
+    Returns:
+        The bots, after all of them have stopped
+    """
+    sessions = sessions or {}
+    bots = [IRCBot(config, sessions.get(config.name)) for config in configs]
+    await run_bots(bots, config_path)
+    return bots
+
+
+def main(argv: Optional[list[str]] = None) -> int:
     """
     Application entry point.
     
-    Creates the bot configuration from environment variables,
-    instantiates the IRCBot, and runs the async event loop.
+    Creates the bot configuration from environment variables (or, with
+    --config, one configuration per network from a JSON file),
+    instantiates the IRCBots, and runs the async event loop.
+    
+    Args:
+        argv: Command-line arguments (default: sys.argv[1:])
     
     Returns:
         Exit code (0 for success, 1 for error)
     """
+    parser = argparse.ArgumentParser(description="AvicBotIRC - A Modern Python IRC Bot")
+    parser.add_argument(
+        "--config", default=os.getenv("AVICBOT_CONFIG"),
+        help="JSON file describing one or more networks (default: $AVICBOT_CONFIG)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("AVICBOT_WORKERS", "0")),
+        help="spread networks over this many supervised worker processes (default: 0, run in-process)",
+    )
+    parser.add_argument(
+        "--stats-file", default=os.getenv("AVICBOT_STATS_FILE"),
+        help="with --workers, periodically write aggregated worker stats to this JSON file",
+    )
+    parser.add_argument(
+        "--resume-from", metavar="SOCKET",
+        help="take over the connections of a running bot (used by !upgrade)",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+    if use_uvloop():
+        logger.info("Using the uvloop event loop")
+    
     logger.info("=" * 60)
     logger.info("AvicBotIRC - Starting up")
     logger.info("=" * 60)
     
     try:
-        # Load configuration from environment or use defaults
-        config = BotConfig()
+        # Load configuration from the config file, or environment/defaults
+        configs = load_network_configs(args.config) if args.config else [BotConfig()]
         
-        logger.info(f"Bot Nick: {config.nick}")
-        logger.info(f"Server: {config.server}:{config.port}")
-        logger.info(f"Channels: {', '.join(config.channels)}")
-        logger.info(f"Master: {config.master}")
+        for config in configs:
+            prefix = f"[{config.name}] " if config.name else ""
+            logger.info(f"{prefix}Bot Nick: {config.nick}")
+            logger.info(f"{prefix}Server: {config.server}:{config.port}")
+            logger.info(f"{prefix}Channels: {', '.join(parse_channel(channel)[0] for channel in config.channels)}")
+            logger.info(f"{prefix}Master: {config.master}")
         
-        # Create and run the bot
-        bot = IRCBot(config)
-        asyncio.run(bot.run())
+        if args.workers > 0:
+            if args.resume_from:
+                raise ValueError("--resume-from cannot be combined with --workers")
+            # Supervise worker processes, restarting any that crash
+            Supervisor(configs, args.workers, stats_file=args.stats_file, config_path=args.config).run()
+        else:
+            # Take over the previous process's connections, if upgrading
+            sessions = receive_sessions(args.resume_from, configs) if args.resume_from else None
+            # Create and run the bots, all on one event loop
+            asyncio.run(run_networks(configs, args.config, sessions))
         
         logger.info("Bot shutdown complete.")
         return 0
@@ -882,6 +7045,9 @@ def main() -> int:
     except Exception as e:
         logger.error(f"Fatal error: {e}")
         return 1
+    finally:
+        # Write out anything still queued for the logging thread
+        stop_logging()
 
 
 # Run the bot when executed directly (not imported as a module)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the same command asked by many people at once, under rate limits.
+
+Sends bursts of identical commands through IRCBot.handle_command(), as if
+a crowd had asked them in one channel, into a send queue that records
+what would go out. Reports, per scenario, the requests made, the replies
+sent, and how many requests were coalesced or rate limited:
+
+    crowd           --users people ask the same thing at once
+    spammer_first   someone already answered asks again once the coalescing
+                    window is over, but is now over their rate limit; the
+                    others ask right after (and must still be answered)
+    limited_crowd   the crowd again, with a channel limit below its size
+
+Each scenario also checks its expected behaviour: one reply per distinct
+question, and a rate-limited request never suppressing the requests
+that follow it. The exit status is 1 if any check fails.
+
+Usage:
+    python benchmarks/bench_coalesce.py [--users N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import avicbotirc  # noqa: E402
+from avicbotirc import BotConfig, IRCBot, SendQueue  # noqa: E402
+
+CHANNEL = "#channel"
+QUESTION = "!lang de?"
+
+# Kept short so that a window can lapse within the run
+COALESCE_WINDOW = 0.2
+
+
+class RecordingWriter:
+    """StreamWriter stand-in that keeps the PRIVMSG lines written to it."""
+    
+    def __init__(self) -> None:
+        self.replies: list[str] = []
+    
+    def write(self, data: bytes) -> None:
+        self.replies += [line for line in data.decode("utf-8").split("\r\n") if line.startswith("PRIVMSG")]
+    
+    async def drain(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        pass
+
+
+def make_bot(**limits) -> tuple[IRCBot, RecordingWriter]:
+    """An IRCBot whose output is recorded instead of sent."""
+    config = dict(nick_rate_limit=0, host_rate_limit=0, channel_rate_limit=0, coalesce_window=COALESCE_WINDOW)
+    config.update(limits)
+    bot = IRCBot(BotConfig(seen_db="", notify_interval=0, metrics_port=0, **config))
+    writer = RecordingWriter()
+    bot.writer = writer
+    bot.send_queue = SendQueue(writer, rate=0)
+    bot.send_queue.start()
+    return bot, writer
+
+
+async def ask(bot: IRCBot, writer: RecordingWriter, askers: list[str]) -> list[str]:
+    """Have each nick ask QUESTION in CHANNEL; returns the replies sent."""
+    sent = len(writer.replies)
+    for nick in askers:
+        await bot.handle_command(nick, CHANNEL, QUESTION, f"{nick}.example", f"{nick}!~{nick}@{nick}.example")
+    await bot.send_queue.flush()
+    return writer.replies[sent:]
+
+
+def report(name: str, requests: int, writer: RecordingWriter, bot: IRCBot) -> None:
+    """Print the totals of one scenario's bot."""
+    replies = writer.replies
+    limited = sum(counter.rejected for counter in bot.rate_limiter.counters)
+    print(f"{name:<14} {requests:>9} {len(replies):>8} {bot.coalescer.suppressed:>10} {limited:>8}")
+
+
+async def run(users: int) -> list[str]:
+    failures: list[str] = []
+    crowd = [f"user{index}" for index in range(users)]
+    print(f"{'scenario':<14} {'requests':>9} {'replies':>8} {'coalesced':>10} {'limited':>8}")
+    
+    bot, writer = make_bot()
+    replies = await ask(bot, writer, crowd)
+    report("crowd", users, writer, bot)
+    if len(replies) != 1:
+        failures.append(f"crowd: {len(replies)} replies to one question")
+    
+    # The spammer's second question is over their limit and dropped; it
+    # must not stop the next person's from being answered
+    bot, writer = make_bot(nick_rate_limit=1)
+    await ask(bot, writer, ["spammer"])
+    await asyncio.sleep(COALESCE_WINDOW * 1.5)
+    replies = await ask(bot, writer, ["spammer", *crowd])
+    report("spammer_first", users + 2, writer, bot)
+    if len(replies) != 1:
+        failures.append(f"spammer_first: {len(replies)} replies after a rate-limited request, expected 1")
+    
+    # More askers than the channel allows: the first is answered and the
+    # rest are limited or coalesced
+    bot, writer = make_bot(channel_rate_limit=3)
+    replies = await ask(bot, writer, crowd)
+    report("limited_crowd", users, writer, bot)
+    if len(replies) != 1:
+        failures.append(f"limited_crowd: {len(replies)} replies to one question")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=50, help="people asking at once")
+    args = parser.parse_args()
+    avicbotirc.logger.setLevel("ERROR")
+    
+    failures = asyncio.run(run(max(args.users, 2)))
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
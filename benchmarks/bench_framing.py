@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: inbound line framing.
+
+Compares the original read loop (str buffer, split on CRLF, fixed
+asyncio.sleep(0.1) after every read) against LineFramer, which hands back
+lines as soon as their terminator arrives.
+
+Two measurements are taken for each reader:
+    - Throughput: a large burst of channel traffic is fed into a
+      StreamReader up front and drained as fast as possible (lines/sec).
+    - Latency: lines are fed one at a time at random intervals, and the
+      time from arrival to processing is recorded per line.
+
+Usage:
+    python benchmarks/bench_framing.py [--lines N] [--samples N]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from avicbotirc import LineFramer  # noqa: E402
+
+# A representative mix of inbound traffic
+SAMPLE_LINES = [
+    b":Nick!user@host.example PRIVMSG #channel :just some ordinary chatter here",
+    b":Other!~other@gateway/web/irccloud.com/x-abc PRIVMSG #channel :!lang de?",
+    b"PING :irc.libera.chat",
+    b":Someone!some@one.example JOIN #channel",
+    b":irc.libera.chat 353 AvicBot = #channel :@op +voice user1 user2 user3",
+    b":Nick!user@host.example PRIVMSG #channel :hello AvicBot",
+]
+
+
+async def legacy_reader(reader: asyncio.StreamReader, on_line) -> None:
+    """The read loop as it was before LineFramer."""
+    buffer = ""
+    while True:
+        data = await reader.read(10240)
+        if not data:
+            break
+        buffer += data.decode("utf-8", errors="replace")
+        lines = buffer.split("\r\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line:
+                on_line(line)
+        await asyncio.sleep(0.1)
+
+
+async def framed_reader(reader: asyncio.StreamReader, on_line) -> None:
+    """The read loop using LineFramer."""
+    framer = LineFramer()
+    while True:
+        data = await reader.read(10240)
+        if not data:
+            break
+        for raw_line in framer.feed(data):
+            on_line(raw_line.decode("utf-8", errors="replace"))
+
+
+async def measure_throughput(loop_fn, count: int) -> float:
+    """Drain `count` pre-buffered lines and return lines per second."""
+    reader = asyncio.StreamReader(limit=2 ** 30)
+    payload = b"".join(
+        SAMPLE_LINES[i % len(SAMPLE_LINES)] + b"\r\n" for i in range(count)
+    )
+    # Deliver in socket-sized chunks, as the transport would
+    for offset in range(0, len(payload), 4096):
+        reader.feed_data(payload[offset:offset + 4096])
+    reader.feed_eof()
+    
+    seen = 0
+    
+    def on_line(_line: str) -> None:
+        nonlocal seen
+        seen += 1
+    
+    start = time.perf_counter()
+    await loop_fn(reader, on_line)
+    elapsed = time.perf_counter() - start
+    assert seen == count, f"expected {count} lines, got {seen}"
+    return count / elapsed
+
+
+async def measure_latency(loop_fn, samples: int) -> list[float]:
+    """Feed lines one at a time and return per-line latency in ms."""
+    reader = asyncio.StreamReader()
+    sent_at: list[float] = []
+    latencies: list[float] = []
+    
+    def on_line(_line: str) -> None:
+        latencies.append((time.perf_counter() - sent_at[len(latencies)]) * 1000)
+    
+    consumer = asyncio.create_task(loop_fn(reader, on_line))
+    rng = random.Random(1)
+    for i in range(samples):
+        await asyncio.sleep(rng.uniform(0.005, 0.05))
+        sent_at.append(time.perf_counter())
+        reader.feed_data(SAMPLE_LINES[i % len(SAMPLE_LINES)] + b"\r\n")
+    reader.feed_eof()
+    await consumer
+    return latencies
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    print(f"{'reader':<10} {'lines/sec':>12} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, loop_fn in (("legacy", legacy_reader), ("framer", framed_reader)):
+        rate = await measure_throughput(loop_fn, args.lines)
+        latencies = await measure_latency(loop_fn, args.samples)
+        print(
+            f"{name:<10} {rate:>12,.0f} {statistics.median(latencies):>9.3f} "
+            f"{percentile(latencies, 99):>9.3f} {max(latencies):>9.3f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=200_000, help="lines for the throughput run")
+    parser.add_argument("--samples", type=int, default=100, help="lines for the latency run")
+    asyncio.run(main_async(parser.parse_args()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
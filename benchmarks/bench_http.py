@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: account lookups through HTTPClient against a local stand-in API.
+
+Runs !guc/!cauth-style account lookups against FakeWikiAPI and reports,
+per scenario, how many HTTP requests and connections they cost, the most
+connections open at once, and how long they took:
+
+    same_user      many concurrent lookups of one account (single-flight)
+    cached         the same lookups again, within the cache TTL
+    short_ttl      concurrent lookups of another account, cached briefly
+    expired        the same lookups once that TTL has run out
+    distinct       many different accounts at once, under the per-host limit
+    no_keepalive   the same, with the server closing every connection
+    chunked        the same, with chunked response bodies
+
+Each scenario also checks its expected behaviour: exactly one request
+for a single-flight or expired lookup and none for a cached one, no more
+connections than the scenario needs, never more than the per-host limit
+open or in flight at once, and summaries that match the API's data. The
+exit status is 1 if any check fails.
+
+Usage:
+    python benchmarks/bench_http.py [--lookups N] [--delay SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from avicbotirc import HTTPClient, account_info_url, summarize_account  # noqa: E402
+from fake_wiki_api import FakeWikiAPI  # noqa: E402
+
+PER_HOST = 4
+
+# Cache lifetime for the short_ttl and expired scenarios, in seconds
+SHORT_TTL = 0.2
+
+
+async def lookup(http: HTTPClient, api: str, username: str, ttl: float) -> str:
+    return summarize_account(await http.get_json(account_info_url(api, username), ttl=ttl))
+
+
+async def scenario(name: str, names: list[str], api: FakeWikiAPI, http: HTTPClient, requests_expected: int,
+                   connections_allowed: int, ttl: float = 300.0) -> list[str]:
+    """
+    Run one batch of lookups concurrently; returns failed checks.
+    
+    Args:
+        requests_expected: Exact number of HTTP requests the batch should cost
+        connections_allowed: Most new connections it may open
+        ttl: Cache lifetime passed to every lookup
+    """
+    requests, connections = api.requests, api.connections
+    # Earlier scenarios' clients keep their idle connections open
+    idle = api.open_connections
+    api.max_concurrent, api.max_open = 0, idle
+    started = time.perf_counter()
+    summaries = await asyncio.gather(*(lookup(http, api.url, username, ttl) for username in names))
+    elapsed = time.perf_counter() - started
+    requests, connections = api.requests - requests, api.connections - connections
+    most_open = api.max_open - idle
+    print(f"{name:<14} {len(names):>8} {requests:>9} {connections:>12} {most_open:>5} {elapsed * 1000:>9.1f}")
+    
+    failures = []
+    if requests != requests_expected:
+        failures.append(f"{name}: {requests} request(s), expected {requests_expected}")
+    if connections > connections_allowed:
+        failures.append(f"{name}: {connections} connection(s) opened, expected at most {connections_allowed}")
+    if most_open > PER_HOST:
+        failures.append(f"{name}: {most_open} connections open at once, limit {PER_HOST}")
+    if api.max_concurrent > PER_HOST:
+        failures.append(f"{name}: {api.max_concurrent} requests in flight, limit {PER_HOST}")
+    expected = {"Example": "12,345 edits; groups: global-rollbacker",
+                "Vandal": "3 edits; no global groups; locked; globally blocked"}
+    for username, summary in zip(names, summaries):
+        if username in expected and summary != expected[username]:
+            failures.append(f"{name}: {username} summarized as {summary!r}")
+    return failures
+
+
+async def run(lookups: int, delay: float) -> list[str]:
+    api = FakeWikiAPI(delay=delay)
+    await api.start()
+    clients = [HTTPClient(per_host=PER_HOST) for _ in range(5)]
+    distinct = ["Example", "Vandal"] + [f"User{index}" for index in range(lookups - 2)]
+    failures: list[str] = []
+    print(f"{'scenario':<14} {'lookups':>8} {'requests':>9} {'connections':>12} {'open':>5} {'ms':>9}")
+    try:
+        failures += await scenario("same_user", ["Example"] * lookups, api, clients[0], 1, 1)
+        failures += await scenario("cached", ["Example"] * lookups, api, clients[0], 0, 0)
+        failures += await scenario("short_ttl", ["Vandal"] * lookups, api, clients[1], 1, 1, SHORT_TTL)
+        await asyncio.sleep(SHORT_TTL * 1.5)
+        # The kept-alive connection is reused, so no new one is needed
+        failures += await scenario("expired", ["Vandal"] * lookups, api, clients[1], 1, 0, SHORT_TTL)
+        failures += await scenario("distinct", distinct, api, clients[2], len(distinct), PER_HOST)
+        api.requests_per_connection = 1
+        # One connection per request, but still never more than PER_HOST at once
+        failures += await scenario("no_keepalive", distinct, api, clients[3], len(distinct), len(distinct))
+        api.requests_per_connection, api.chunked = 0, True
+        failures += await scenario("chunked", distinct, api, clients[4], len(distinct), PER_HOST)
+    finally:
+        for http in clients:
+            await http.close()
+        await api.stop()
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lookups", type=int, default=200, help="lookups per scenario")
+    parser.add_argument("--delay", type=float, default=0.005, help="seconds the API takes per request")
+    args = parser.parse_args()
+    
+    failures = asyncio.run(run(max(args.lookups, 2), args.delay))
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
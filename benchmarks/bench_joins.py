@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: joining many channels against a server with a join throttle.
+
+Connects an IRCBot to a FakeIRCServer that disconnects clients joining
+faster than its throttle allows, and that refuses some channels (full,
+invite-only, banned, or keyed with the bot given a wrong key). Reports,
+per scenario, the JOIN lines sent, the longest of them, and the time from
+connecting to having joined every channel that can be joined:
+
+    unpaced     join pacing off: every channel at once (expected to be
+                disconnected for flooding once there are enough channels)
+    paced       join pacing under the server's throttle
+
+Each scenario also checks its expected behaviour (no line over 512 bytes,
+the keyed channel joined with its key, every refusal tracked with the
+right reason, no flood disconnect when paced); the exit status is 1 if
+any check fails.
+
+Usage:
+    python benchmarks/bench_joins.py [--channels N] [--server-rate N] [--server-burst N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import avicbotirc  # noqa: E402
+from avicbotirc import BotConfig, IRCBot  # noqa: E402
+from fake_ircd import FakeIRCServer  # noqa: E402
+
+# Channels the server refuses, and the reason the bot should record
+REFUSED = {"#full": ("471", "channel is full"), "#invite": ("473", "invite only"),
+           "#banned": ("474", "banned")}
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    """Poll predicate every 10 ms until it is true or timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return predicate()
+
+
+async def scenario(name: str, count: int, join_rate: float, join_burst: int,
+                   server_rate: float, server_burst: int) -> list[str]:
+    """Join count channels plus the special ones; returns failed checks."""
+    server = FakeIRCServer(join_rate=server_rate, join_burst=server_burst)
+    await server.start()
+    for channel, (numeric, _) in REFUSED.items():
+        server.refuse[channel] = numeric
+    server.channel_keys.update({"#keyed": "sesame", "#wrongkey": "sesame"})
+    
+    joins: list[str] = []
+    server.on_line = lambda _client, line: joins.append(line) if line.startswith("JOIN ") else None
+    channels = [f"#channel-{index:04d}" for index in range(count)]
+    channels += ["#keyed sesame", "#wrongkey guess", *REFUSED]
+    bot = IRCBot(BotConfig(server="127.0.0.1", port=server.port, channels=channels, seen_db="",
+                           notify_interval=0, send_rate=1000, send_burst=1000, reconnect_delay=60,
+                           join_rate=join_rate, join_burst=join_burst, join_retry_delay=60))
+    runner = asyncio.create_task(bot.run())
+    started = time.perf_counter()
+    
+    joinable = count + 1
+    expected_refusals = len(REFUSED) + 1
+    finished = await wait_until(
+        lambda: bot.reconnects > 0 or (len(bot.joiner.joined) >= joinable
+                                       and len(bot.joiner.failures) >= expected_refusals),
+        60,
+    )
+    elapsed = time.perf_counter() - started
+    flooded = bot.reconnects > 0
+    longest = max((len(line.encode("utf-8")) + 2 for line in joins), default=0)
+    print(f"{name:<10} {len(channels):>9} {len(joins):>6} {longest:>8} {len(bot.joiner.joined):>7} "
+          f"{len(bot.joiner.failures):>8} {'yes' if flooded else 'no':>8} {elapsed:>7.2f}")
+    
+    failures = []
+    if longest > avicbotirc.IRC_MAX_LINE:
+        failures.append(f"{name}: a JOIN line of {longest} bytes")
+    if join_rate and flooded:
+        failures.append(f"{name}: disconnected for join flooding")
+    if not flooded:
+        if not finished:
+            failures.append(f"{name}: {len(bot.joiner.joined)} of {joinable} channels joined in time")
+        if "#keyed" not in bot.joiner.joined:
+            failures.append(f"{name}: keyed channel not joined")
+        reasons = {channel: failure.reason for channel, failure in bot.joiner.failures.items()}
+        expected = {channel: reason for channel, (_, reason) in REFUSED.items()}
+        expected["#wrongkey"] = "wrong key"
+        if reasons != expected:
+            failures.append(f"{name}: refusals recorded as {reasons}")
+    
+    bot.stop()
+    await asyncio.wait_for(runner, 10)
+    await server.stop()
+    return failures
+
+
+async def run(args: argparse.Namespace) -> list[str]:
+    print(f"{'scenario':<10} {'channels':>9} {'lines':>6} {'longest':>8} {'joined':>7} "
+          f"{'refused':>8} {'flooded':>8} {'seconds':>7}")
+    failures = await scenario("unpaced", args.channels, 0, 1, args.server_rate, args.server_burst)
+    # Stay a little under the server's throttle, as one would configure it
+    failures += await scenario("paced", args.channels, args.server_rate * 0.8, args.server_burst,
+                               args.server_rate, args.server_burst)
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--channels", type=int, default=300, help="joinable channels besides the special ones")
+    parser.add_argument("--server-rate", type=float, default=100, help="channels per second the server allows")
+    parser.add_argument("--server-burst", type=int, default=50, help="channels the server allows at once")
+    args = parser.parse_args()
+    avicbotirc.logger.setLevel("ERROR")
+    
+    failures = asyncio.run(run(args))
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: language code lookups.
+
+Times every LanguageIndex query type over the full LANGUAGE_CODES table:
+exact code lookups, prefix queries, "did you mean" suggestions for
+misspelled codes, reverse name lookups and fuzzy name suggestions. Also
+times the complete handle_language_lookup() path for a multi-code query.
+All figures are per query; the target is well under a millisecond.
+
+Usage:
+    python benchmarks/bench_lang.py [--repeat N]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from avicbotirc import LANGUAGE_CODES, BotConfig, IRCBot, LanguageIndex  # noqa: E402
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """Apply one random edit (substitute, delete or insert) to word."""
+    pos = rng.randrange(len(word))
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    edit = rng.choice(("sub", "del", "ins")) if len(word) > 1 else "ins"
+    if edit == "sub":
+        return word[:pos] + letter + word[pos + 1:]
+    if edit == "del":
+        return word[:pos] + word[pos + 1:]
+    return word[:pos] + letter + word[pos:]
+
+
+def time_per_call(fn, inputs: list, repeat: int) -> tuple[float, float]:
+    """Return (mean, worst) microseconds per call over all inputs."""
+    best_total = float("inf")
+    worst = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            t0 = time.perf_counter()
+            fn(item)
+            worst = max(worst, time.perf_counter() - t0)
+        best_total = min(best_total, time.perf_counter() - start)
+    return best_total / len(inputs) * 1e6, worst * 1e6
+
+
+class _NullBot(IRCBot):
+    """IRCBot whose replies are discarded instead of sent."""
+    
+    async def send_message(self, target: str, message: str, priority: int = 1) -> None:
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions")
+    args = parser.parse_args()
+    
+    rng = random.Random(7)
+    start = time.perf_counter()
+    index = LanguageIndex(LANGUAGE_CODES)
+    build_ms = (time.perf_counter() - start) * 1000
+    
+    codes = list(LANGUAGE_CODES)
+    names = list(LANGUAGE_CODES.values())
+    typo_codes = [misspell(code, rng) for code in codes]
+    typo_names = [misspell(name.lower(), rng) for name in names]
+    prefixes = [code[:1] for code in codes]
+    
+    print(f"index over {len(index)} codes built in {build_ms:.2f} ms")
+    print(f"{'query':<26} {'mean us':>10} {'worst us':>10}")
+    cases = [
+        ("lookup (exact code)", index.lookup, codes),
+        ("with_prefix", index.with_prefix, prefixes),
+        ("suggest (typo code)", index.suggest, typo_codes),
+        ("code_for (exact name)", index.code_for, names),
+        ("suggest_names (typo)", index.suggest_names, typo_names),
+    ]
+    for label, fn, inputs in cases:
+        mean, worst = time_per_call(fn, inputs, args.repeat)
+        print(f"{label:<26} {mean:>10.1f} {worst:>10.1f}")
+    
+    bot = _NullBot(BotConfig())
+    queries = [" ".join(f"{c}?" for c in rng.sample(codes + typo_codes, 3)) for _ in range(500)]
+    loop = asyncio.new_event_loop()
+    mean, worst = time_per_call(
+        lambda q: loop.run_until_complete(bot.handle_language_lookup("#bench", q)), queries, args.repeat
+    )
+    loop.close()
+    print(f"{'!lang with 3 codes':<26} {mean:>10.1f} {worst:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: IRC message parsing.
+
+Compares the original per-line re.match parser against parse_line() over a
+corpus of realistic mixed traffic (chatter, joins/parts, numerics, PINGs,
+IRCv3-tagged lines). parse_line() is measured both unfiltered and with the
+bot's ROUTED_COMMANDS filter, which is how IRCBot.run calls it.
+
+Usage:
+    python benchmarks/bench_parser.py [--lines N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from avicbotirc import ROUTED_COMMANDS, parse_line  # noqa: E402
+
+# Relative weights roughly match a busy channel as seen by a bot
+CORPUS_TEMPLATES = [
+    (40, ":{nick}!~{nick}@user/{nick} PRIVMSG #wikipedia-en :{text}"),
+    (10, "@time=2026-01-15T12:00:00.000Z;account={nick} :{nick}!~{nick}@user/{nick} PRIVMSG #wikipedia-en :{text}"),
+    (5, ":{nick}!~{nick}@user/{nick} PRIVMSG #wikipedia-en :!lang de?"),
+    (10, ":{nick}!~{nick}@gateway/web/irccloud.com/x-{num} JOIN #wikipedia-en"),
+    (8, ":{nick}!~{nick}@user/{nick} PART #wikipedia-en :Leaving"),
+    (8, ":{nick}!~{nick}@user/{nick} QUIT :Ping timeout: 260 seconds"),
+    (4, ":{nick}!~{nick}@user/{nick} NICK {nick}_"),
+    (5, ":{nick}!~{nick}@user/{nick} MODE #wikipedia-en +v {nick}"),
+    (5, ":tantalum.libera.chat 353 AvicBot = #wikipedia-en :@ChanServ +{nick} {nick}2 {nick}3 {nick}4"),
+    (3, "PING :tantalum.libera.chat"),
+    (2, ":{nick}!~{nick}@user/{nick} NOTICE AvicBot :{text}"),
+]
+
+WORDS = "the quick brown fox jumps over lazy dog AvicBot hello wiki edit revert page".split()
+
+
+def build_corpus(count: int, seed: int = 42) -> list[str]:
+    """Generate a deterministic mixed-traffic corpus."""
+    rng = random.Random(seed)
+    weights = [w for w, _ in CORPUS_TEMPLATES]
+    templates = [t for _, t in CORPUS_TEMPLATES]
+    corpus = []
+    for _ in range(count):
+        template = rng.choices(templates, weights)[0]
+        corpus.append(template.format(
+            nick=f"user{rng.randrange(500)}",
+            num=rng.randrange(100000),
+            text=" ".join(rng.choices(WORDS, k=rng.randrange(3, 15))),
+        ))
+    return corpus
+
+
+def legacy_parse(raw_message: str):
+    """The parser as it was before parse_line."""
+    match = re.match(
+        r"^(?::(\S+?)(?:!|\s))?\s*(\S+)\s+(\S+)\s*(?::(.*))?$",
+        raw_message
+    )
+    if match:
+        return match.group(1) or "", match.group(2), match.group(3), match.group(4) or ""
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=10_000, help="corpus size")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions (best is reported)")
+    args = parser.parse_args()
+    
+    corpus = build_corpus(args.lines)
+    candidates = {
+        "legacy re.match": lambda: [legacy_parse(line) for line in corpus],
+        "parse_line": lambda: [parse_line(line) for line in corpus],
+        "parse_line (routed)": lambda: [parse_line(line, ROUTED_COMMANDS) for line in corpus],
+    }
+    
+    legacy_failures = sum(1 for line in corpus if legacy_parse(line) is None)
+    print(f"corpus: {len(corpus)} lines, legacy parser failed on {legacy_failures}")
+    print(f"{'parser':<22} {'ns/line':>10} {'lines/sec':>14}")
+    for name, fn in candidates.items():
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name:<22} {best / len(corpus) * 1e9:>10.0f} {len(corpus) / best:>14,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: reading lines over a real TCP connection.
+
+Compares the two transports IRCBot can use: asyncio.open_connection with
+a StreamLineReader (StreamReader plus LineFramer) and IRCProtocol, whose
+data_received() feeds the framer directly. A child process writes a large
+burst of channel traffic to a local socket, in chunks of varied size like
+a real server, while this process reads it with each transport; CPU time
+per line is measured with time.process_time(), so only the reading side
+is counted. If uvloop is installed, IRCProtocol is also measured on it.
+
+Usage:
+    python benchmarks/bench_transport.py [--lines N] [--repeat N]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from avicbotirc import IRCProtocol, StreamLineReader, uvloop  # noqa: E402
+from bench_framing import SAMPLE_LINES  # noqa: E402
+
+
+def serve(listener: socket.socket, payload: bytes, connections: int) -> None:
+    """Child process: send the payload to each connection, then close it."""
+    rng = random.Random(3)
+    for _ in range(connections):
+        conn, _ = listener.accept()
+        offset = 0
+        while offset < len(payload):
+            size = rng.randrange(64, 8192)
+            conn.sendall(payload[offset:offset + size])
+            offset += size
+        conn.close()
+
+
+async def read_streams(port: int) -> tuple[int, float]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines_reader = StreamLineReader(reader, buffer_size=4096)
+    count = 0
+    started = time.process_time()
+    while lines := await lines_reader.read_lines():
+        for line in lines:
+            line.decode("utf-8", errors="replace")
+        count += len(lines)
+    elapsed = time.process_time() - started
+    writer.close()
+    return count, elapsed
+
+
+async def read_protocol(port: int) -> tuple[int, float]:
+    _, protocol = await asyncio.get_running_loop().create_connection(IRCProtocol, "127.0.0.1", port)
+    count = 0
+    started = time.process_time()
+    while lines := await protocol.read_lines():
+        for line in lines:
+            line.decode("utf-8", errors="replace")
+        count += len(lines)
+    elapsed = time.process_time() - started
+    protocol.close()
+    return count, elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=1_000_000, help="lines per run")
+    parser.add_argument("--repeat", type=int, default=8, help="runs per transport (best is reported)")
+    args = parser.parse_args()
+    
+    payload = b"".join(SAMPLE_LINES[i % len(SAMPLE_LINES)] + b"\r\n" for i in range(args.lines))
+    candidates = [("streams", read_streams, None), ("protocol", read_protocol, None)]
+    if uvloop is not None:
+        candidates.append(("protocol+uvloop", read_protocol, uvloop.new_event_loop))
+    
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    server = multiprocessing.Process(
+        target=serve, args=(listener, payload, len(candidates) * args.repeat), daemon=True
+    )
+    server.start()
+    
+    print(f"{'transport':<16} {'ns CPU/line':>12} {'lines/CPU-sec':>14}")
+    for name, reader, loop_factory in candidates:
+        best = float("inf")
+        for _ in range(args.repeat):
+            loop = loop_factory() if loop_factory else asyncio.new_event_loop()
+            try:
+                count, elapsed = loop.run_until_complete(reader(port))
+            finally:
+                loop.close()
+            assert count == args.lines, f"expected {args.lines} lines, got {count}"
+            best = min(best, elapsed)
+        print(f"{name:<16} {best / args.lines * 1e9:>12.0f} {args.lines / best:>14,.0f}")
+    
+    server.join(10)
+    listener.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
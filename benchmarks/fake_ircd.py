@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+A minimal in-process IRC server for exercising IRCBot without a network.
+
+It speaks just enough of the protocol to drive the bot: registration
+(NICK/USER answered with 001-005 and a MOTD, 433 for a nick in use), CAP
+negotiation with SASL PLAIN against a table of accounts, PING/PONG, JOIN
+(echoed back, with a NAMES reply; keyed and refusing channels; a join
+flood limit), PART, NICK, QUIT and PRIVMSG relayed between clients in a
+channel, tagged with the sender's account for clients with account-tag. Tests and load generators inject traffic with
+FakeIRCServer.say() and can watch what clients send via the on_line hook.
+
+Usage (standalone, for poking at the bot by hand):
+    python benchmarks/fake_ircd.py [--port 6667]
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import sys
+import time
+from typing import Callable, Optional
+
+SERVER_NAME = "fake.irc"
+
+# RPL_ISUPPORT tokens sent during registration
+ISUPPORT = "CASEMAPPING=rfc1459 CHANTYPES=# NICKLEN=30 CHANNELLEN=50 PREFIX=(ov)@+ NETWORK=FakeNet"
+
+# Capabilities offered in answer to CAP LS
+CAPS = ("multi-prefix", "message-tags", "server-time", "away-notify", "account-tag", "sasl=PLAIN")
+
+
+class FakeClient:
+    """One connected client and its registration state."""
+    
+    def __init__(self, server: "FakeIRCServer", reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter) -> None:
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.nick = "*"
+        self.user = ""
+        self.registered = False
+        self.negotiating = False
+        self.caps: set[str] = set()
+        self.mechanism = ""
+        self.account = ""
+        self.join_tokens = 0.0
+        self.join_refilled = time.monotonic()
+        self.channels: set[str] = set()
+        self.lines_received = 0
+    
+    @property
+    def prefix(self) -> str:
+        return f"{self.nick}!~{self.user}@fake.host"
+    
+    def send(self, line: str) -> None:
+        self.writer.write(line.encode("utf-8") + b"\r\n")
+    
+    def send_from(self, account: str, line: str) -> None:
+        """Send a line from a user, with an account tag if we asked for them."""
+        if account and "account-tag" in self.caps:
+            line = f"@account={account} {line}"
+        self.send(line)
+    
+    def numeric(self, code: str, text: str) -> None:
+        self.send(f":{SERVER_NAME} {code} {self.nick} {text}")
+
+
+class FakeIRCServer:
+    """
+    In-process IRC server listening on 127.0.0.1.
+    
+    Example:
+        >>> server = FakeIRCServer()
+        >>> await server.start()
+        >>> config.server, config.port = "127.0.0.1", server.port
+        >>> server.say("#avicbot", "Someone", "!random")
+    
+    Attributes:
+        port: The TCP port the server listens on (after start())
+        caps: Capabilities offered to CAP LS; None answers CAP with 421,
+            as servers without capability negotiation do
+        accounts: SASL PLAIN account name to password
+        join_rate: Channels a client may join per second once join_burst
+            is spent; joining faster gets it disconnected for flooding,
+            as a server's join throttle would (0: no limit)
+        join_burst: Channels a client may join at once
+        channel_keys: Channel (lowercase) to the key it requires
+        refuse: Channel (lowercase) to the numeric refusing every JOIN
+            ("471", "473" or "474")
+        clients: Currently connected clients
+        channels: Channel name to member clients
+        on_line: Optional callback(client, line) for every line received
+    """
+    
+    def __init__(self, port: int = 0, caps: Optional[tuple[str, ...]] = CAPS,
+                 accounts: Optional[dict[str, str]] = None, join_rate: float = 0.0, join_burst: int = 0) -> None:
+        self.port = port
+        self.caps = caps
+        self.accounts = accounts or {}
+        self.join_rate = join_rate
+        self.join_burst = join_burst
+        self.channel_keys: dict[str, str] = {}
+        self.refuse: dict[str, str] = {}
+        self.clients: list[FakeClient] = []
+        self.channels: dict[str, set[FakeClient]] = {}
+        self.on_line: Optional[Callable[[FakeClient, str], None]] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+    
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+    
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for client in list(self.clients):
+                client.writer.close()
+            await self._server.wait_closed()
+    
+    def say(self, channel: str, nick: str, text: str, account: str = "") -> int:
+        """Deliver a PRIVMSG from a simulated user (logged in to account, if given) to every member of channel."""
+        line = f":{nick}!~{nick}@sim.host PRIVMSG {channel} :{text}"
+        members = self.channels.get(channel.lower(), ())
+        for client in members:
+            client.send_from(account, line)
+        return len(members)
+    
+    def broadcast(self, line: str) -> None:
+        """Send a raw line to every registered client."""
+        for client in self.clients:
+            if client.registered:
+                client.send(line)
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = FakeClient(self, reader, writer)
+        self.clients.append(client)
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                client.lines_received += 1
+                if self.on_line is not None:
+                    self.on_line(client, line)
+                if not self._process(client, line):
+                    break
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._part_all(client, "Connection closed")
+            self.clients.remove(client)
+            writer.close()
+    
+    def _process(self, client: FakeClient, line: str) -> bool:
+        """Handle one client line; returns False when the client quits."""
+        command, _, rest = line.partition(" ")
+        command = command.upper()
+        trailing = rest.split(" :", 1)[1] if " :" in rest else rest.lstrip(":")
+        params = rest.split(" :", 1)[0].split() if not rest.startswith(":") else []
+        
+        if command == "NICK" and params:
+            nick = params[0]
+            if any(other.nick.lower() == nick.lower() for other in self.clients if other is not client):
+                client.numeric("433", f"{nick} :Nickname is already in use")
+            elif client.registered:
+                line = f":{client.prefix} NICK {nick}"
+                client.send(line)
+                for member in {member for channel in client.channels for member in self.channels[channel]}:
+                    if member is not client:
+                        member.send(line)
+                client.nick = nick
+            else:
+                client.nick = nick
+                self._try_register(client)
+        elif command == "USER" and params:
+            client.user = params[0]
+            self._try_register(client)
+        elif command == "CAP":
+            self._cap(client, params, trailing)
+        elif command == "AUTHENTICATE" and params:
+            self._authenticate(client, params[0])
+        elif command == "PING":
+            client.send(f":{SERVER_NAME} PONG {SERVER_NAME} :{trailing}")
+        elif command == "JOIN" and params:
+            channels = params[0].split(",")
+            keys = params[1].split(",") if len(params) > 1 else []
+            if not self._join_allowed(client, len(channels)):
+                client.send(f"ERROR :Closing Link: {client.nick} (Excess Flood)")
+                return False
+            for channel, key in zip(channels, keys + [""] * (len(channels) - len(keys))):
+                refusal = self.refuse.get(channel.lower())
+                if refusal is None and self.channel_keys.get(channel.lower(), key) != key:
+                    refusal = "475"
+                if refusal is not None:
+                    reason = {"471": "Channel is full", "473": "Invite only channel",
+                              "474": "You are banned", "475": "Bad channel key"}[refusal]
+                    client.numeric(refusal, f"{channel} :Cannot join channel ({reason})")
+                    continue
+                members = self.channels.setdefault(channel.lower(), set())
+                members.add(client)
+                client.channels.add(channel.lower())
+                for member in members:
+                    member.send(f":{client.prefix} JOIN {channel}")
+                names = " ".join(member.nick for member in members)
+                client.numeric("353", f"= {channel} :{names}")
+                client.numeric("366", f"{channel} :End of /NAMES list.")
+        elif command == "PART" and params:
+            for channel in params[0].split(","):
+                self._leave(client, channel.lower(), f":{client.prefix} PART {channel}")
+        elif command in ("PRIVMSG", "NOTICE") and params:
+            target = params[0]
+            for member in self.channels.get(target.lower(), ()):
+                if member is not client:
+                    member.send_from(client.account, f":{client.prefix} {command} {target} :{trailing}")
+        elif command == "QUIT":
+            self._part_all(client, trailing)
+            return False
+        return True
+    
+    def _join_allowed(self, client: FakeClient, count: int) -> bool:
+        """Spend join tokens for count channels; False if the client is flooding."""
+        if not self.join_rate:
+            return True
+        now = time.monotonic()
+        client.join_tokens = min(float(self.join_burst),
+                                 client.join_tokens + (now - client.join_refilled) * self.join_rate)
+        client.join_refilled = now
+        client.join_tokens -= count
+        return client.join_tokens >= -1e-6
+    
+    def _try_register(self, client: FakeClient) -> None:
+        """Welcome a client once it has a nick and a user and has ended CAP negotiation."""
+        if client.registered or client.nick == "*" or not client.user or client.negotiating:
+            return
+        client.registered = True
+        client.join_tokens = float(self.join_burst)
+        client.numeric("001", f":Welcome to the fake network {client.prefix}")
+        client.numeric("002", f":Your host is {SERVER_NAME}, running fake-ircd")
+        client.numeric("003", ":This server was created just now")
+        client.numeric("004", f"{SERVER_NAME} fake-ircd iowx bklmnopstv")
+        client.numeric("005", f"{ISUPPORT} :are supported by this server")
+        client.numeric("375", f":- {SERVER_NAME} Message of the day -")
+        client.numeric("372", ":- This network is not real.")
+        client.numeric("376", ":End of /MOTD command.")
+    
+    def _cap(self, client: FakeClient, params: list[str], trailing: str) -> None:
+        if self.caps is None:
+            client.numeric("421", "CAP :Unknown command")
+            return
+        subcommand = params[0].upper() if params else ""
+        if subcommand == "LS":
+            client.negotiating = not client.registered
+            client.send(f":{SERVER_NAME} CAP {client.nick} LS :{' '.join(self.caps)}")
+        elif subcommand == "REQ":
+            offered = {cap.partition("=")[0] for cap in self.caps}
+            requested = trailing.split()
+            if set(requested) <= offered:
+                client.caps.update(requested)
+                client.send(f":{SERVER_NAME} CAP {client.nick} ACK :{trailing}")
+            else:
+                client.send(f":{SERVER_NAME} CAP {client.nick} NAK :{trailing}")
+        elif subcommand == "END":
+            client.negotiating = False
+            self._try_register(client)
+    
+    def _authenticate(self, client: FakeClient, data: str) -> None:
+        if "sasl" not in client.caps:
+            return
+        if not client.mechanism:
+            if data.upper() != "PLAIN":
+                client.numeric("908", "PLAIN :are available SASL mechanisms")
+                client.numeric("904", ":SASL authentication failed")
+                return
+            client.mechanism = data.upper()
+            client.send("AUTHENTICATE +")
+            return
+        client.mechanism = ""
+        try:
+            _, account, password = base64.b64decode(data, validate=True).decode("utf-8").split("\0")
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            account, password = "", None
+        if data == "*":
+            client.numeric("906", ":SASL authentication aborted")
+        elif self.accounts.get(account) == password:
+            client.account = account
+            client.numeric("900", f"{client.prefix} {account} :You are now logged in as {account}")
+            client.numeric("903", ":SASL authentication successful")
+        else:
+            client.numeric("904", ":SASL authentication failed")
+    
+    def _leave(self, client: FakeClient, channel: str, line: str) -> None:
+        members = self.channels.get(channel)
+        if not members or client not in members:
+            return
+        for member in members:
+            member.send(line)
+        members.discard(client)
+        client.channels.discard(channel)
+    
+    def _part_all(self, client: FakeClient, reason: str) -> None:
+        for channel in list(client.channels):
+            members = self.channels.get(channel, set())
+            members.discard(client)
+            for member in members:
+                member.send(f":{client.prefix} QUIT :{reason}")
+        client.channels.clear()
+
+
+async def _serve(port: int) -> None:
+    server = FakeIRCServer(port)
+    await server.start()
+    print(f"Fake IRC server listening on 127.0.0.1:{server.port}")
+    await asyncio.Event().wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=6667)
+    try:
+        asyncio.run(_serve(parser.parse_args().port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
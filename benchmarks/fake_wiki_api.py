@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+A minimal in-process stand-in for the MediaWiki API, for !guc and !cauth.
+
+It answers GET /w/api.php queries for meta=globaluserinfo and
+list=globalblocks from a small table of accounts, over HTTP/1.1 with
+keep-alive, and records what it saw: requests, connections, and the most
+connections open and requests being served at once. A per-request delay makes concurrency
+and single-flight behaviour visible, and responses can be sent chunked
+or with connections closed after a number of requests, as real servers do.
+
+Usage (standalone, for poking at the bot by hand):
+    python benchmarks/fake_wiki_api.py [--port 8080] [--delay 0.1]
+    AVICBOT_WIKI_API=http://127.0.0.1:8080/w/api.php python avicbotirc.py
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import urllib.parse
+from typing import Any, Optional
+
+# Accounts the server knows about; any other name is reported missing
+ACCOUNTS: dict[str, dict[str, Any]] = {
+    "Example": {"editcount": 12345, "groups": ["global-rollbacker"]},
+    "Steward": {"editcount": 250000, "groups": ["steward", "global-sysop"]},
+    "Vandal": {"editcount": 3, "groups": [], "locked": True, "blocked": True},
+}
+
+
+def answer(query: dict[str, str]) -> dict[str, Any]:
+    """The API response for one query string."""
+    if query.get("action") != "query":
+        return {"error": {"code": "badvalue", "info": "Unrecognized value for parameter \"action\"."}}
+    name = query.get("guiuser", "")
+    name = name[:1].upper() + name[1:]
+    account = ACCOUNTS.get(name)
+    result: dict[str, Any] = {"query": {}}
+    if account is None:
+        result["query"]["globaluserinfo"] = {"missing": True}
+    else:
+        info = {"home": "enwiki", "id": 1000 + len(name), "name": name,
+                "groups": account["groups"], "editcount": account["editcount"]}
+        if account.get("locked"):
+            info["locked"] = True
+        result["query"]["globaluserinfo"] = info
+    if "globalblocks" in query.get("list", ""):
+        blocked = account is not None and account.get("blocked")
+        result["query"]["globalblocks"] = [{"target": name, "expiry": "infinity"}] if blocked else []
+    return result
+
+
+class FakeWikiAPI:
+    """
+    In-process MediaWiki API stand-in listening on 127.0.0.1.
+    
+    Example:
+        >>> api = FakeWikiAPI(delay=0.05)
+        >>> await api.start()
+        >>> config.wiki_api = api.url
+    
+    Attributes:
+        delay: Seconds to wait before answering each request
+        chunked: Send bodies with chunked transfer encoding
+        requests_per_connection: Close a connection after this many
+            requests (0: keep it open)
+        requests: Requests answered
+        connections: Connections accepted
+        max_open: Most connections open at once
+        max_concurrent: Most requests being served at once
+    """
+    
+    def __init__(self, delay: float = 0.0, chunked: bool = False, requests_per_connection: int = 0) -> None:
+        self.delay = delay
+        self.chunked = chunked
+        self.requests_per_connection = requests_per_connection
+        self.requests = 0
+        self.connections = 0
+        self.max_open = 0
+        self.max_concurrent = 0
+        self.port = 0
+        self._concurrent = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set[asyncio.StreamWriter] = set()
+    
+    @property
+    def open_connections(self) -> int:
+        """Connections open right now."""
+        return len(self._writers)
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/w/api.php"
+    
+    async def start(self, port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        self.port = self._server.sockets[0].getsockname()[1]
+    
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in self._writers:
+            writer.close()
+        await asyncio.sleep(0)
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        self.max_open = max(self.max_open, len(self._writers))
+        served = 0
+        try:
+            while request := await reader.readline():
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # Headers
+                served += 1
+                closing = bool(self.requests_per_connection) and served >= self.requests_per_connection
+                await self._respond(request.decode("latin-1").split(), writer, closing)
+                if closing:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+    
+    async def _respond(self, request: list[str], writer: asyncio.StreamWriter, closing: bool) -> None:
+        self._concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self._concurrent)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            self.requests += 1
+            path = urllib.parse.urlsplit(request[1]) if len(request) >= 2 else None
+            if path is None or request[0] != "GET" or path.path != "/w/api.php":
+                status, body = "404 Not Found", b'{"error": {"code": "notfound", "info": "Not found"}}'
+            else:
+                query = dict(urllib.parse.parse_qsl(path.query))
+                status, body = "200 OK", json.dumps(answer(query)).encode("utf-8")
+            
+            head = f"HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+            if closing:
+                head += "Connection: close\r\n"
+            if self.chunked:
+                half = len(body) // 2
+                chunks = b"".join(f"{len(part):x}\r\n".encode() + part + b"\r\n"
+                                  for part in (body[:half], body[half:]) if part)
+                writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode("latin-1") + chunks + b"0\r\n\r\n")
+            else:
+                writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        finally:
+            self._concurrent -= 1
+
+
+async def serve_forever(port: int, delay: float) -> None:
+    api = FakeWikiAPI(delay=delay)
+    await api.start(port)
+    print(f"Fake MediaWiki API on {api.url}")
+    await asyncio.Event().wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each response")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve_forever(args.port, args.delay))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
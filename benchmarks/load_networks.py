@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Load test: many networks and channels in one process.
+
+Runs an IRCBot per network on a single event loop via run_networks(), joins
+every bot to many channels, then drives command traffic through all of them
+at once. The FakeIRCServers run in a child process so that the memory
+figures cover the bots alone. Reports memory per connection and per
+channel (tracemalloc, Python heap) and checks that every command got its
+reply.
+
+The bots' send rate limit is raised, and join pacing and command rate
+limits are turned off, for the test so that the measurement is of the
+bot, not of the flood protection.
+
+Usage:
+    python benchmarks/load_networks.py [--networks N] [--channels N]
+                                       [--messages N] [--rate N]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import avicbotirc  # noqa: E402
+from avicbotirc import BotConfig, run_networks  # noqa: E402
+from fake_ircd import FakeIRCServer  # noqa: E402
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    """Poll predicate every 10 ms until it is true or timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return predicate()
+
+
+async def _serve(networks: int, conn) -> None:
+    """Child process: run the fake servers and obey commands from the parent."""
+    servers = [FakeIRCServer() for _ in range(networks)]
+    for server in servers:
+        await server.start()
+    replies = 0
+    
+    def on_line(_client, line: str) -> None:
+        nonlocal replies
+        if line.startswith("PRIVMSG #") and line.endswith(":7."):
+            replies += 1
+    
+    for server in servers:
+        server.on_line = on_line
+    conn.send([server.port for server in servers])
+    
+    loop = asyncio.get_running_loop()
+    while True:
+        command, *params = await loop.run_in_executor(None, conn.recv)
+        if command == "wait_joined":
+            total, = params
+            ok = await wait_until(
+                lambda: sum(len(c.channels) for s in servers for c in s.clients) >= total, 60
+            )
+            conn.send(ok)
+        elif command == "traffic":
+            messages, rate, channels = params
+            started = time.perf_counter()
+            for i in range(messages):
+                servers[i % networks].say(channels[(i // networks) % len(channels)], f"user{i % 97}", "!random")
+                if i % 100 == 99:
+                    await asyncio.sleep(max(0.0, started + (i + 1) / rate - time.perf_counter()))
+            await wait_until(lambda: replies >= messages, 60)
+            conn.send((replies, time.perf_counter() - started))
+        elif command == "die":
+            for server in servers:
+                server.say("#load0", "Avicennasis", "!die AvicBot", account="Avicennasis")
+            conn.send(True)
+        elif command == "stop":
+            for server in servers:
+                await server.stop()
+            conn.send(True)
+            return
+
+
+def serve(networks: int, conn) -> None:
+    asyncio.run(_serve(networks, conn))
+
+
+async def ask(conn, *message):
+    """Send a command to the server process and wait for its answer."""
+    conn.send(message)
+    return await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+
+
+async def main_async(args: argparse.Namespace, conn) -> int:
+    ports = await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+    channels = [f"#load{i}" for i in range(args.channels)]
+    configs = [
+        BotConfig.from_dict({
+            "name": f"net{index}",
+            "server": "127.0.0.1",
+            "port": port,
+            "channels": channels,
+            "send_rate": 100_000.0,
+            "send_burst": 100_000,
+            "join_rate": 0,
+            "nick_rate_limit": 0,
+            "host_rate_limit": 0,
+            "channel_rate_limit": 0,
+        })
+        for index, port in enumerate(ports)
+    ]
+    
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    runner = asyncio.create_task(run_networks(configs))
+    
+    total_channels = args.networks * args.channels
+    if not await ask(conn, "wait_joined", total_channels):
+        print("not every channel was joined in time")
+        return 1
+    join_time = time.perf_counter() - started
+    heap = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    
+    replies, traffic_time = await ask(conn, "traffic", args.messages, args.rate, channels)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    await ask(conn, "die")
+    await asyncio.wait_for(runner, 30)
+    await ask(conn, "stop")
+    
+    print(f"networks:             {args.networks}")
+    print(f"channels total:       {total_channels}")
+    print(f"all joined after:     {join_time:.2f} s")
+    print(f"heap per connection:  {heap / args.networks / 1024:.1f} KiB")
+    print(f"heap per channel:     {heap / total_channels:.0f} B")
+    print(f"commands answered:    {replies}/{args.messages} in {traffic_time:.2f} s "
+          f"({replies / traffic_time:,.0f}/s)")
+    print(f"traced heap now/peak: {current / 1024:.0f} / {peak / 1024:.0f} KiB")
+    print(f"max RSS growth:       {(rss_after - rss_before) / 1024:.1f} MiB")
+    print(f"commands registered:  {len(avicbotirc.COMMANDS)} (one shared registry)")
+    return 0 if replies >= args.messages else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--networks", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=100, help="channels per network")
+    parser.add_argument("--messages", type=int, default=5000, help="commands to send in total")
+    parser.add_argument("--rate", type=float, default=2000, help="commands per second")
+    args = parser.parse_args()
+    avicbotirc.logger.setLevel("WARNING")
+    
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(target=serve, args=(args.networks, child_conn), daemon=True)
+    server_process.start()
+    try:
+        return asyncio.run(main_async(args, parent_conn))
+    finally:
+        server_process.join(5)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Traffic-replay load test: end-to-end latency, throughput and memory.
+
+Starts a FakeIRCServer in this process and the bot as a separate process
+(`python avicbotirc.py`, configured through environment variables), so the
+bot is measured exactly as it is deployed and any version of it can be
+pointed at with --bot. Channel traffic is either synthetic (chatter mixed
+with commands) or replayed from a capture file, and latency probes
+("!say lt<n>") are mixed into it; the time from a probe being delivered to
+its echo arriving back at the server is the end-to-end command latency.
+
+The run has two phases:
+
+1. Ramp: traffic is offered at each rate in --rates for --step seconds.
+   A rate is sustained if every probe was answered and the p99 latency
+   stayed under --slo-ms; the highest such rate is reported as the
+   maximum sustained lines/sec. The ramp stops at the first failing rate.
+2. Soak: traffic at --soak-rate for --soak seconds while the bot's RSS is
+   sampled, giving the memory growth over a long run.
+
+The report is printed and, with --report, written as JSON; --compare
+prints the differences against an earlier report (for example one taken
+on the previous release).
+
+Capture files hold one IRC line per line, optionally preceded by a
+timestamp (as in "1700000000.25 :nick!u@h PRIVMSG #chan :text"). Only
+PRIVMSG lines are replayed; their channels are mapped onto the test
+channels, and the file is looped as often as needed.
+
+Usage:
+    python benchmarks/load_test.py [--bot PATH] [--channels N]
+                                   [--rates 500,1000,2000] [--step SECONDS]
+                                   [--soak SECONDS] [--soak-rate N]
+                                   [--replay FILE] [--report FILE]
+                                   [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator, Optional
+
+from fake_ircd import FakeClient, FakeIRCServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BOT = os.path.join(HERE, "..", "avicbotirc.py")
+
+BOT_NICK = "LoadBot"
+MASTER_NICK = "LoadMaster"
+PROBE_PREFIX = "lt"
+
+# Synthetic traffic: mostly chatter the bot ignores, plus some commands
+CHATTER = [
+    "hello everyone",
+    "has anyone seen the new deployment?",
+    "brb, coffee",
+    "the build is green again",
+    "what time is the meeting?",
+    "LoadBot: hi there",
+]
+COMMANDS = ["!lang en", "!lang de fr es", "!langname German", "!random", "!guc Example", "!lang xx?"]
+
+
+# =============================================================================
+# TRAFFIC SOURCES
+# =============================================================================
+
+def synthetic_traffic(channels: list[str], command_ratio: float,
+                      seed: int = 1) -> Iterator[tuple[str, str, str]]:
+    """Yield endless (channel, nick, text) of chatter mixed with commands."""
+    rng = random.Random(seed)
+    while True:
+        nick = f"user{rng.randrange(500)}"
+        text = rng.choice(COMMANDS) if rng.random() < command_ratio else rng.choice(CHATTER)
+        yield rng.choice(channels), nick, text
+
+
+def load_capture(path: str) -> list[tuple[str, str, str]]:
+    """Read (nick, channel, text) for every PRIVMSG line in a capture file."""
+    events = []
+    with open(path, encoding="utf-8", errors="replace") as capture:
+        for line in capture:
+            line = line.rstrip("\r\n")
+            if line and not line.startswith(":"):
+                # Drop a leading timestamp
+                line = line.partition(" ")[2]
+            prefix, _, rest = line.partition(" ")
+            command, _, rest = rest.partition(" ")
+            if command != "PRIVMSG" or " :" not in rest:
+                continue
+            channel, _, text = rest.partition(" :")
+            if channel.startswith("#"):
+                events.append((prefix[1:].split("!")[0], channel, text))
+    return events
+
+
+def replay_traffic(events: list[tuple[str, str, str]],
+                   channels: list[str]) -> Iterator[tuple[str, str, str]]:
+    """Yield (channel, nick, text) from a capture forever.
+    
+    Each captured channel is mapped to one test channel, so conversations
+    stay together and busy channels stay busy.
+    """
+    mapping: dict[str, str] = {}
+    for nick, channel, text in itertools.cycle(events):
+        target = mapping.setdefault(channel.lower(), channels[len(mapping) % len(channels)])
+        yield target, nick, text
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """Resident set size of a process in bytes (Linux only, else None)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def bot_version(bot: str) -> str:
+    """Describe the checkout the bot script lives in, for the report."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(bot)),
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+class LoadGenerator:
+    """
+    Drives traffic into a FakeIRCServer and matches probe replies.
+    
+    Attributes:
+        server: The fake server the bot is connected to
+        channels: Channels the traffic is spread over
+        probe_every: One line in this many is a latency probe
+        sent: Lines delivered so far
+        probes: Latency probes delivered so far
+    """
+    
+    def __init__(self, server: FakeIRCServer, channels: list[str],
+                 traffic: Iterator[tuple[str, str, str]], probe_every: int) -> None:
+        self.server = server
+        self.channels = channels
+        self.traffic = traffic
+        self.probe_every = probe_every
+        self.sent = 0
+        self.probes = 0
+        self._outstanding: dict[str, float] = {}
+        self._latencies: list[float] = []
+        server.on_line = self._on_line
+    
+    def _on_line(self, _client: FakeClient, line: str) -> None:
+        # Probe echoes look like "PRIVMSG #chan :lt123"
+        if not line.startswith("PRIVMSG #"):
+            return
+        text = line.partition(" :")[2]
+        sent_at = self._outstanding.pop(text, None)
+        if sent_at is not None:
+            self._latencies.append(time.perf_counter() - sent_at)
+    
+    def _send_one(self) -> None:
+        if self.sent % self.probe_every == 0:
+            token = f"{PROBE_PREFIX}{self.probes}"
+            self.probes += 1
+            self._outstanding[token] = time.perf_counter()
+            self.server.say(self.channels[self.probes % len(self.channels)], "prober", f"!say {token}")
+        else:
+            self.server.say(*next(self.traffic))
+        self.sent += 1
+    
+    async def run(self, rate: float, duration: float, on_tick=None) -> dict:
+        """
+        Offer traffic at rate lines/sec for duration seconds.
+        
+        Returns:
+            Lines sent, achieved rate, probes sent and answered, and
+            latency percentiles in milliseconds
+        """
+        self._outstanding.clear()
+        self._latencies = []
+        probes_before = self.probes
+        sent_before = self.sent
+        started = time.perf_counter()
+        
+        while (elapsed := time.perf_counter() - started) < duration:
+            due = int(elapsed * rate) - (self.sent - sent_before)
+            for _ in range(due):
+                self._send_one()
+            if on_tick is not None:
+                on_tick(elapsed)
+            await asyncio.sleep(0.005)
+        sent_time = time.perf_counter() - started
+        
+        # Give the tail of the probes a moment to come back
+        deadline = time.perf_counter() + 5
+        while self._outstanding and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        
+        latencies = self._latencies
+        return {
+            "rate": rate,
+            "sent": self.sent - sent_before,
+            "achieved_rate": round((self.sent - sent_before) / sent_time, 1),
+            "probes": self.probes - probes_before,
+            "answered": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+        }
+
+
+# =============================================================================
+# BOT PROCESS
+# =============================================================================
+
+def start_bot(bot: str, port: int, channels: list[str]) -> subprocess.Popen:
+    """Launch the bot script against the fake server."""
+    env = dict(os.environ)
+    env.update({
+        "AVICBOT_NICK": BOT_NICK,
+        "AVICBOT_SERVER": "127.0.0.1",
+        "AVICBOT_PORT": str(port),
+        "AVICBOT_CHANNELS": ",".join(channels),
+        "AVICBOT_MASTER": MASTER_NICK,
+        # Measure the bot, not its flood protection
+        "AVICBOT_SEND_RATE": "1000000",
+        "AVICBOT_SEND_BURST": "1000000",
+        "AVICBOT_NICK_RATE_LIMIT": "0",
+        "AVICBOT_HOST_RATE_LIMIT": "0",
+        "AVICBOT_CHANNEL_RATE_LIMIT": "0",
+        "AVICBOT_COALESCE_WINDOW": "0",
+        "AVICBOT_JOIN_RATE": "0",
+        "AVICBOT_SEEN_DB": os.path.join(tempfile.gettempdir(), "avicbot_load_test_seen.db"),
+    })
+    return subprocess.Popen(
+        [sys.executable, bot], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    """Poll predicate every 10 ms until it is true or timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return predicate()
+
+
+async def stop_bot(server: FakeIRCServer, process: subprocess.Popen, channel: str) -> None:
+    """Ask the bot to quit with !die, killing it if it does not."""
+    server.say(channel, MASTER_NICK, f"!die {BOT_NICK}", account=MASTER_NICK)
+    if not await wait_until(lambda: process.poll() is not None, 15):
+        process.kill()
+        process.wait()
+
+
+# =============================================================================
+# REPORT
+# =============================================================================
+
+def print_report(report: dict) -> None:
+    print(f"bot version:          {report['version']}")
+    print(f"channels:             {report['channels']}")
+    print("ramp:")
+    print("    rate  achieved  answered      p50      p90      p99      max")
+    for step in report["ramp"]:
+        print(f"  {step['rate']:>6.0f}  {step['achieved_rate']:>8.0f}  "
+              f"{step['answered']:>4}/{step['probes']:<4}"
+              f"{step['p50_ms']:>8.2f} {step['p90_ms']:>8.2f} {step['p99_ms']:>8.2f} {step['max_ms']:>8.2f} ms")
+    print(f"max sustained rate:   {report['max_sustained_rate']:.0f} lines/s "
+          f"(p99 < {report['slo_ms']:.0f} ms)")
+    soak = report.get("soak")
+    if soak:
+        print(f"soak:                 {soak['duration']:.0f} s at {soak['rate']:.0f} lines/s, "
+              f"p99 {soak['p99_ms']:.2f} ms")
+        if soak["rss_start"] is not None:
+            print(f"RSS start/end:        {soak['rss_start'] / 2**20:.1f} / {soak['rss_end'] / 2**20:.1f} MiB "
+                  f"({soak['rss_growth_per_hour'] / 2**20:+.1f} MiB/h)")
+
+
+def compare_reports(old: dict, new: dict) -> None:
+    """Print how the headline numbers moved between two reports."""
+    def delta(label: str, before: Optional[float], after: Optional[float], unit: str) -> None:
+        if before is None or after is None:
+            return
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {label:<22} {before:>10.2f} -> {after:>10.2f} {unit:<8} {change}")
+    
+    print(f"compared with {old['version']}:")
+    delta("max sustained rate", old["max_sustained_rate"], new["max_sustained_rate"], "lines/s")
+    old_steps = {step["rate"]: step for step in old["ramp"]}
+    for step in new["ramp"]:
+        if step["rate"] in old_steps:
+            delta(f"p99 @ {step['rate']:.0f}/s", old_steps[step["rate"]]["p99_ms"], step["p99_ms"], "ms")
+    if old.get("soak") and new.get("soak"):
+        delta("RSS growth", old["soak"]["rss_growth_per_hour"] / 2**20,
+              new["soak"]["rss_growth_per_hour"] / 2**20, "MiB/h")
+
+
+def growth_per_hour(samples: list[tuple[float, int]]) -> float:
+    """Least-squares slope of RSS over time, in bytes per hour."""
+    if len(samples) < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in samples) / len(samples)
+    mean_r = sum(r for _, r in samples) / len(samples)
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not variance:
+        return 0.0
+    slope = sum((t - mean_t) * (r - mean_r) for t, r in samples) / variance
+    return slope * 3600
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+async def run(args: argparse.Namespace) -> dict:
+    channels = [f"#load{i}" for i in range(args.channels)]
+    if args.replay:
+        events = load_capture(args.replay)
+        if not events:
+            raise SystemExit(f"{args.replay}: no PRIVMSG lines to replay")
+        traffic = replay_traffic(events, channels)
+    else:
+        traffic = synthetic_traffic(channels, args.command_ratio)
+    
+    server = FakeIRCServer()
+    await server.start()
+    process = start_bot(args.bot, server.port, channels)
+    try:
+        joined = await wait_until(
+            lambda: any(len(client.channels) >= len(channels) for client in server.clients), 60
+        )
+        if not joined:
+            raise SystemExit("the bot did not join every channel within 60 s")
+        
+        generator = LoadGenerator(server, channels, traffic, args.probe_every)
+        report: dict = {
+            "version": args.label or bot_version(args.bot),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "channels": len(channels),
+            "source": args.replay or f"synthetic ({args.command_ratio:.0%} commands)",
+            "slo_ms": args.slo_ms,
+            "ramp": [],
+            "max_sustained_rate": 0.0,
+        }
+        
+        for rate in args.rates:
+            step = await generator.run(rate, args.step)
+            report["ramp"].append(step)
+            sustained = step["answered"] == step["probes"] and step["p99_ms"] < args.slo_ms
+            if not sustained:
+                break
+            report["max_sustained_rate"] = step["achieved_rate"]
+        
+        if args.soak > 0:
+            samples: list[tuple[float, int]] = []
+            last_sample = -1.0
+            
+            def sample(elapsed: float) -> None:
+                nonlocal last_sample
+                if elapsed - last_sample >= 1.0:
+                    rss = read_rss(process.pid)
+                    if rss is not None:
+                        samples.append((elapsed, rss))
+                    last_sample = elapsed
+            
+            soak = await generator.run(args.soak_rate, args.soak, on_tick=sample)
+            report["soak"] = {
+                "duration": args.soak,
+                "rate": args.soak_rate,
+                "p99_ms": soak["p99_ms"],
+                "answered": soak["answered"],
+                "probes": soak["probes"],
+                "rss_start": samples[0][1] if samples else None,
+                "rss_end": samples[-1][1] if samples else None,
+                "rss_growth_per_hour": growth_per_hour(samples),
+            }
+        
+        await stop_bot(server, process, channels[0])
+        return report
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        await server.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bot", default=DEFAULT_BOT, help="bot script to run (default: this checkout)")
+    parser.add_argument("--label", help="version label for the report (default: git describe)")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--rates", default="250,500,1000,2000,4000,8000",
+                        help="comma-separated offered rates in lines/sec for the ramp")
+    parser.add_argument("--step", type=float, default=5.0, help="seconds per ramp step")
+    parser.add_argument("--slo-ms", type=float, default=250.0, help="p99 latency a sustained rate must meet")
+    parser.add_argument("--soak", type=float, default=60.0, help="soak duration in seconds (0 to skip)")
+    parser.add_argument("--soak-rate", type=float, default=500.0)
+    parser.add_argument("--probe-every", type=int, default=20, help="one line in N is a latency probe")
+    parser.add_argument("--command-ratio", type=float, default=0.2,
+                        help="share of synthetic lines that are commands")
+    parser.add_argument("--replay", help="capture file of IRC lines to replay instead of synthetic traffic")
+    parser.add_argument("--report", help="write the report as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+    args.rates = [float(rate) for rate in args.rates.split(",")]
+    
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous:
+            compare_reports(json.load(previous), report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+            out.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the bot's hot functions, with regression checks.
+
+Each case times one function over a fixed, seeded corpus:
+
+    parse_message    IRCBot.parse_message() over mixed channel traffic
+    mention_match    IRCBot.handle_message() over chatter, some of it
+                     mentioning the bot (the conversational triggers)
+    trigger_rules    The same chatter against 5,000 word and 2,000 phrase
+                     trigger rules
+    command_dispatch IRCBot.handle_command() over a mix of commands
+    language_lookup  IRCBot.handle_language_lookup() over !lang queries
+    send_encode      IRCBot.send_raw() plus the send queue's batch encode
+                     and write, into a writer that discards the bytes
+
+Replies go into a real SendQueue whose writer throws the bytes away, so the
+cases include the cost of queueing their output. Every case reports the
+best of --repeat runs in nanoseconds per operation.
+
+Results can be saved as a JSON baseline and later checked against it; the
+check fails (exit status 1) if any case got slower than the baseline by
+more than --threshold percent. Baselines are specific to the machine and
+Python version they were taken on.
+
+Usage:
+    python benchmarks/microbench.py [--repeat N] [--only CASE ...]
+    python benchmarks/microbench.py --save benchmarks/baseline.json
+    python benchmarks/microbench.py --check benchmarks/baseline.json [--threshold 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Awaitable, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import avicbotirc  # noqa: E402
+from avicbotirc import (  # noqa: E402
+    CONVERSATIONAL_REPLIES, LANGUAGE_CODES, BotConfig, IRCBot, SendQueue, TriggerEngine, TriggerRule,
+)
+from bench_parser import WORDS, build_corpus  # noqa: E402
+
+NICK = "AvicBot"
+
+
+class NullWriter:
+    """StreamWriter stand-in that counts and discards written bytes."""
+    
+    def __init__(self) -> None:
+        self.bytes_written = 0
+    
+    def write(self, data: bytes) -> None:
+        self.bytes_written += len(data)
+    
+    async def drain(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        pass
+
+
+def make_bot() -> IRCBot:
+    """An IRCBot wired to a discarding send queue, with metrics off.
+    
+    Rate limits and coalescing are left on, but loose enough that no
+    command in a corpus is dropped: the cases pay for the checks without
+    skipping the work.
+    """
+    bot = IRCBot(BotConfig(nick=NICK, master="Owner", metrics_port=0,
+                           nick_rate_limit=10**9, host_rate_limit=10**9, channel_rate_limit=10**9,
+                           coalesce_window=1e-9))
+    bot.writer = NullWriter()
+    bot.send_queue = SendQueue(bot.writer, rate=1e9, burst=10**9)
+    bot.send_queue.start()
+    return bot
+
+
+# =============================================================================
+# CORPORA
+# =============================================================================
+
+def chatter_corpus(count: int, seed: int = 7) -> list[str]:
+    """Channel chatter; about a third of it mentions the bot."""
+    rng = random.Random(seed)
+    greetings = sorted(CONVERSATIONAL_REPLIES)
+    corpus = []
+    for _ in range(count):
+        text = " ".join(rng.choices(WORDS, k=rng.randrange(3, 12)))
+        roll = rng.random()
+        if roll < 0.15:
+            text = f"{rng.choice(greetings)} {NICK}"
+        elif roll < 0.30:
+            text = f"{NICK}: {rng.choice(greetings)}!"
+        corpus.append(text)
+    return corpus
+
+
+def command_corpus(count: int, seed: int = 11) -> list[str]:
+    """A mix of valid, invalid and unknown commands."""
+    rng = random.Random(seed)
+    templates = [
+        "!random", "!lang en", "!lang de fr es", "!say hello there", "!guc Example",
+        "!cauth Example", "!link wiki/Main_Page", "!langname German", "!sing",
+        "!nosuchcommand", "!die SomeoneElse", "!lang",
+    ]
+    return [rng.choice(templates) for _ in range(count)]
+
+
+def lookup_corpus(count: int, seed: int = 13) -> list[str]:
+    """!lang arguments: exact codes, prefixes, misses and multi-code queries."""
+    rng = random.Random(seed)
+    codes = sorted(LANGUAGE_CODES)
+    corpus = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.5:
+            corpus.append(rng.choice(codes))
+        elif roll < 0.7:
+            corpus.append(rng.choice(codes)[:1] + "?")
+        elif roll < 0.85:
+            corpus.append(rng.choice(["xq", "zzz", "qx", "enn"]))
+        else:
+            corpus.append(" ".join(rng.sample(codes, 3)))
+    return corpus
+
+
+def reply_corpus(count: int, seed: int = 17) -> list[str]:
+    """Outbound PRIVMSG lines of typical reply lengths, some non-ASCII."""
+    rng = random.Random(seed)
+    extras = ["", "", "", " – Deutsch", " 日本語", " Ελληνικά"]
+    return [
+        f"PRIVMSG #channel{rng.randrange(20)} :"
+        + " ".join(rng.choices(WORDS, k=rng.randrange(3, 30))) + rng.choice(extras)
+        for _ in range(count)
+    ]
+
+
+# =============================================================================
+# CASES
+# =============================================================================
+
+async def case_parse_message(bot: IRCBot, count: int) -> tuple[int, Callable[[], Awaitable[None]]]:
+    corpus = build_corpus(count)
+    
+    async def run() -> None:
+        parse = bot.parse_message
+        for line in corpus:
+            parse(line)
+    return len(corpus), run
+
+
+async def case_mention_match(bot: IRCBot, count: int) -> tuple[int, Callable[[], Awaitable[None]]]:
+    corpus = chatter_corpus(count)
+    
+    async def run() -> None:
+        for text in corpus:
+            await bot.handle_message("someone", "#channel", text)
+        await bot.send_queue.flush()
+    return len(corpus), run
+
+
+async def case_trigger_rules(bot: IRCBot, count: int) -> tuple[int, Callable[[], Awaitable[None]]]:
+    rng = random.Random(19)
+    words = [f"{rng.choice(WORDS)}{index}" for index in range(5_000)]
+    rules = [TriggerRule("word", word, f"reply {word}") for word in words]
+    rules += [TriggerRule("phrase", f"{rng.choice(words)} {{nick}}", "phrase reply") for _ in range(2_000)]
+    bot.triggers = TriggerEngine(rules + bot.triggers.rules)
+    return await case_mention_match(bot, count)
+
+
+async def case_command_dispatch(bot: IRCBot, count: int) -> tuple[int, Callable[[], Awaitable[None]]]:
+    corpus = command_corpus(count)
+    
+    async def run() -> None:
+        for text in corpus:
+            await bot.handle_command("someone", "#channel", text)
+        await bot.send_queue.flush()
+    return len(corpus), run
+
+
+async def case_language_lookup(bot: IRCBot, count: int) -> tuple[int, Callable[[], Awaitable[None]]]:
+    corpus = lookup_corpus(count)
+    
+    async def run() -> None:
+        for query in corpus:
+            await bot.handle_language_lookup("#channel", query)
+        await bot.send_queue.flush()
+    return len(corpus), run
+
+
+async def case_send_encode(bot: IRCBot, count: int) -> tuple[int, Callable[[], Awaitable[None]]]:
+    corpus = reply_corpus(count)
+    
+    async def run() -> None:
+        for line in corpus:
+            await bot.send_raw(line)
+        await bot.send_queue.flush()
+    return len(corpus), run
+
+
+CASES = {
+    "parse_message": (case_parse_message, 20_000),
+    "mention_match": (case_mention_match, 10_000),
+    "trigger_rules": (case_trigger_rules, 10_000),
+    "command_dispatch": (case_command_dispatch, 5_000),
+    "language_lookup": (case_language_lookup, 5_000),
+    "send_encode": (case_send_encode, 20_000),
+}
+
+
+async def run_cases(names: list[str], repeat: int) -> dict[str, dict]:
+    """Time each named case; returns name -> {ns_per_op, ops}."""
+    results = {}
+    for name in names:
+        setup, count = CASES[name]
+        bot = make_bot()
+        ops, run = await setup(bot, count)
+        await run()  # warm-up
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await run()
+            best = min(best, time.perf_counter() - started)
+        await bot.send_queue.close(0)
+        results[name] = {"ns_per_op": round(best / ops * 1e9, 1), "ops": ops}
+    return results
+
+
+# =============================================================================
+# BASELINES
+# =============================================================================
+
+def check(results: dict[str, dict], baseline: dict, threshold: float) -> list[str]:
+    """Names of cases that are more than threshold percent slower."""
+    regressed = []
+    print(f"{'case':<18} {'baseline':>10} {'now':>10} {'change':>9}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<18} {'-':>10} {result['ns_per_op']:>10.1f}       new")
+            continue
+        change = (result["ns_per_op"] - before["ns_per_op"]) / before["ns_per_op"] * 100
+        flag = "  REGRESSED" if change > threshold else ""
+        print(f"{name:<18} {before['ns_per_op']:>10.1f} {result['ns_per_op']:>10.1f} {change:>+8.1f}%{flag}")
+        if change > threshold:
+            regressed.append(name)
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=7, help="timing repetitions (best is reported)")
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="run only these cases")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--check", metavar="FILE", help="compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent slowdown that counts as a regression (default 10)")
+    args = parser.parse_args()
+    avicbotirc.logger.setLevel("WARNING")
+    
+    results = asyncio.run(run_cases(args.only or list(CASES), args.repeat))
+    
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressed = check(results, baseline, args.threshold)
+        if regressed:
+            print(f"regressed by more than {args.threshold:g}%: {', '.join(regressed)}")
+    else:
+        regressed = []
+        print(f"{'case':<18} {'ns/op':>10} {'ops/sec':>14}")
+        for name, result in results.items():
+            print(f"{name:<18} {result['ns_per_op']:>10.1f} {1e9 / result['ns_per_op']:>14,.0f}")
+    
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
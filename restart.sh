@@ -1,6 +1,16 @@
 #!/bin/bash
+#
+# Redeploy the bot on Toolforge.
+#
+# Crash recovery no longer needs this script: the bot reconnects on its own,
+# and when started with --workers N the built-in supervisor restarts any
+# worker process that dies within seconds. Changes to commands, replies,
+# language codes and most config options can be loaded without a restart
+# by sending the bot SIGHUP (or saying !reload), and a single-process bot
+# can move to new code without disconnecting with SIGUSR2 (or !upgrade).
+# Use this only for anything else, e.g. with ~/irc/avicbotirc.sh running:
+#     python3 avicbotirc.py --config networks.json --workers 2
 
 qdel avicbotirc
 sleep 60
 jstart -mem 500m ~/irc/avicbotirc.sh
-